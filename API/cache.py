@@ -0,0 +1,154 @@
+"""
+Copyright (C) 2023 Probesys
+
+
+The cache of the documents generated by the API
+"""
+
+__all__ = (
+    'ResultCache',
+)
+
+import hashlib
+import json
+import os
+import threading
+from time import time
+from typing import Union
+from urllib import request
+
+from lotemplate.utils import get_file_hash, is_network_based
+
+
+class ResultCache:
+    """
+    Keeps the generated documents on the disk, by the hash of everything they are made of : the content of the
+    template, the variables, the export formats and the watermark. Image variables are part of the key through
+    the content of the image, not its path or url.
+
+    Entries expire after ttl seconds, and the least recently used ones are removed once the cache is bigger than
+    max_size bytes. Every entry is a single file written aside then renamed, so the cache can be shared by all
+    the workers of the server.
+    """
+
+    def __repr__(self):
+        return f"<ResultCache object :'cache_dir'={self.cache_dir!r}, 'max_size'={self.max_size!r}, 'ttl'={self.ttl!r}>"
+
+    def __init__(self, cache_dir: str, max_size: int = 256 * 1024 * 1024, ttl: float = 3600):
+        """
+        :param cache_dir: the directory holding the cached documents
+        :param max_size: the maximum size of the cache in bytes
+        :param ttl: the time in seconds a document is kept
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.ttl = ttl
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def image_hash(path: str) -> str:
+        """
+        :param path: the path or the url of an image
+        :return: the hash of the content of the image
+        """
+        if is_network_based(path):
+            with request.urlopen(path) as f:
+                return hashlib.md5(f.read()).hexdigest()
+        return get_file_hash(path)
+
+    @staticmethod
+    def canonical_variables(variables: dict) -> dict:
+        """
+        :param variables: the variables of a fill request
+        :return: the variables, the values of the images being replaced by the hash of their content
+        """
+        return {
+            name: dict(details, value=ResultCache.image_hash(details['value']))
+            if details.get('type') == 'image' and details.get('value') else details
+            for name, details in variables.items()
+        }
+
+    def key(self, template: str, json_data: dict) -> Union[str, None]:
+        """
+        :param template: the path of the template
+        :param json_data: the fill request, checked by check_fill_json
+        :return: the key of the document generated by the request, or None if an image can't be read : the fill
+        reports the error
+        """
+        try:
+            variables = self.canonical_variables(json_data['variables'])
+        except Exception:
+            return None
+        formats = json_data.get('formats')
+        key_data = {
+            'template': get_file_hash(template),
+            'variables': variables,
+            # with several formats, the name of the documents in the zip archive comes from the name
+            'name': json_data['name'] if formats else json_data['name'].split('.')[-1],
+            'formats': formats,
+            'page_break': bool(json_data.get('page_break', False)),
+            'watermark': json_data.get('watermark', {}),
+        }
+        return hashlib.sha256(
+            json.dumps(key_data, sort_keys=True, ensure_ascii=False, separators=(',', ':')).encode()
+        ).hexdigest()
+
+    def get(self, key: str) -> Union[bytes, None]:
+        """
+        :param key: the key of the document
+        :return: the content of the cached document, or None if it isn't cached or has expired
+        """
+        path = f"{self.cache_dir}/{key}"
+        try:
+            if os.path.getmtime(path) + self.ttl < time():
+                os.remove(path)
+                return None
+            with open(path, 'rb') as f:
+                data = f.read()
+            # the access time orders the eviction, the modification time the expiration
+            os.utime(path, (time(), os.path.getmtime(path)))
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """
+        Caches a document, and removes the expired and least recently used documents if needed
+
+        :param key: the key of the document
+        :param data: the content of the document
+        :return: None
+        """
+        if len(data) > self.max_size:
+            return
+        path = f"{self.cache_dir}/{key}"
+        tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self) -> None:
+        entries = []
+        size = 0
+        now = time()
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.tmp'):
+                continue
+            try:
+                stat = entry.stat()
+                if stat.st_mtime + self.ttl < now:
+                    os.remove(entry.path)
+                    continue
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, entry.path))
+            size += stat.st_size
+        for atime, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
@@ -0,0 +1,280 @@
+"""
+Copyright (C) 2023 Probesys
+
+
+The asynchronous fill jobs of the API
+"""
+
+__all__ = (
+    'JobStore',
+)
+
+import fcntl
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+from time import time, sleep, monotonic
+from typing import Union
+
+
+class JobStore:
+    """
+    Keeps the fill jobs on the disk, so any worker of the server can answer about any job.
+
+    Each job is a directory holding the request, the status and, once done, the result. A queued job is also a
+    file in the queue directory, named after its submission time : a runner claims the oldest one by moving it to
+    the running directory, which only one runner can do. A runner keeps its running file locked, so the job of a
+    dead worker is detected and marked as failed.
+    At most max_running jobs run at the same time on the whole server, so jobs never take all the soffice
+    processes from the interactive requests.
+    """
+
+    def __repr__(self):
+        return (
+            f"<JobStore object :'jobs_dir'={self.jobs_dir!r}, 'max_queue'={self.max_queue!r}, "
+            f"'max_running'={self.max_running!r}, 'ttl'={self.ttl!r}>"
+        )
+
+    def __init__(self, jobs_dir: str, max_queue: int = 100, max_running: int = 1, ttl: float = 3600,
+                 poll_interval: float = 0.2, clean_interval: float = 60):
+        """
+        :param jobs_dir: the directory holding the jobs, shared by all the workers
+        :param max_queue: the maximum number of queued jobs. 0 means no limit
+        :param max_running: the maximum number of jobs running at the same time on the server
+        :param ttl: the time in seconds a finished job and its result are kept
+        :param poll_interval: the time in seconds between two looks at the queue of an idle runner
+        :param clean_interval: the time in seconds between two removals of the expired jobs
+        """
+        self.jobs_dir = jobs_dir
+        self.max_queue = max_queue
+        self.max_running = max_running
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.clean_interval = clean_interval
+        self.queue_dir = jobs_dir + '/queue'
+        self.running_dir = jobs_dir + '/running'
+        self.runners_dir = jobs_dir + '/runners'
+        for directory in (self.queue_dir, self.running_dir, self.runners_dir):
+            os.makedirs(directory, exist_ok=True)
+        self.pid = None
+
+    def job_dir(self, job_id: str) -> Union[str, None]:
+        """
+        :param job_id: the id of the job, as given by the client
+        :return: the directory of the job, or None if the id is not a valid job id
+        """
+        if not re.fullmatch('[0-9a-f]{32}', job_id):
+            return None
+        return f"{self.jobs_dir}/{job_id}"
+
+    def write_status(self, job_id: str, status: dict) -> None:
+        # written aside then renamed, so a reader never gets a partial status
+        path = f"{self.job_dir(job_id)}/status.json"
+        tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}"
+        with open(tmp_path, 'w') as f:
+            json.dump(status, f)
+        os.replace(tmp_path, path)
+
+    def status(self, job_id: str) -> Union[dict, None]:
+        """
+        :param job_id: the id of the job
+        :return: the status of the job, or None if there is no such job
+        """
+        job_dir = self.job_dir(job_id)
+        if not job_dir:
+            return None
+        try:
+            with open(f"{job_dir}/status.json") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def result(self, job_id: str) -> Union[str, None]:
+        """
+        :param job_id: the id of the job
+        :return: the path of the document generated by the job, or None if the job is not done
+        """
+        status = self.status(job_id)
+        if not status or status['status'] != 'done':
+            return None
+        return f"{self.job_dir(job_id)}/result"
+
+    def queue_depth(self) -> int:
+        return len(os.listdir(self.queue_dir))
+
+    def submit(self, directory: str, file: str, json_data, name: str) -> Union[dict, None]:
+        """
+        Queues a new fill job
+
+        :param directory: the directory of the template
+        :param file: the template to fill
+        :param json_data: the json to fill the template with
+        :param name: the name of the generated document
+        :return: the status of the new job, or None if the queue is full
+        """
+        if self.max_queue and self.queue_depth() >= self.max_queue:
+            return None
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.job_dir(job_id))
+        with open(f"{self.job_dir(job_id)}/request.json", 'w') as f:
+            json.dump({'directory': directory, 'file': file, 'json': json_data}, f)
+        status = {
+            'id': job_id,
+            'status': 'queued',
+            'directory': directory,
+            'file': file,
+            'name': name,
+            'created': time(),
+            'started': None,
+            'finished': None,
+            'phases': {},
+            'error': None,
+        }
+        self.write_status(job_id, status)
+        open(f"{self.queue_dir}/{time():.6f}-{job_id}", 'w').close()
+        return status
+
+    def claim(self) -> Union[str, None]:
+        """
+        Takes the oldest queued job
+
+        :return: the id of the job, or None if the queue is empty
+        """
+        for name in sorted(os.listdir(self.queue_dir)):
+            job_id = name.split('-')[-1]
+            try:
+                os.rename(f"{self.queue_dir}/{name}", f"{self.running_dir}/{job_id}")
+            except FileNotFoundError:
+                # claimed by an other runner
+                continue
+            return job_id
+        return None
+
+    def execute(self, job_id: str, fill, error_format) -> None:
+        """
+        Runs a claimed job, and stores its result or its error
+
+        :param job_id: the id of the job
+        :param fill: the function filling the template, called with the directory, the file, the json and the dict
+        of the phase timings to complete, returning the content of the document
+        :param error_format: the function formatting the error of a failed job
+        :return: None
+        """
+        running_file = f"{self.running_dir}/{job_id}"
+        running_fd = os.open(running_file, os.O_RDWR)
+        fcntl.flock(running_fd, fcntl.LOCK_EX)
+        try:
+            status = self.status(job_id)
+            if not status:
+                return
+            with open(f"{self.job_dir(job_id)}/request.json") as f:
+                request = json.load(f)
+            status.update(status='running', started=time())
+            status['phases']['queued'] = round(status['started'] - status['created'], 3)
+            self.write_status(job_id, status)
+            try:
+                data = fill(request['directory'], request['file'], request['json'], status['phases'])
+                with open(f"{self.job_dir(job_id)}/result", 'wb') as f:
+                    f.write(data)
+                status.update(status='done', size=len(data))
+            except Exception as e:
+                status.update(status='failed', error=error_format(e))
+            status['finished'] = time()
+            self.write_status(job_id, status)
+        finally:
+            os.remove(running_file)
+            fcntl.flock(running_fd, fcntl.LOCK_UN)
+            os.close(running_fd)
+
+    def clean(self) -> None:
+        """
+        Removes the jobs finished for longer than the ttl, and marks as failed the jobs of the dead runners
+
+        :return: None
+        """
+        for job_id in os.listdir(self.running_dir):
+            try:
+                fd = os.open(f"{self.running_dir}/{job_id}", os.O_RDWR)
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # still running
+                os.close(fd)
+                continue
+            status = self.status(job_id)
+            # a queued job has just been claimed, its runner is about to lock it
+            if not status or status['status'] != 'queued':
+                if status and status['status'] == 'running':
+                    status.update(status='failed', finished=time(), error={
+                        'error': 'ApiError', 'code': 'job_interrupted',
+                        'message': "The worker running the job has been stopped", 'variables': {}})
+                    self.write_status(job_id, status)
+                try:
+                    os.remove(f"{self.running_dir}/{job_id}")
+                except FileNotFoundError:
+                    pass
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        now = time()
+        for job_id in os.listdir(self.jobs_dir):
+            status = self.status(job_id)
+            if status and status['finished'] and status['finished'] + self.ttl < now:
+                shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+
+    def _lock_runner_slot(self) -> Union[int, None]:
+        for slot in range(self.max_running):
+            fd = os.open(f"{self.runners_dir}/{slot}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            return fd
+        return None
+
+    def run(self, fill, error_format) -> None:
+        """
+        The loop of a runner : waits for a free runner slot, then runs the queued jobs one after the other
+
+        :param fill: the function filling the template, see execute
+        :param error_format: the function formatting the error of a failed job
+        :return: None
+        """
+        last_clean = 0
+        while True:
+            job_id = None
+            try:
+                if monotonic() - last_clean > self.clean_interval:
+                    self.clean()
+                    last_clean = monotonic()
+                slot_fd = self._lock_runner_slot()
+                if slot_fd is not None:
+                    try:
+                        job_id = self.claim()
+                        if job_id:
+                            self.execute(job_id, fill, error_format)
+                    finally:
+                        fcntl.flock(slot_fd, fcntl.LOCK_UN)
+                        os.close(slot_fd)
+            except Exception as e:
+                print(f"##### job runner error : {e!r} #####")
+            if not job_id:
+                sleep(self.poll_interval)
+
+    def start(self, fill, error_format) -> 'JobStore':
+        """
+        Starts the runner of the current worker, once per process : must be called after the fork of the workers
+
+        :param fill: the function filling the template, see execute
+        :param error_format: the function formatting the error of a failed job
+        :return: the job store itself
+        """
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            threading.Thread(target=self.run, args=(fill, error_format), daemon=True).start()
+        return self
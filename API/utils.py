@@ -5,10 +5,19 @@ Copyright (C) 2023 Probesys
 from flask import Response, send_file, current_app
 
 import lotemplate as ot
+from lotemplate.utils import get_hash_index, set_hash_index
+from .jobs import JobStore
+from .cache import ResultCache
 
 import glob
+import io
+import json as jsonlib
 import os
 import sys
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from time import monotonic
 from typing import Union
 
 host='localhost'
@@ -16,26 +25,74 @@ port='200'
 gworkers=0
 scannedjson=''
 maxtime=60
-def start_soffice(workers,jsondir,maxt=60):
+my_pool=None
+my_broker=None
+my_supervisor=None
+my_jobs=None
+my_cache=None
+# the names used by the routes of the api, that can't be the name of a directory
+reserved_directories = ('stats', 'clean_lo', 'jobs')
+def start_soffice(workers,jsondir,maxt=60,max_queue=0,lease_timeout=60,wait_all=True,recycle=None,document_pool=None,jobs=None,result_cache=None):
     global gworkers
     global my_lo
+    global my_pool
+    global my_broker
+    global my_jobs
+    global my_cache
     global scannedjson
     global maxtime
+    global my_supervisor
     maxtime=maxt
     scannedjson=jsondir
     gworkers=workers
     os.makedirs("uploads", exist_ok=True)
     os.makedirs("exports", exist_ok=True)
     os.makedirs(scannedjson, exist_ok=True)
+    # the content hashes of the templates name their cached scans, they are kept next to them
+    set_hash_index(ot.HashIndex(scannedjson + '/hashes.sqlite'))
     clean_temp_files()
-    my_lo=ot.start_multi_office(nb_env=workers)
+    # the runners are started in each worker, by start_jobs
+    my_jobs=JobStore(**(jobs or {'jobs_dir': 'jobs'}))
+    if result_cache:
+        my_cache=ResultCache(**result_cache)
+    my_lo=ot.start_multi_office(nb_env=workers,wait_ready=False)
+    my_pool=ot.ConnexionPool(my_lo,document_pool)
+    my_broker=ot.OfficeBroker(my_lo,max_queue=max_queue,timeout=lease_timeout)
+    # no lease is given on a process before it accepts connexions
+    for office in my_lo:
+        my_broker.set_available(office,False)
+    ot.wait_offices_ready(my_lo,on_ready=lambda office: my_broker.set_available(office,True),wait_all=wait_all)
+    my_supervisor=ot.OfficeSupervisor(my_lo,my_broker,**(recycle or {})).start()
+
+
+def start_jobs():
+    """
+    starts the job runner of the current worker, must be called after the fork of the workers
+    """
+    global my_jobs
+    my_jobs.start(fill_document, error_format)
 
 
+@contextmanager
 def connexion():
-   global my_lo
-   cnx= ot.randomConnexion(my_lo)
-
-   return cnx
+   """
+   lease a soffice process from the broker shared by all the workers, and a connexion to it from the pool
+   of the worker, to use in a with block
+
+   :return: the leased connexion
+   """
+   global my_pool
+   global my_broker
+   with my_broker.lease() as office:
+       host, port, lodir = office
+       with my_pool.lease(host, port) as cnx:
+           try:
+               yield cnx
+           finally:
+               if not cnx.is_alive():
+                   # the supervisor checks the process and restarts it if needed
+                   my_pool.discard(host, port)
+                   my_broker.report_failure(office)
 
 def clean_temp_files():
     """
@@ -68,6 +125,7 @@ def delete_file(directory: str, name: str) -> None:
         os.remove(f"uploads/{directory}/{name}")
     except FileNotFoundError:
         pass
+    get_hash_index().forget(f"uploads/{directory}/{name}")
     try:
         os.remove(f"uploads/{directory}/.~lock.{name}#")
     except FileNotFoundError:
@@ -112,6 +170,40 @@ def error_sim(exception: str, code: str, message: str, variables=dict({})) -> di
     return {'error': exception, 'code': code, 'message': message, 'variables': variables}
 
 
+@contextmanager
+def scanned_template(path: str):
+    """
+    opens a template for its scanned variables, leasing a soffice process only if its variables aren't cached and
+    its file can't be read without soffice, to use in a with block
+
+    :param path: the path of the template
+    :return: the template, scanned
+    """
+    cached = (ot.Template.read_cached_variables(scannedjson, path) is not None
+              and ot.Template.read_cached_layout(scannedjson, path) is not None)
+    if cached or ot.WriterScanner.supports(path) or ot.CalcScanner.supports(path):
+        with ot.TemplateFromExt(path, None, True, scannedjson) as temp:
+            yield temp
+    else:
+        with connexion() as cnx, ot.TemplateFromExt(path, cnx, True, scannedjson) as temp:
+            yield temp
+
+
+def scan_template(path: str) -> dict:
+    """
+    scans a template, leasing a soffice process only if its variables aren't cached and its file can't be read
+    without soffice
+
+    :param path: the path of the template
+    :return: the variables of the template
+    """
+    variables = ot.Template.read_cached_variables(scannedjson, path)
+    if variables is not None:
+        return variables
+    with scanned_template(path) as temp:
+        return temp.variables
+
+
 def save_file(directory: str, f, name: str, error_caught=False) -> Union[tuple[dict, int], dict]:
     """
     upload a template file, and scan it.
@@ -136,19 +228,17 @@ def save_file(directory: str, f, name: str, error_caught=False) -> Union[tuple[d
         i += 1
     f.stream.seek(0)
     f.save(f"uploads/{directory}/{name}")
+    get_hash_index().update(f"uploads/{directory}/{name}")
 
 
-    cnx = connexion()
-    global scannedjson
     try:
-        with ot.TemplateFromExt(f"uploads/{directory}/{name}", cnx, True,scannedjson) as temp:
-            values = temp.variables
+        values = scan_template(f"uploads/{directory}/{name}")
     except ot.errors.TemplateError as e:
         delete_file(directory, name)
         return error_format(e), 415
     except Exception as e:
         delete_file(directory, name)
-        return error_format(e), 500
+        return error_format(e), error_status(e)
     return {'file': name, 'message': "Successfully uploaded", 'variables': values}
 
 
@@ -161,14 +251,131 @@ def scan_file(directory: str, file: str, error_caught=False) -> Union[tuple[dict
     :param error_caught: specify if an error was already caught
     :return: a json and optionally an int which represent the status code to return
     """
-    cnx = connexion()
-    global scannedjson
-    with ot.TemplateFromExt(f"uploads/{directory}/{file}", cnx, True,scannedjson) as temp:
-            variables = temp.variables
+    variables = scan_template(f"uploads/{directory}/{file}")
     return {'file': file, 'message': "Successfully scanned", 'variables': variables}
 
 
-def fill_file(directory: str, file: str, json, error_caught=False) -> Union[tuple[dict, int], dict, tuple[str,Response]]:
+def check_fill_json(json) -> Union[dict, None]:
+    """
+    checks the syntax of a fill request
+
+    :param json: the json to fill the document with
+    :return: the error to return if the json is invalid, None otherwise
+    """
+    if (
+            type(json) is not dict
+            or type(json.get("name")) is not str
+            or type(json.get("variables")) is not dict
+            or not (json.get("formats") is None or type(json["formats"]) is list
+                    and all(type(file_type) is str and file_type for file_type in json["formats"]))
+    ):
+        return error_sim(
+            "JsonSyntaxError",
+            'api_invalid_instance_syntax',
+            "Each instance of the array in the json should be an object containing only 'name' - "
+            "a non-empty string, 'variables' - a non-empty object, optionally, 'page_break' - "
+            "a boolean, 'watermark' a json array and 'formats' - an array of export formats.")
+    return None
+
+
+def result_name(json) -> str:
+    """
+    :param json: a fill request, checked by check_fill_json
+    :return: the name of the returned file : the name of the document, or of a zip archive if several formats
+    are asked
+    """
+    if json.get("formats"):
+        return (json["name"].rpartition('.')[0] or json["name"]) + '.zip'
+    return json["name"]
+
+
+def zip_documents(documents: dict[str, bytes]) -> bytes:
+    """
+    :param documents: the contents of the documents, by name
+    :return: the content of a zip archive holding the documents
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in documents.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def error_status(exception: Exception) -> int:
+    """
+    :param exception: an exception raised while filling a template
+    :return: the status code to return : 415 for the errors due to the template or the json, 503 when no soffice
+    process is available, 500 otherwise
+    """
+    if isinstance(exception, ot.errors.OfficeBusyError):
+        return 503
+    if isinstance(exception, ot.errors.LotemplateError) and not isinstance(exception, ot.errors.UnoException):
+        return 415
+    return 500
+
+
+def fill_document(directory: str, file: str, json, phases: dict = None) -> bytes:
+    """
+    fill the specified file with a json already checked by check_fill_json, and export it in memory
+
+    :param directory: the directory where the file is
+    :param file: the file to fill
+    :param json: the json to fill the document with
+    :param phases: a dict receiving the time in seconds spent in each phase
+    :return: the content of the filled document
+    """
+    global scannedjson
+    global my_cache
+    phases = {} if phases is None else phases
+    start = monotonic()
+
+    def end_phase(phase):
+        nonlocal start
+        phases[phase] = round(monotonic() - start, 3)
+        start = monotonic()
+
+    # a repeated request is answered from the cache, without any soffice process
+    key = my_cache.key(f"uploads/{directory}/{file}", json) if my_cache else None
+    if key:
+        data = my_cache.get(key)
+        end_phase('cache')
+        if data is not None:
+            return data
+
+    def fill(cnx):
+        with ot.TemplateFromExt(f"uploads/{directory}/{file}", cnx, True,scannedjson) as temp:
+            end_phase('open')
+            json_variables = ot.convert_to_datas_template(json["variables"])
+            temp.search_error(json_variables)
+            if cnx is not None:
+                temp.fill(json["variables"])
+            elif not temp.fill_without_office(json["variables"]):
+                return None
+            if json.get('page_break', False):
+                temp.page_break()
+            end_phase('fill')
+            data = temp.export_stream(json["name"], json.get("watermark",{}), json.get("formats"))
+            end_phase('export')
+            return data
+
+    # the odt documents of the templates holding only text variables and statements are filled without soffice
+    data = None
+    formats = json.get("formats") or [json["name"].split(".")[-1]]
+    if (all(file_type == 'odt' for file_type in formats) and not json.get('page_break', False)
+            and ot.WriterScanner.supports(f"uploads/{directory}/{file}")):
+        data = fill(None)
+    if data is None:
+        with connexion() as cnx:
+            end_phase('lease')
+            data = fill(cnx)
+    # the document is filled once, and exported in each format
+    data = zip_documents(data) if json.get("formats") else data
+    if key:
+        my_cache.put(key, data)
+    return data
+
+
+def fill_file(directory: str, file: str, json, error_caught=False) -> Union[tuple[dict, int], dict, Response]:
     """
     fill the specified file
 
@@ -176,48 +383,200 @@ def fill_file(directory: str, file: str, json, error_caught=False) -> Union[tupl
     :param file: the file to fill
     :param json: the json to fill the document with
     :param error_caught: specify if an error was already caught
-    :return: a json and optionally an int which represent the status code to return
+    :return: the filled document, exported in memory, or a json and an int which represent the status code to return
     """
     if  isinstance(json, list):
         json=json[0]
         current_app.logger.warning("DEPRECATED Using a list of dict is DEPRECATED, you must directly send the dict. See documentation.")
-    cnx = connexion()
-    global scannedjson
+    error = check_fill_json(json)
+    if error:
+        return error, 415
     try:
-        with ot.TemplateFromExt(f"uploads/{directory}/{file}", cnx, True,scannedjson) as temp:
+        data = fill_document(directory, file, json)
+    except Exception as e:
+        return error_format(e), error_status(e)
+    # the soffice process is released before the document is sent
+    return send_file(io.BytesIO(data), download_name=result_name(json))
 
-            length = len(json)
-            is_name_present = type(json.get("name")) is str
-            is_variables_present = type(json.get("variables")) is dict
-            is_page_break_present = type(json.get("page_break")) is bool
-            is_watermark_present = type(json.get("watermark")) is dict
-            if (
-                    not is_name_present
-                    or not is_variables_present
-            ):
-                return 415, error_sim(
-                    "JsonSyntaxError",
-                    'api_invalid_instance_syntax',
-                    "Each instance of the array in the json should be an object containing only 'name' - "
-                    "a non-empty string, 'variables' - a non-empty object, optionally, 'page_break' - "
-                    "a boolean and 'watermark' a json array.")
 
-            try:
-                json_variables = ot.convert_to_datas_template(json["variables"])
-                temp.search_error(json_variables)
-                temp.fill(json["variables"])
-                if json.get('page_break', False):
-                    temp.page_break()
-                watermark=json.get("watermark",{})
-                export_file=temp.export(json["name"],"exports",False,watermark)
-                export_name=json["name"]
-            except Exception as e:
-                if 'export_name' in locals():
-                    return ( export_file,error_format(e))
-                else:
-                    return ( "nofile",error_format(e))
-            return (export_file,send_file(export_file, export_name))
+def merge_file(directory: str, file: str, json) -> Union[tuple[dict, int], Response]:
+    """
+    fill the specified file once for each set of variables, in a single document
 
+    :param directory: the directory where the file is
+    :param file: the file to fill
+    :param json: an object containing the name of the document (key 'name'), the list of the variables of each
+    instance (key 'variables') and optionally the watermark (key 'watermark')
+    :return: the merged document, or a json and an int which represent the status code to return
+    """
+    global scannedjson
+    if (
+            type(json) is not dict
+            or type(json.get("name")) is not str
+            or type(json.get("variables")) is not list
+            or not json["variables"]
+            or any(type(variables) is not dict for variables in json["variables"])
+    ):
+        return error_sim(
+            "JsonSyntaxError",
+            'api_invalid_merge_syntax',
+            "The json should be an object containing 'name' - a non-empty string, 'variables' - a non-empty array "
+            "of objects, one for each instance, and optionally 'watermark' a json array."), 415
+    try:
+        with connexion() as cnx, ot.TemplateFromExt(f"uploads/{directory}/{file}", cnx, True,scannedjson) as temp:
+            if not isinstance(temp, ot.WriterTemplate):
+                return error_sim(
+                    'ApiError', 'merge_unsupported', f"the file {file!r} is not a text document, it can't be merged",
+                    {'file': file}), 415
+            for index, variables in enumerate(json["variables"]):
+                try:
+                    temp.search_error(ot.convert_to_datas_template(variables))
+                except Exception as e:
+                    error = error_format(e)
+                    error['variables'] = dict(error['variables'], index=index)
+                    return error, error_status(e)
+            temp.merge(json["variables"])
+            data = temp.export_stream(json["name"], json.get("watermark",{}))
     except Exception as e:
-            return error_format(e), 500
+        return error_format(e), error_status(e)
+    return send_file(io.BytesIO(data), download_name=json["name"])
+
+
+def submit_job(directory: str, file: str, json) -> Union[tuple[dict, int], dict]:
+    """
+    queue a job filling the specified file
+
+    :param directory: the directory where the file is
+    :param file: the file to fill
+    :param json: the json to fill the document with
+    :return: the status of the job and the status code to return
+    """
+    global my_jobs
+    error = check_fill_json(json)
+    if error:
+        return error, 415
+    status = my_jobs.submit(directory, file, json, result_name(json))
+    if not status:
+        max_queue = my_jobs.max_queue
+        return error_sim(
+            'ApiError', 'job_queue_full', f"{max_queue} jobs are already waiting. Please retry later.",
+            {'max_queue': max_queue}), 503
+    return status, 202
+
+
+class ZipStream(io.RawIOBase):
+    """
+    An unseekable file keeping what is written until it is taken, for zipfile to stream an archive
+    """
 
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        return len(b)
+
+    def take(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def unique_name(name: str, names: set) -> str:
+    """
+    :param name: the name of a file to add in an archive
+    :param names: the names already in the archive, updated
+    :return: the name, numbered if already in the archive
+    """
+    base, dot, file_type = name.rpartition('.')
+    if not dot:
+        base, file_type = name, ''
+    unique = name
+    i = 1
+    while unique in names:
+        unique = f"{base}_{i}{dot}{file_type}"
+        i += 1
+    names.add(unique)
+    return unique
+
+
+def fill_batch(directory: str, file: str, json) -> Union[tuple[dict, int], Response]:
+    """
+    fill the specified file with several jsons, and stream the filled documents in a zip archive.
+    All the jsons are checked before the first document is filled. The documents are filled in parallel on the
+    soffice processes, and added to the archive as soon as they are ready. The errors of the documents that
+    could not be filled are listed in the file errors.json of the archive.
+
+    :param directory: the directory where the file is
+    :param file: the file to fill
+    :param json: the list of jsons to fill the document with, or an object with the name of the archive
+    (key 'name') and this list (key 'documents')
+    :return: the zip archive, or a json and an int which represent the status code to return
+    """
+    global scannedjson
+    global my_lo
+    if isinstance(json, dict):
+        documents = json.get('documents')
+        archive_name = json.get('name', file.rpartition('.')[0] + '.zip')
+    else:
+        documents = json
+        archive_name = file.rpartition('.')[0] + '.zip'
+    if type(documents) is not list or not documents or type(archive_name) is not str:
+        return error_sim(
+            "JsonSyntaxError",
+            'api_invalid_batch_syntax',
+            "The json should be a non-empty array of instances, or an object containing 'documents' - a non-empty "
+            "array of instances and optionally 'name' - the name of the zip archive."), 415
+    for index, instance in enumerate(documents):
+        error = check_fill_json(instance)
+        if error:
+            error['variables'] = dict(error['variables'], index=index)
+            return error, 415
+    try:
+        # the instances are checked against the scanned variables, without soffice if the scan doesn't need it
+        with scanned_template(f"uploads/{directory}/{file}") as temp:
+            for index, instance in enumerate(documents):
+                try:
+                    temp.search_error(ot.convert_to_datas_template(instance["variables"]))
+                except Exception as e:
+                    error = error_format(e)
+                    error['variables'] = dict(error['variables'], index=index)
+                    return error, error_status(e)
+    except Exception as e:
+        return error_format(e), error_status(e)
+
+    def generate():
+        threads = len(my_lo)
+        stream = ZipStream()
+        names = set()
+        failures = []
+        with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive, ThreadPoolExecutor(threads) as executor:
+            pending = {}
+            instances = enumerate(documents)
+            while True:
+                # a few documents ahead of the client only, so a slow client doesn't pile them up in memory
+                for index, instance in instances:
+                    pending[executor.submit(fill_document, directory, file, instance)] = index
+                    if len(pending) >= 2 * threads:
+                        break
+                if not pending:
+                    break
+                done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    try:
+                        data = future.result()
+                    except Exception as e:
+                        failures.append(dict(index=index, name=documents[index]["name"], error=error_format(e)))
+                        continue
+                    archive.writestr(unique_name(result_name(documents[index]), names), data)
+                    yield stream.take()
+            if failures:
+                archive.writestr(unique_name('errors.json', names), jsonlib.dumps(failures, ensure_ascii=False))
+        yield stream.take()
+
+    return Response(generate(), mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename="{archive_name}"'})
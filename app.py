@@ -2,7 +2,7 @@
 Copyright (C) 2023 Probesys
 """
 
-from flask import Flask,request, jsonify,after_this_request,send_file
+from flask import Flask,request, jsonify,send_file
 from werkzeug.utils import secure_filename
 
 import os
@@ -11,7 +11,7 @@ from shutil import copyfile, rmtree
 from os.path import isfile, join
 from os import listdir
 from API import utils
-from lotemplate.utils import get_cached_json
+from lotemplate.utils import get_cached_json, get_cached_layout, get_hash_index
 from lotemplate import statistic_open_document,clean_old_open_document
 
 app = Flask(__name__)
@@ -31,6 +31,10 @@ def main_route():
                 'ApiError', 'missing_header_key', "You must provide a valid name in the headers, key 'directory'",
                 {'key': 'directory'}), 400
         directory = request.headers['directory'].replace('/', '')
+        if directory in utils.reserved_directories:
+            return utils.error_sim(
+                'ApiError', 'reserved_directory', f"the name {repr(directory)} is reserved by the api",
+                {'directory': directory}), 415
         if os.path.isdir(f"uploads/{directory}"):
             return utils.error_sim(
                 'ApiError', 'dir_already_exists', f"the specified directory {repr(directory)} already exists",
@@ -49,6 +53,14 @@ def stats_route():
      else:
         return statistic_open_document(utils.my_lo,utils.maxtime)
 
+@app.route("/stats/broker")
+def broker_stats_route():
+     if request.headers.get('secretkey', '') != os.environ.get('SECRET_KEY', ''):
+        return utils.error_sim(
+            'ApiError', 'invalid_secretkey', "The secret key is invalid or not given", {'key': 'secret_key'}), 401
+     else:
+        return utils.my_broker.stats()
+
 @app.route("/clean_lo")
 def clean_route():
      if request.headers.get('secretkey', '') != os.environ.get('SECRET_KEY', ''):
@@ -76,6 +88,10 @@ def directory_route(directory):
             datas.append(file_info)
         return jsonify(datas)
     elif request.method == 'PUT':
+        if directory in utils.reserved_directories:
+            return utils.error_sim(
+                'ApiError', 'reserved_directory', f"the name {repr(directory)} is reserved by the api",
+                {'directory': directory}), 415
         f = request.files.get('file')
         if not f:
             return utils.error_sim(
@@ -86,10 +102,12 @@ def directory_route(directory):
         onlyfiles = [f for f in listdir("uploads/"+directory) if isfile(join("uploads/"+directory, f))]
         json_cache_dir=utils.scannedjson
         for file in onlyfiles:
-            cachedjson=get_cached_json(json_cache_dir,"uploads/"+directory+"/"+file)
-            if os.path.exists(cachedjson):
-                os.remove(cachedjson)
+            for cachedjson in (get_cached_json(json_cache_dir,"uploads/"+directory+"/"+file),
+                               get_cached_layout(json_cache_dir,"uploads/"+directory+"/"+file)):
+                if os.path.exists(cachedjson):
+                    os.remove(cachedjson)
         rmtree(f"uploads/{directory}")
+        get_hash_index().forget(f"uploads/{directory}")
         return {'directory': directory, 'message': 'The directory and all his content has been deleted'}
     elif request.method == 'PATCH':
         if 'name' not in request.headers:
@@ -97,11 +115,16 @@ def directory_route(directory):
                 'ApiError', 'missing_header_key', "You must provide a valid name in the headers, key 'name'",
                 {'key': 'name'}), 400
         new_name = request.headers['name'].replace('/', '')
+        if new_name in utils.reserved_directories:
+            return utils.error_sim(
+                'ApiError', 'reserved_directory', f"the name {repr(new_name)} is reserved by the api",
+                {'directory': new_name, 'original_directory': directory}), 415
         if os.path.isdir(f"uploads/{new_name}"):
             return utils.error_sim(
                 'ApiError', 'dir_already_exists', f"the specified directory {repr(new_name)} already exists",
                 {'directory': new_name, 'original_directory': directory}), 415
         os.rename(f"uploads/{directory}", f"uploads/{new_name}")
+        get_hash_index().rename(f"uploads/{directory}", f"uploads/{new_name}")
         return {'directory': new_name,
                 'old_directory': directory,
                 "message": f"directory {directory} successfully renamed in {new_name}"}
@@ -110,15 +133,6 @@ def directory_route(directory):
 @app.route("/<directory>/<file>", methods=['GET', 'PATCH', 'DELETE', 'POST'])
 def file_route(directory, file):
     app.logger.debug("New request on file route (" + directory + "/" + file + ")")
-
-    @after_this_request
-    def delete_tmp_file(response):
-        if request.method == 'POST':
-            try:
-                os.remove(file)
-            except Exception as e:
-                app.logger.error("Error deleting file " + str(file) + ": " + str(e))
-        return response
     if request.headers.get('secretkey', '') != os.environ.get('SECRET_KEY', ''):
         return utils.error_sim(
             'ApiError', 'invalid_secretkey', "The secret key is invalid or not given", {'key': 'secret_key'}), 401
@@ -143,25 +157,115 @@ def file_route(directory, file):
         datas = utils.save_file(directory, f, file)
         if isinstance(datas, tuple):
             copyfile(f"uploads/temp_{file}", f"uploads/{directory}/{file}")
+            get_hash_index().update(f"uploads/{directory}/{file}")
         os.remove(f"uploads/temp_{file}")
         return datas
     elif request.method == 'POST':
         if not request.json:
             return utils.error_sim('ApiError', 'missing_json', "You must provide a json in the body"), 400
         app.logger.debug("POST request on " + directory + "/" + file + " with following json: " + str(request.json))
-        file ,response = utils.fill_file(directory, file, request.json)
+        response = utils.fill_file(directory, file, request.json)
         app.logger.debug("Filled template " + directory + "/" + file)
         return response
     elif request.method == 'DELETE':
         json_cache_dir=utils.scannedjson
-        cachedjson=get_cached_json(json_cache_dir,"uploads/"+directory+"/"+file)
-        if os.path.exists(cachedjson):
-            os.remove(cachedjson)
+        for cachedjson in (get_cached_json(json_cache_dir,"uploads/"+directory+"/"+file),
+                           get_cached_layout(json_cache_dir,"uploads/"+directory+"/"+file)):
+            if os.path.exists(cachedjson):
+                os.remove(cachedjson)
         if os.path.exists(f"uploads/{directory}/{file}"):
             os.remove(f"uploads/{directory}/{file}")
+        get_hash_index().forget(f"uploads/{directory}/{file}")
         return {'directory': directory, 'file': file, 'message': "File successfully deleted"}
 
 
+@app.route("/<directory>/<file>/job", methods=['POST'])
+def job_route(directory, file):
+    if request.headers.get('secretkey', '') != os.environ.get('SECRET_KEY', ''):
+        return utils.error_sim(
+            'ApiError', 'invalid_secretkey', "The secret key is invalid or not given", {'key': 'secret_key'}), 401
+    if not os.path.isdir(f"uploads/{directory}"):
+        return utils.error_sim(
+            'ApiError', 'dir_not_found', f"the specified directory {repr(directory)} doesn't exist",
+            {'directory': directory}), 415
+    if not os.path.isfile(f"uploads/{directory}/{file}"):
+        return utils.error_sim(
+            'ApiError', 'file_not_found', f"the specified file {repr(file)} doesn't exist in {repr(directory)}",
+            {'file': file, 'directory': directory}), 415
+    if not request.json:
+        return utils.error_sim('ApiError', 'missing_json', "You must provide a json in the body"), 400
+    return utils.submit_job(directory, file, request.json)
+
+
+@app.route("/<directory>/<file>/batch", methods=['POST'])
+def batch_route(directory, file):
+    if request.headers.get('secretkey', '') != os.environ.get('SECRET_KEY', ''):
+        return utils.error_sim(
+            'ApiError', 'invalid_secretkey', "The secret key is invalid or not given", {'key': 'secret_key'}), 401
+    if not os.path.isdir(f"uploads/{directory}"):
+        return utils.error_sim(
+            'ApiError', 'dir_not_found', f"the specified directory {repr(directory)} doesn't exist",
+            {'directory': directory}), 415
+    if not os.path.isfile(f"uploads/{directory}/{file}"):
+        return utils.error_sim(
+            'ApiError', 'file_not_found', f"the specified file {repr(file)} doesn't exist in {repr(directory)}",
+            {'file': file, 'directory': directory}), 415
+    if not request.json:
+        return utils.error_sim('ApiError', 'missing_json', "You must provide a json in the body"), 400
+    app.logger.debug("Batch request on " + directory + "/" + file)
+    return utils.fill_batch(directory, file, request.json)
+
+
+@app.route("/<directory>/<file>/merge", methods=['POST'])
+def merge_route(directory, file):
+    if request.headers.get('secretkey', '') != os.environ.get('SECRET_KEY', ''):
+        return utils.error_sim(
+            'ApiError', 'invalid_secretkey', "The secret key is invalid or not given", {'key': 'secret_key'}), 401
+    if not os.path.isdir(f"uploads/{directory}"):
+        return utils.error_sim(
+            'ApiError', 'dir_not_found', f"the specified directory {repr(directory)} doesn't exist",
+            {'directory': directory}), 415
+    if not os.path.isfile(f"uploads/{directory}/{file}"):
+        return utils.error_sim(
+            'ApiError', 'file_not_found', f"the specified file {repr(file)} doesn't exist in {repr(directory)}",
+            {'file': file, 'directory': directory}), 415
+    if not request.json:
+        return utils.error_sim('ApiError', 'missing_json', "You must provide a json in the body"), 400
+    app.logger.debug("Merge request on " + directory + "/" + file)
+    return utils.merge_file(directory, file, request.json)
+
+
+@app.route("/jobs/<job_id>", methods=['GET'])
+def job_status_route(job_id):
+    if request.headers.get('secretkey', '') != os.environ.get('SECRET_KEY', ''):
+        return utils.error_sim(
+            'ApiError', 'invalid_secretkey', "The secret key is invalid or not given", {'key': 'secret_key'}), 401
+    status = utils.my_jobs.status(job_id)
+    if not status:
+        return utils.error_sim(
+            'ApiError', 'job_not_found', f"the specified job {repr(job_id)} doesn't exist or has expired",
+            {'job': job_id}), 415
+    return status
+
+
+@app.route("/jobs/<job_id>/download")
+def job_download_route(job_id):
+    if request.headers.get('secretkey', '') != os.environ.get('SECRET_KEY', ''):
+        return utils.error_sim(
+            'ApiError', 'invalid_secretkey', "The secret key is invalid or not given", {'key': 'secret_key'}), 401
+    status = utils.my_jobs.status(job_id)
+    if not status:
+        return utils.error_sim(
+            'ApiError', 'job_not_found', f"the specified job {repr(job_id)} doesn't exist or has expired",
+            {'job': job_id}), 415
+    result = utils.my_jobs.result(job_id)
+    if not result:
+        return utils.error_sim(
+            'ApiError', 'job_not_done', f"the specified job {repr(job_id)} is {status['status']}",
+            {'job': job_id, 'status': status['status']}), 415
+    return send_file(os.path.abspath(result), download_name=status['name'])
+
+
 @app.route("/<directory>/<file>/download")
 def download_route(directory, file):
     if request.headers.get('secretkey', '') != os.environ.get('SECRET_KEY', ''):
@@ -3,8 +3,39 @@ import os
 
 workers=int(os.environ.get('NB_WORKERS', 4))
 maxtime=int(os.environ.get('MAXTIME', 60))
+max_queue=int(os.environ.get('MAX_QUEUE', 0))
+lease_timeout=int(os.environ.get('LEASE_TIMEOUT', 60))
+# 'all' : the API starts once every soffice process is ready, 'first' : as soon as one is ready
+ready_barrier=os.environ.get('READY_BARRIER', 'all')
+# replace a soffice process after a number of documents, a resident memory (in MB) or an uptime (in seconds)
+recycle={
+    'max_documents': int(os.environ.get('RECYCLE_DOCUMENTS', 0)),
+    'max_rss': int(os.environ.get('RECYCLE_RSS_MB', 0))*1024*1024,
+    'max_uptime': int(os.environ.get('RECYCLE_UPTIME', 0)),
+}
+# keep pre-opened copies of the most used templates on each soffice process, 0 = disabled
+document_pool={
+    'max_templates': int(os.environ.get('DOC_POOL_TEMPLATES', 0)),
+    'copies': int(os.environ.get('DOC_POOL_COPIES', 1)),
+}
+# asynchronous fill jobs : queued jobs limit (0 = no limit), jobs running at the same time, result retention in seconds
+jobs={
+    'jobs_dir': os.environ.get('JOBS_DIR', 'jobs'),
+    'max_queue': int(os.environ.get('JOBS_MAX_QUEUE', 100)),
+    'max_running': int(os.environ.get('JOBS_MAX_RUNNING', 1)),
+    'ttl': int(os.environ.get('JOBS_TTL', 3600)),
+}
+# cache of the generated documents, 0 = disabled
+result_cache={
+    'cache_dir': os.environ.get('RESULT_CACHE_DIR', 'results'),
+    'max_size': int(os.environ.get('RESULT_CACHE_SIZE_MB', 0))*1024*1024,
+    'ttl': int(os.environ.get('RESULT_CACHE_TTL', 3600)),
+}
 my_lo=[]
 scannedjson='uploads/scannnedjson'
 def on_starting(server):
  
-    utils.start_soffice(workers,scannedjson,maxtime)
+    utils.start_soffice(workers,scannedjson,maxtime,max_queue,lease_timeout,ready_barrier!='first',recycle,document_pool if document_pool['max_templates'] else None,jobs,result_cache if result_cache['max_size'] else None)
+
+def post_fork(server, worker):
+    utils.start_jobs()
@@ -0,0 +1,440 @@
+"""
+Copyright (C) 2023 Probesys
+
+
+The scanner of the spreadsheet templates, reading the ODS and XLSX files without soffice
+"""
+
+__all__ = (
+    'CalcContent',
+    'CalcScanner',
+)
+
+import os
+import re
+import zipfile
+from typing import Union
+from xml.etree import ElementTree
+from xml.parsers import expat
+
+from sorcery import dict_of
+
+from . import errors
+from .WriterScanner import WriterScanner, _Paragraph
+from lotemplate.Statement.CalcSearchStatement import CalcTextStatement
+from lotemplate.Statement.CalcTableStatement import CalcTableStatement
+from lotemplate.Statement.CalcImageStatement import CalcImageStatement
+
+# the namespaces of the xml parts, as named by expat
+TEXT = 'urn:oasis:names:tc:opendocument:xmlns:text:1.0 '
+TABLE = 'urn:oasis:names:tc:opendocument:xmlns:table:1.0 '
+DRAW = 'urn:oasis:names:tc:opendocument:xmlns:drawing:1.0 '
+OFFICE = 'urn:oasis:names:tc:opendocument:xmlns:office:1.0 '
+SVG = 'urn:oasis:names:tc:opendocument:xmlns:svg-compatible:1.0 '
+S = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+R = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+XDR = '{http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing}'
+
+
+class CalcContent:
+    """
+    The text cells, images and named ranges of a spreadsheet
+    """
+
+    def __repr__(self):
+        return f"<CalcContent object :{len(self.sheets)} sheets, {len(self.named_ranges)} named ranges>"
+
+    def __init__(self):
+        # name, text cells as {(column, row): string} and images as [(name, description)] of each sheet
+        self.sheets = []
+        # name: (sheet name, start column, start row, end column, end row) of the global named ranges
+        self.named_ranges = {}
+
+    def add_sheet(self, name: str) -> tuple[dict, list]:
+        cells = {}
+        images = []
+        self.sheets.append((name, cells, images))
+        return cells, images
+
+
+def column_index(letters: str) -> int:
+    """
+    :param letters: the letters of a column, like 'A' or 'AB'
+    :return: the index of the column, starting at 0
+    """
+    index = 0
+    for letter in letters.upper():
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def sheet_name(name: str) -> str:
+    if name.startswith("'") and name.endswith("'"):
+        return name[1:-1].replace("''", "'")
+    return name
+
+
+class _OdsReader:
+    """
+    Reads the content.xml part of an ODS file
+    """
+
+    def __init__(self, content: CalcContent):
+        self.content = content
+        self.actions = []
+        self.skip = 0
+        self.cells = None
+        self.images = None
+        self.row = 0
+        self.column = 0
+        self.row_cells = {}
+        self.cell = None
+        self.paragraph = None
+        self.frame = None
+        self.description = None
+        self.groups = 0
+
+    def parse(self, file) -> None:
+        parser = expat.ParserCreate(namespace_separator=' ')
+        parser.buffer_text = True
+        parser.StartElementHandler = self.start
+        parser.EndElementHandler = self.end
+        parser.CharacterDataHandler = self.characters
+        parser.ParseFile(file)
+
+    def start(self, name: str, attributes: dict) -> None:
+        if self.skip:
+            self.skip += 1
+            return
+        action = self.open(name, attributes)
+        if action is False:
+            self.skip = 1
+        else:
+            self.actions.append(action)
+
+    def end(self, name: str) -> None:
+        if self.skip:
+            self.skip -= 1
+            return
+        action = self.actions.pop()
+        if action:
+            action()
+
+    def characters(self, data: str) -> None:
+        if self.skip:
+            return
+        if self.description is not None:
+            self.description.append(data)
+        elif self.paragraph is not None and not self.frame:
+            self.paragraph.add_text(data)
+
+    def open(self, name: str, attributes: dict):
+        if name in (OFFICE + 'annotation', SVG + 'title', DRAW + 'object', DRAW + 'object-ole'):
+            return False
+        if self.paragraph is not None and not self.frame:
+            if name == TEXT + 's':
+                self.paragraph.add_raw(' ' * int(attributes.get(TEXT + 'c', 1)))
+            elif name == TEXT + 'tab':
+                self.paragraph.add_raw('\t')
+            elif name == TEXT + 'line-break':
+                self.paragraph.add_raw('\n')
+                self.paragraph.ignore_space = True
+            return None
+        if name == TABLE + 'table' and self.cells is None:
+            return self.open_sheet(attributes)
+        if name == TABLE + 'table-row' and self.cells is not None:
+            return self.open_row(attributes)
+        if name in (TABLE + 'table-cell', TABLE + 'covered-table-cell') and self.cells is not None:
+            return self.open_cell(attributes)
+        if name == TEXT + 'p' and self.cell is not None and not self.frame:
+            self.paragraph = _Paragraph()
+
+            def end_paragraph():
+                self.cell['paragraphs'].append(self.paragraph.text())
+                self.paragraph = None
+            return end_paragraph
+        if name == TABLE + 'named-range' and self.cells is None:
+            self.named_range(attributes)
+            return None
+        if name == DRAW + 'frame' and self.images is not None:
+            return self.open_frame(attributes)
+        if name == DRAW + 'image' and self.frame:
+            self.frame['image'] = True
+            return False
+        if name == SVG + 'desc' and self.frame:
+            self.description = self.frame['description']
+
+            def end_description():
+                self.description = None
+            return end_description
+        if name == DRAW + 'g':
+            self.groups += 1
+
+            def end_group():
+                self.groups -= 1
+            return end_group
+        return None
+
+    def open_sheet(self, attributes: dict):
+        self.cells, self.images = self.content.add_sheet(attributes.get(TABLE + 'name', ''))
+        self.row = 0
+
+        def end_sheet():
+            self.cells = self.images = None
+        return end_sheet
+
+    def open_row(self, attributes: dict):
+        row = self.row
+        self.column = 0
+        self.row_cells = {}
+        repeated = int(attributes.get(TABLE + 'number-rows-repeated', 1))
+
+        def end_row():
+            for i in range(repeated if self.row_cells else 0):
+                self.cells.update({(column, row + i): text for column, text in self.row_cells.items()})
+            self.row = row + repeated
+        return end_row
+
+    def open_cell(self, attributes: dict):
+        column = self.column
+        repeated = int(attributes.get(TABLE + 'number-columns-repeated', 1))
+        self.column += repeated
+        # only the string cells are searched, not the numbers nor the formulas
+        if attributes.get(TABLE + 'formula') or attributes.get(OFFICE + 'value-type', 'string') != 'string':
+            return None
+        self.cell = {'paragraphs': []}
+
+        def end_cell():
+            text = attributes.get(OFFICE + 'string-value', '\n'.join(self.cell['paragraphs']))
+            self.cell = None
+            if text:
+                for i in range(repeated):
+                    self.row_cells[column + i] = text
+        return end_cell
+
+    def named_range(self, attributes: dict) -> None:
+        match = re.fullmatch(
+            r"\$?('(?:[^']|'')*'|[^.]*)\.\$?([A-Za-z]+)\$?(\d+)"
+            r"(?::\$?(?:'(?:[^']|'')*'|[^.]*)?\.\$?([A-Za-z]+)\$?(\d+))?",
+            attributes.get(TABLE + 'cell-range-address', '')
+        )
+        if not match:
+            return
+        sheet, start_column, start_row, end_column, end_row = match.groups()
+        self.content.named_ranges[attributes.get(TABLE + 'name', '')] = (
+            sheet_name(sheet), column_index(start_column), int(start_row) - 1,
+            column_index(end_column or start_column), int(end_row or start_row) - 1
+        )
+
+    def open_frame(self, attributes: dict):
+        frame = {'name': attributes.get(DRAW + 'name', ''), 'description': [], 'image': False}
+        parent = self.frame
+        self.frame = frame
+        in_group = self.groups
+
+        def end_frame():
+            self.frame = parent
+            if frame['image'] and not in_group:
+                self.images.append((frame['name'], ''.join(frame['description'])))
+        return end_frame
+
+
+class CalcScanner:
+    """
+    Scans the ODS and XLSX templates from their xml, giving the same variables and raising the same errors as the
+    scan of the document loaded in soffice
+    """
+
+    ods_mimetypes = ('application/vnd.oasis.opendocument.spreadsheet',)
+    xlsx_content_types = (
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml',
+        'application/vnd.ms-excel.sheet.macroEnabled.main+xml',
+    )
+
+    @staticmethod
+    def main_part(archive: zipfile.ZipFile) -> Union[str, None]:
+        """
+        :param archive: the zip archive of the spreadsheet
+        :return: the part to read first: content.xml for an ODS file, the workbook for an XLSX file, or None if the
+        file is not a spreadsheet
+        """
+        names = archive.namelist()
+        if 'mimetype' in names:
+            return 'content.xml' if archive.read('mimetype').decode().strip() in CalcScanner.ods_mimetypes else None
+        if '[Content_Types].xml' in names:
+            return next((
+                override.get('PartName', '').lstrip('/')
+                for override in ElementTree.fromstring(archive.read('[Content_Types].xml'))
+                if override.tag.endswith('Override') and override.get('ContentType') in CalcScanner.xlsx_content_types
+            ), None)
+        return None
+
+    @staticmethod
+    def supports(file_path: str) -> bool:
+        """
+        :param file_path: the path of the template
+        :return: whether the template can be scanned without soffice
+        """
+        if os.path.splitext(file_path)[1] not in ('.ods', '.xlsx') or not zipfile.is_zipfile(file_path):
+            return False
+        try:
+            with zipfile.ZipFile(file_path) as archive:
+                return CalcScanner.main_part(archive) is not None
+        except (zipfile.BadZipFile, ElementTree.ParseError, KeyError):
+            return False
+
+    @staticmethod
+    def read_xlsx(archive: zipfile.ZipFile, workbook_part: str) -> CalcContent:
+        content = CalcContent()
+        relations = WriterScanner.relations(archive, workbook_part)
+        workbook = ElementTree.fromstring(archive.read(workbook_part))
+
+        shared_strings = []
+        for kind, target in relations.values():
+            if kind == 'sharedStrings' and target in archive.namelist():
+                with archive.open(target) as f:
+                    for _, element in ElementTree.iterparse(f):
+                        if element.tag == S + 'si':
+                            # the text is in a single t element, or in the runs, the phonetic runs apart
+                            shared_strings.append(''.join(
+                                t.text or '' for t in element.findall(S + 't') + element.findall(f"{S}r/{S}t")
+                            ))
+                            element.clear()
+
+        for sheet in workbook.iter(S + 'sheet'):
+            cells, images = content.add_sheet(sheet.get('name', ''))
+            kind, sheet_part = relations.get(sheet.get(R + 'id'), (None, None))
+            if sheet_part not in archive.namelist():
+                continue
+            with archive.open(sheet_part) as f:
+                for _, element in ElementTree.iterparse(f):
+                    if element.tag != S + 'c':
+                        continue
+                    # only the string cells are searched, not the numbers nor the formulas
+                    if element.find(S + 'f') is None and element.get('t') in ('s', 'inlineStr'):
+                        if element.get('t') == 's':
+                            value = element.find(S + 'v')
+                            text = shared_strings[int(value.text)] if value is not None and value.text else ''
+                        else:
+                            text = ''.join(t.text or '' for t in element.iter(S + 't'))
+                        match = re.fullmatch(r'([A-Za-z]+)(\d+)', element.get('r', ''))
+                        if text and match:
+                            cells[(column_index(match.group(1)), int(match.group(2)) - 1)] = text
+                    element.clear()
+            for drawing_kind, drawing_part in WriterScanner.relations(archive, sheet_part).values():
+                if drawing_kind != 'drawing' or drawing_part not in archive.namelist():
+                    continue
+                drawing = ElementTree.fromstring(archive.read(drawing_part))
+                for anchor in drawing:
+                    for picture in anchor.findall(XDR + 'pic'):
+                        properties = picture.find(f"{XDR}nvPicPr/{XDR}cNvPr")
+                        if properties is not None:
+                            images.append((properties.get('name', ''), properties.get('descr', '')))
+
+        for defined_name in workbook.iter(S + 'definedName'):
+            # the names local to a sheet are not in the named ranges of the document
+            if defined_name.get('localSheetId') is not None:
+                continue
+            match = re.fullmatch(
+                r"('(?:[^']|'')*'|[^!]*)!\$?([A-Za-z]+)\$?(\d+)(?::\$?([A-Za-z]+)\$?(\d+))?",
+                (defined_name.text or '').strip()
+            )
+            if not match:
+                continue
+            sheet, start_column, start_row, end_column, end_row = match.groups()
+            content.named_ranges[defined_name.get('name', '')] = (
+                sheet_name(sheet), column_index(start_column), int(start_row) - 1,
+                column_index(end_column or start_column), int(end_row or start_row) - 1
+            )
+        return content
+
+    @staticmethod
+    def read(file_path: str) -> CalcContent:
+        """
+        :param file_path: the path of an ODS or XLSX template
+        :return: the text cells, images and named ranges of the template
+        """
+        with zipfile.ZipFile(file_path) as archive:
+            main_part = CalcScanner.main_part(archive)
+            if main_part is None:
+                raise ValueError("not a spreadsheet")
+            if main_part == 'content.xml':
+                content = CalcContent()
+                with archive.open(main_part) as f:
+                    _OdsReader(content).parse(f)
+                return content
+            return CalcScanner.read_xlsx(archive, main_part)
+
+    @staticmethod
+    def scan_cells(cells: dict, regex_string: str, variable_type: str, value) -> dict:
+        """
+        :param cells: the text cells to search in
+        :param regex_string: the regex of the variables
+        :return: the variables found in the cells, searched column by column as by soffice
+        """
+        variables = {}
+        for _, text in sorted(cells.items()):
+            for result in re.findall(regex_string, text):
+                variables[result[0]] = {'type': variable_type, 'value': value()}
+        return variables
+
+    @staticmethod
+    def scan_table(content: CalcContent) -> dict:
+        sheets = {name: cells for name, cells, _ in content.sheets}
+        tab_vars = {}
+        # the named ranges of soffice are sorted by their upper case name
+        for name in sorted(content.named_ranges, key=str.upper):
+            if not re.match(CalcTableStatement.table_pattern, name):
+                continue
+            sheet, start_column, start_row, end_column, end_row = content.named_ranges[name]
+            cells = {
+                position: text for position, text in sheets.get(sheet, {}).items()
+                if start_column <= position[0] <= end_column and start_row <= position[1] <= end_row
+            }
+            tab_vars[name] = {
+                'type': 'object',
+                'value': CalcScanner.scan_cells(cells, CalcTextStatement.table_regex_str, 'table', list)
+            }
+        return tab_vars
+
+    @staticmethod
+    def scan(content: CalcContent) -> dict[str: dict[str, Union[str, list[str]]]]:
+        """
+        scans the variables of a spreadsheet, in the order of CalcTemplate.scan
+
+        :param content: the content of the spreadsheet
+        :return: the variables found in the spreadsheet
+        """
+        texts = {}
+        images = {}
+        for _, cells, sheet_images in content.sheets:
+            texts = texts | CalcScanner.scan_cells(cells, CalcTextStatement.text_regex_str, 'text', str)
+            for name, description in sheet_images:
+                if CalcImageStatement.image_regex.fullmatch(name):
+                    images[name[1:]] = {'type': 'image', 'value': ''}
+                elif CalcImageStatement.image_regex.fullmatch(description):
+                    images[description[1:]] = {'type': 'image', 'value': ''}
+        tables = CalcScanner.scan_table(content)
+
+        variables_list = list(texts.keys()) + list(tables.keys()) + list(images.keys())
+        duplicates = [variable for variable in variables_list if variables_list.count(variable) > 1]
+
+        if duplicates:
+            first_type = "text" if duplicates[0] in texts.keys() else "image"
+            second_type = "table" if duplicates[0] in tables.keys() else "image"
+            raise errors.TemplateError(
+                'duplicated_variable',
+                f"The variable {duplicates[0]!r} is mentioned two times, but "
+                f"for two different types: {first_type!r}, and {second_type!r}",
+                dict_of(first_type, second_type, variable=duplicates[0])
+            )
+
+        return texts | tables | images
+
+    @staticmethod
+    def scan_file(file_path: str) -> dict[str: dict[str, Union[str, list[str]]]]:
+        """
+        :param file_path: the path of an ODS or XLSX template
+        :return: the variables found in the template
+        """
+        return CalcScanner.scan(CalcScanner.read(file_path))
@@ -16,6 +16,7 @@ from . import errors
 from sorcery import dict_of
 from lotemplate.Statement.CalcTableStatement import CalcTableStatement
 from .Template import Template
+from .CalcScanner import CalcScanner
 from lotemplate.Statement.CalcSearchStatement import CalcTextStatement
 from lotemplate.Statement.CalcImageStatement import CalcImageStatement
 from jsondiff import diff
@@ -62,12 +63,24 @@ class CalcTemplate(Template):
 
     def scan(self, **kwargs) -> dict[str: dict[str, Union[str, list[str]]]]:
         """
-        scans the variables contained in the template. Supports text, tables and images
+        scans the variables contained in the template. Supports text, tables and images.
+        The ODS and XLSX files are scanned from their xml, without loading them in soffice, unless with_office is
+        given.
 
         :return: list containing all the variables founded in the template
         """
 
         #should_close = kwargs.get("should_close", False)
+        if not kwargs.get("with_office", False) and CalcScanner.supports(self.file_path):
+            try:
+                return CalcScanner.scan_file(self.file_path)
+            except errors.TemplateError:
+                raise
+            except Exception as e:
+                if not self.cnx:
+                    raise
+                print(f"##### xml scan of {self.file_path} failed ({e!r}), scanning it with soffice #####")
+
         texts = {}
         images = {}
         #(Pdb) self.doc.getSheets().getElementNames()
@@ -1,5 +1,5 @@
 import re
-from com.sun.star.lang import XComponent
+from com.sun.star.lang import XComponent, IllegalArgumentException
 
 class CounterStatement:
     counter_regex = r"""
@@ -50,112 +50,79 @@ class CounterManager:
     def __init__(self, html: str, component: XComponent):
         self.counter_list = {}
 
-    def scan_counter(doc: XComponent) -> None:
+    def number_formated(format: str, value: int) -> str:
+        if format=='number':
+            return str(value)
+        elif format=='letter_uppercase':
+            # after Z we go to A
+            value -= 1
+            value = value % 26
+            return chr(value + 65)
+        elif format=='letter_lowercase':
+            # after z we go to a
+            value -= 1
+            value = value % 26
+            return chr(value + 97)
+        return str(value)
+
+    def counter_value(counter_list: dict, counter_statement: CounterStatement) -> str:
         """
-        scan for counter statement. No return. We just verify that there is
-        and endif for each if statement
-        """
-        #def compute_counter(x_found):
-        #    """
-        #    Compute the counter statement.
-        #    """
-        #    counter_text = x_found.getText()
-            #counter_cursor = counter_text.createTextCursorByRange(x_found)
-            #cursor_statement = CounterStatement(counter_cursor.String)
-
-        def find_counter_to_compute(doc, search, x_found):
-            """
-            Find the if statement to compute.
-            """
-            if x_found is None:
-                return None
-
-        #    compute_counter(x_found)
+        Computes a counter statement, the statements being computed in the order of the document
 
-            # searching for the next counter statement.
-            x_found_after = doc.findNext(x_found.End, search)
-            if x_found_after is not None:
-                find_counter_to_compute(doc, search, x_found_after)
-
-        # main of if_replace
-        search = doc.createSearchDescriptor()
-        search.SearchString = CounterStatement.counter_regex
-        search.SearchRegularExpression = True
-        search.SearchCaseSensitive = False
-        x_found = doc.findFirst(search)
-        find_counter_to_compute(doc, search, x_found)
+        :param counter_list: the value and the format of each counter, updated by the statement
+        :param counter_statement: the statement
+        :return: the text replacing the statement
+        """
+        if counter_statement.counter_name not in counter_list:
+            counter_list[counter_statement.counter_name] = {
+                "value": 0,
+                "format": "number"
+            }
+        counter = counter_list[counter_statement.counter_name]
+        if counter_statement.command_name == 'counter':
+            counter["value"] = counter["value"] + 1
+            if not counter_statement.is_hidden:
+                return CounterManager.number_formated(counter["format"], counter["value"])
+            return ""
+        if counter_statement.command_name == 'counter.format':
+            counter["format"] = counter_statement.counter_format
+            return ""
+        if counter_statement.command_name == 'counter.reset':
+            counter["value"] = 0
+            return ""
+        # counter.last
+        return CounterManager.number_formated(counter["format"], counter["value"])
 
     def counter_replace(doc: XComponent) -> None:
         """
-        scan for counter statement. No return. We just verify that there is
-        and endif for each if statement
-        """
-        def compute_counter(x_found):
-            """
-            Compute the counter statement.
-            """
-            def number_formated(format: str, value: int) -> str:
-                if format=='number':
-                    return str(value)
-                elif format=='letter_uppercase':
-                    # after Z we go to A
-                    value -= 1
-                    value = value % 26
-                    return chr(value + 65)
-                elif format=='letter_lowercase':
-                    # after z we go to a
-                    value -= 1
-                    value = value % 26
-                    return chr(value + 97)
-                return str(value)
+        Replace the counter statements of the body of the document with their values
 
-            counter_text = x_found.getText()
-            counter_cursor = counter_text.createTextCursorByRange(x_found)
-            counter_statement = CounterStatement(counter_cursor.String)
-            if counter_statement.counter_name not in counter_list:
-                counter_list[counter_statement.counter_name] = {
-                    "value": 0,
-                    "format": "number"
-                }
-            if counter_statement.command_name == 'counter':
-                counter_list[counter_statement.counter_name]["value"] = counter_list[counter_statement.counter_name]["value"] + 1
-                if not counter_statement.is_hidden:
-                    counter_cursor.String = number_formated(counter_list[counter_statement.counter_name]["format"], counter_list[counter_statement.counter_name]["value"])
-                else:
-                    counter_cursor.String = ""
-            elif counter_statement.command_name == 'counter.format':
-                counter_list[counter_statement.counter_name]["format"] = counter_statement.counter_format
-                counter_cursor.String = ""
-            elif counter_statement.command_name == 'counter.reset':
-                counter_list[counter_statement.counter_name]["value"] = 0
-                counter_cursor.String = ""
-            elif counter_statement.command_name == 'counter.last':
-                counter_cursor.String = number_formated(counter_list[counter_statement.counter_name]["format"], counter_list[counter_statement.counter_name]["value"])
+        The statements are found by one search of the document, computed in the order of the document, then
+        replaced all at once.
 
-        def find_counter_to_compute(doc, search, x_found):
-            """
-            Find the if statement to compute.
-            """
-            if x_found is None:
-                return None
-
-            #text = x_found.getText()
-            #cursor = text.createTextCursorByRange(x_found)
-            #str = cursor.String
-
-
-            compute_counter(x_found)
-
-            # searching for the next counter statement.
-            x_found_after = doc.findNext(x_found.End, search)
-            if x_found_after is not None:
-                find_counter_to_compute(doc, search, x_found_after)
-
-        # main of counter_replace
-        counter_list = {}
+        :param doc: the document to fill
+        :return: None
+        """
         search = doc.createSearchDescriptor()
         search.SearchString = CounterStatement.counter_regex
         search.SearchRegularExpression = True
         search.SearchCaseSensitive = False
-        x_found = doc.findFirst(search)
-        find_counter_to_compute(doc, search, x_found)
+        founded = doc.findAll(search)
+
+        # findAll also searches the headers, footers and frames, only the body was searched by findNext
+        body = doc.getText()
+        body_start = body.getStart()
+        x_founds = []
+        for x_found in founded:
+            try:
+                body.compareRegionStarts(body_start, x_found)
+            except IllegalArgumentException:
+                continue
+            x_founds.append(x_found)
+
+        counter_list = {}
+        values = [
+            CounterManager.counter_value(counter_list, CounterStatement(x_found.getString())) for x_found in x_founds
+        ]
+        for x_found, value in zip(x_founds, values):
+            x_found.setString(value)
@@ -63,48 +63,152 @@ class ForStatement:
             )
         self.variable_name = match.group(1)
 
-    def scan_for(doc: XComponent) -> dict:
+    def compile_template(template: str) -> list:
         """
-        scan for statement. return list of vars.
+        Compiles the content of a for statement once for all its iterations, into the list of its parts: the
+        strings copied as is, ('forindex',), ('foritem', name, escaping) and ('if', if_statement, parts) for the
+        if statements. As when the content was computed for each iteration, each if statement is paired with the
+        first endif left after it, from the last one, and an endif without if statement is left as is.
 
-        We verify that
-        - there is and endfor for each for statement
-        - vars sent are lists
+        :param template: the content between the for and the endfor statements
+        :return: the parts of the content
         """
+        statements = [
+            (match.start(), match.end(), match.group(0))
+            for match in re.finditer(IfStatement.start_regex, template, re.IGNORECASE)
+        ]
+        endifs = [
+            match.start() for match in re.finditer(IfStatement.end_regex, template, re.IGNORECASE)
+            if not any(start <= match.start() < end for start, end, _ in statements)
+        ]
+
+        # the endif of each if statement, by the start of the if statement
+        if_ends = {}
+        left_endifs = []
+        tokens = sorted([(start, 'if') for start, *_ in statements] + [(start, 'endif') for start in endifs])
+        for start, kind in reversed(tokens):
+            if kind == 'endif':
+                left_endifs.append(start)
+                continue
+            if not left_endifs:
+                if_statement = IfStatement(next(string for if_start, _, string in statements if if_start == start))
+                raise errors.TemplateError(
+                    'no_endif_found',
+                    f"The statement {if_statement.if_string} has no endif",
+                    dict_of(if_statement.if_string)
+                )
+            if_ends[start] = left_endifs.pop()
+
+        item_regex = re.compile(ForStatement.forindex_regex + '|' + ForStatement.foritem_regex, re.IGNORECASE)
+
+        def add_text(parts: list, text: str) -> None:
+            position = 0
+            for match in item_regex.finditer(text):
+                parts.append(text[position:match.start()])
+                parts.append(('forindex',) if match.group(1) is None else ('foritem', match.group(1), match.group(2)))
+                position = match.end()
+            parts.append(text[position:])
+
+        # the parts being filled: the content, then the content of each if statement being compiled
+        stack = [[]]
+        position = 0
+        cuts = sorted([(start, end, string) for start, end, string in statements] + [
+            (start, re.match(IfStatement.end_regex, template[start:], re.IGNORECASE).end() + start, None)
+            for start in endifs if start in if_ends.values()
+        ])
+        for start, end, string in cuts:
+            add_text(stack[-1], template[position:start])
+            position = end
+            if string is None:
+                stack.pop()
+                continue
+            parts = []
+            stack[-1].append(('if', IfStatement(string), parts))
+            stack.append(parts)
+        add_text(stack[-1], template[position:])
+        return stack[0]
+
+    def render_item(parts: list, local_variables: dict[str, dict[str, Union[str, list[str]]]], foritem_var,
+                    forindex: str) -> str:
+        """
+        Renders the content of a for statement for one value of its variable : computes the if statements, and
+        replaces the [forindex] and [foritem] statements
 
-        def scan_single_for(doc: XComponent, local_x_found) -> str:
+        :param parts: the content between the for and the endfor statements, as compiled by compile_template
+        :param local_variables: the variables
+        :param foritem_var: the value of the variable for this iteration
+        :param forindex: the index of the iteration, as a string
+        :return: the rendered content
+        """
+
+        def escape_html(s):
             """
-            scan for a single for statement
+            Replace special characters "&", "<" and ">" to HTML-safe sequences.
+            If the optional flag quote is true, the quotation mark character (")
+            is also translated.
             """
-            for_statement = ForStatement(local_x_found.getString())
-            #position_in_text = len(for_statement.for_string)
+            s = s.replace("&", "&amp;")  # Must be done first!
+            s = s.replace("<", "&lt;")
+            s = s.replace(">", "&gt;")
+            s = s.replace('"', "&quot;")
+            return s
 
-            endfor_search = doc.createSearchDescriptor()
-            endfor_search.SearchString = ForStatement.end_regex
-            endfor_search.SearchRegularExpression = True
-            endfor_search.SearchCaseSensitive = False
-            x_found_endfor = doc.findNext(local_x_found.End, endfor_search)
-            if x_found_endfor is None:
-                raise errors.TemplateError(
-                    'no_endfor_found',
-                    f"The statement {for_statement.for_string} has no endfor",
-                    dict_of(for_statement.for_string)
-                )
-            return for_statement.variable_name
+        def getForitemValue(match_var_name, match_escaping, foritem_var):
+            """
+            we are in a for loop on values of an array.
 
-        search = doc.createSearchDescriptor()
-        search.SearchString = ForStatement.start_regex_light
-        search.SearchRegularExpression = True
-        search.SearchCaseSensitive = False
-        x_found = doc.findFirst(search)
+            a regex just detected [foritem match_var_name match_escaping]
 
-        for_vars = {}
-        while x_found is not None:
-            variable_name = scan_single_for(doc, x_found)
-            for_vars[variable_name] = {'type': 'array', 'value': []}
-            x_found = doc.findNext(x_found.End, search)
-        return for_vars
+            mathch escaping, can exist or not. If it exists, it can be raw or escape_html
 
+            :param match_var_name:
+            :param match_escaping:
+            :return:
+            """
+            # get separate the var_name by "." to get the value in the dict
+            var_name_hierarchy = match_var_name.split('.')
+            # get the variable value from the hierarchy
+            value = foritem_var
+            for var_name in var_name_hierarchy:
+                value = value[var_name]
+
+            # get the escaping
+            escaping = 'raw'
+            if match_escaping is not None:
+                escaping = match_escaping
+            # escape the value
+            if escaping == 'escape_html':
+                value = escape_html(value)
+            return str(value)
+
+        def get_if_result(if_statement):
+            """
+            get value associated to the if statement, and computes the statement
+            """
+            value = None
+            if if_statement.variable_name is not None:
+                computed_variable_name = re.sub(ForStatement.forindex_regex, forindex, if_statement.variable_name)
+                value = local_variables[computed_variable_name]['value']
+            if if_statement.foritem_name is not None:
+                value = getForitemValue(if_statement.foritem_name, if_statement.foritem_escaping, foritem_var)
+            if if_statement.forindex is not None:
+                value = forindex
+            return if_statement.get_if_result(value)
+
+        def render(parts):
+            for part in parts:
+                if isinstance(part, str):
+                    pieces.append(part)
+                elif part[0] == 'forindex':
+                    pieces.append(forindex)
+                elif part[0] == 'foritem':
+                    pieces.append(getForitemValue(part[1], part[2], foritem_var))
+                elif get_if_result(part[1]):
+                    render(part[2])
+
+        pieces = []
+        render(parts)
+        return ''.join(pieces)
 
     def for_replace(doc: XComponent, local_variables: dict[str, dict[str, Union[str, list[str]]]]) -> None:
         """
@@ -124,110 +228,6 @@ class ForStatement:
             :return:
             """
 
-            def escape_html(s):
-                """
-                Replace special characters "&", "<" and ">" to HTML-safe sequences.
-                If the optional flag quote is true, the quotation mark character (")
-                is also translated.
-                """
-                s = s.replace("&", "&amp;")  # Must be done first!
-                s = s.replace("<", "&lt;")
-                s = s.replace(">", "&gt;")
-                s = s.replace('"', "&quot;")
-                return s
-
-            def getForitemValue(match_var_name, match_escaping, foritem_var):
-                """
-                we are in a for loop on values of an array.
-
-                a regex just detected [foritem match_var_name match_escaping]
-
-                mathch escaping, can exist or not. If it exists, it can be raw or escape_html
-
-                :param match_var_name:
-                :param match_escaping:
-                :return:
-                """
-                # get separate the var_name by "." to get the value in the dict
-                var_name_hierarchy = match_var_name.split('.')
-                # get the variable value from the hierarchy
-                value = foritem_var
-                for var_name in var_name_hierarchy:
-                    value = value[var_name]
-
-                # get the escaping
-                escaping = 'raw'
-                if match_escaping is not None:
-                    escaping = match_escaping
-                # escape the value
-                if escaping == 'escape_html':
-                    value = escape_html(value)
-                return str(value)
-
-            def manage_if_inside_for(content, local_variables, foritem_var, forindex):
-                """
-                manage the if statements inside a for loop.
-
-                It uses a recursive approach : we search an if statement inside the content string. Then we create a
-                subcontent with the content after the if statement and call the function again on this substring.
-
-                With this recursive call, the process begins with the last if statement and update the content for
-                the previous call.
-
-                :param content:
-                :param local_variables:
-                :param foritem_var:
-                :return:
-                """
-                # look for the first if statement
-                match_if = re.search(IfStatement.start_regex, content, re.IGNORECASE)
-                if match_if is None:
-                    return content
-
-                # get content before the if statement and call recursively the function
-                subcontent = content[match_if.end():]
-                subcontent = manage_if_inside_for(subcontent, local_variables, foritem_var, forindex)
-
-                # update the content with the result of the recursive call
-                content = content[:match_if.end()] + subcontent
-
-                # get the if statement values
-                if_statement = IfStatement(match_if.group(0))
-
-                # precontent is the content before the if statement
-                precontent = content[:match_if.start()]
-                postcontent = content[match_if.start():]
-                match_if_postcontent = re.search(IfStatement.start_regex, postcontent, re.IGNORECASE)
-
-                # if no endif => throw error
-                match_endif_postcontent = re.search(IfStatement.end_regex, postcontent, re.IGNORECASE)
-                if match_endif_postcontent is None:
-                    raise errors.TemplateError(
-                        'no_endif_found',
-                        f"The statement {if_statement.if_string} has no endif",
-                        dict_of(if_statement.if_string)
-                    )
-
-                # get value associated to the if statement
-                value = None
-                if if_statement.variable_name is not None:
-                    computed_variable_name = re.sub(ForStatement.forindex_regex, forindex, if_statement.variable_name)
-                    value = local_variables[computed_variable_name]['value']
-                if if_statement.foritem_name is not None:
-                    value = getForitemValue(if_statement.foritem_name, if_statement.foritem_escaping, foritem_var)
-                if if_statement.forindex is not None:
-                    value = forindex
-                if_result = if_statement.get_if_result(value)
-
-                if if_result:
-                    postcontent = postcontent[:match_endif_postcontent.start()] + postcontent[match_endif_postcontent.end():]
-                    postcontent = postcontent[:match_if_postcontent.start()] + postcontent[match_if_postcontent.end():]
-                if not if_result:
-                    postcontent = postcontent[:match_if_postcontent.start()] + postcontent[match_endif_postcontent.end():]
-
-                return precontent + postcontent
-
-
             for_statement = ForStatement(local_x_found.getString())
             foritem_vars = local_variables[for_statement.variable_name]['value']
 
@@ -263,30 +263,16 @@ class ForStatement:
             # remove the endfor at the end
             endfor_cursor.String = ''
 
-            # loop on values of the variable
-            counter = 0
-            for foritem_var in foritem_vars:
-                content = template
-                # parse if inside for before managing foritem replacements
-                content = manage_if_inside_for(content, local_variables, foritem_var, str(counter))
-
-                # search [forindex] and remplace by my counter
-                content = re.sub(ForStatement.forindex_regex, str(counter), content, flags=re.IGNORECASE)
-
-                # replace inside the selected content selected
-                for match in re.finditer(ForStatement.foritem_regex, content, re.IGNORECASE):
-                    getForitemValue(match.group(1), match.group(2), foritem_var)
-                    # replace the variable by its value
-                    content = content.replace(
-                        match.group(0),
-                        getForitemValue(match.group(1), match.group(2), foritem_var)
-                    )
-
-                # paste the content
-                for_text.insertString(for_cursor, content, False)
-
-                # counter increment
-                counter += 1
+            if not foritem_vars:
+                return
+
+            # compile the content once, render it for each value of the variable, and paste it all at once
+            parts = ForStatement.compile_template(template)
+            content = ''.join(
+                ForStatement.render_item(parts, local_variables, foritem_var, str(counter))
+                for counter, foritem_var in enumerate(foritem_vars)
+            )
+            for_text.insertString(for_cursor, content, False)
 
         # main of for_replace
         search = doc.createSearchDescriptor()
@@ -11,43 +11,6 @@ class HtmlStatement:
     def __init__(self, html_string):
         self.html_string = html_string
 
-    def scan_html(doc: XComponent) -> None:
-        """
-        scan html statement.
-
-        We verify that
-        - there is and endhtml for each html statement
-        """
-
-        def scan_single_html(local_x_found) -> None:
-            """
-            scan for a single for statement
-            """
-            #html_statement = HtmlStatement(local_x_found.getString())
-            endhtml_search = doc.createSearchDescriptor()
-            endhtml_search.SearchString = HtmlStatement.end_regex
-            endhtml_search.SearchRegularExpression = True
-            endhtml_search.SearchCaseSensitive = False
-            x_found_endhtml = doc.findNext(local_x_found.End, endhtml_search)
-            if x_found_endhtml is None:
-                cursor = local_x_found.getText().createTextCursorByRange(local_x_found)
-                raise errors.TemplateError(
-                    'no_endhtml_found',
-                    "The statement [html] has no endhtml",
-                    dict_of(cursor.String)
-                )
-
-        search = doc.createSearchDescriptor()
-        search.SearchString = HtmlStatement.start_regex
-        search.SearchRegularExpression = True
-        search.SearchCaseSensitive = False
-        x_found = doc.findFirst(search)
-
-        while x_found is not None:
-            scan_single_html(x_found)
-            x_found = doc.findNext(x_found.End, search)
-
-
     def html_replace(template, doc: XComponent) -> None:
         """
         Replace the content inside [html] and [endhtml] with a pasted html code inside the doc
@@ -114,92 +114,82 @@ class IfStatement:
             return re.search(r'^[\s\t\n]*$', value) is None
         return False
 
-    def scan_if(template) -> None:
+    def find_statements(paragraphs: list[str]) -> list[tuple[bool, str, tuple[int, int, int]]]:
         """
-        scan for if statement. No return. We just verify that there is
-        and endif for each if statement
-        """
-        def compute_if(x_found, x_found_endif):
-            """
-            Compute the if statement.
-            """
-            if_text = x_found.getText()
-            endif_text = x_found_endif.getText()
-            if_cursor = if_text.createTextCursorByRange(x_found)
-            endif_cursor = endif_text.createTextCursorByRange(x_found_endif)
-            content_cursor = if_text.createTextCursorByRange(x_found.End)
-            content_cursor.gotoRange(x_found_endif.Start, True)
-
-            match = re.search(IfStatement.start_regex, if_cursor.String, re.IGNORECASE)
-            if match is None:
-                c_string=dict_of(if_cursor.String)
-                doc.close(True)
-                raise errors.TemplateError(
-                    'syntax_error_in_if_statement',
-                    f"The statement {c_string} has a Syntax Error",
-                    dict_of(c_string)
-                )
-
-            if_cursor.String = ''
-            endif_cursor.String = ''
-            content_cursor.String = ''
+        finds the if statements and the endif of the paragraphs, as the searches of soffice: the regexes match inside
+        one paragraph only, without case sensitivity. An endif written inside an if statement is removed with it, so
+        it's ignored.
 
-        def find_if_to_compute(doc, search, x_found):
-            """
-            Find the if statement to compute.
-            """
-            if x_found is None:
-                return None
-            while True:
-                x_found_after = doc.findNext(x_found.End, search)
-                if x_found_after is not None:
-                    find_if_to_compute(doc, search, x_found_after)
-                else:
-                    break
+        :param paragraphs: the paragraphs to search in
+        :return: (is_endif, string, (paragraph, start, end)) of every if statement and endif, in the order of the
+        paragraphs
+        """
+        tokens = []
+        for paragraph_i, paragraph in enumerate(paragraphs):
+            statements = [
+                (match.start(), match.end(), False, match.group(0))
+                for match in re.finditer(IfStatement.start_regex_light, paragraph, re.IGNORECASE)
+            ]
+            endifs = [
+                (match.start(), match.end(), True, match.group(0))
+                for match in re.finditer(IfStatement.end_regex, paragraph, re.IGNORECASE)
+                if not any(start <= match.start() < end for start, end, *_ in statements)
+            ]
+            tokens += [
+                (is_endif, string, (paragraph_i, start, end))
+                for start, end, is_endif, string in sorted(statements + endifs)
+            ]
+        return tokens
+
+    def match_statements(tokens: list[tuple[bool, str, object]]):
+        """
+        pairs each if statement with its endif as soffice computes them: from the last if statement, each one with
+        the first endif left after it. The endif are stacked while going up the document, so the first endif left
+        after an if statement is always the last one stacked.
 
-            endif_search = doc.createSearchDescriptor()
-            endif_search.SearchString = IfStatement.end_regex
-            endif_search.SearchRegularExpression = True
-            endif_search.SearchCaseSensitive = False
+        :param tokens: (is_endif, string, position) of every if statement and endif, in the order of the document
+        :return: an iterator of the (string, position, endif position) of each if statement, from the last one, the
+        endif position being None if there is no endif left after the if statement
+        """
+        endifs = []
+        for is_endif, string, position in reversed(tokens):
+            if is_endif:
+                endifs.append(position)
+            else:
+                yield string, position, endifs.pop() if endifs else None
+
+    def scan_if(paragraphs: list[str]) -> None:
+        """
+        scan for if statement. No return. We just verify that there is
+        and endif for each if statement, that there is no endif left, and the syntax of the statements
 
-            x_found_endif = doc.findNext(x_found.End, endif_search)
-            if x_found_endif is None:
-                cursor = x_found.getText().createTextCursorByRange(x_found)
-                c_string=dict_of(cursor.String)
-                doc.close(True)
+        :param paragraphs: the paragraphs of the body of the document, as searched by findFirst and findNext
+        :return: None
+        """
+        tokens = IfStatement.find_statements(paragraphs)
+        for string, position, endif_position in IfStatement.match_statements(tokens):
+            if endif_position is None:
+                c_string = {'String': string}
                 raise errors.TemplateError(
                     'no_endif_found',
                     f"The statement {c_string} has no endif",
                     c_string
                 )
-            compute_if(x_found, x_found_endif)
-
-
-        # main of if_replace
-        doc = template.open_doc_from_url()
-        search = doc.createSearchDescriptor()
-        search.SearchString = IfStatement.start_regex_light
-        search.SearchRegularExpression = True
-        search.SearchCaseSensitive = False
-        x_found = doc.findFirst(search)
-        find_if_to_compute(doc, search, x_found)
-
-        # check if there is still a endif at the end and rase an error if it is the case
-        globalCursor = doc.getText().createTextCursor()
-        globalCursor.gotoEnd(True)
-        str = globalCursor.String
-        match = re.search(IfStatement.end_regex, str, re.IGNORECASE)
-        if match is not None:
-            doc.close(True)
+            if re.search(IfStatement.start_regex, string, re.IGNORECASE) is None:
+                c_string = {'String': string}
+                raise errors.TemplateError(
+                    'syntax_error_in_if_statement',
+                    f"The statement {c_string} has a Syntax Error",
+                    dict_of(c_string)
+                )
+        # each if statement has taken one endif
+        if sum(is_endif for is_endif, *_ in tokens) > sum(not is_endif for is_endif, *_ in tokens):
             raise errors.TemplateError(
                 'too_many_endif_found',
                 "The document has too many endif",
                 {}
             )
 
-        doc.dispose()
-
-
     def if_replace(doc: XComponent, local_variables: dict[str, dict[str, Union[str, list[str]]]]) -> None:
         """
         Parse statements like [if $myvar==TOTO]...[endif]
@@ -212,7 +202,7 @@ class IfStatement:
         :return: None
         """
 
-        def compute_if(x_found, x_found_endif):
+        def compute_if(x_found, x_found_endif, if_string):
             """
             Compute the if statement.
             """
@@ -222,7 +212,7 @@ class IfStatement:
             endif_cursor = endif_text.createTextCursorByRange(x_found_endif)
             content_cursor = if_text.createTextCursorByRange(x_found.End)
             content_cursor.gotoRange(x_found_endif.Start, True)
-            if_statement = IfStatement(if_cursor.String)
+            if_statement = IfStatement(if_string)
             if_result = if_statement.get_if_result(local_variables[if_statement.variable_name]['value'])
 
             if not if_result:
@@ -235,41 +225,27 @@ class IfStatement:
                 if_cursor.String = ''
                 endif_cursor.String = ''
 
-        def find_if_to_compute(doc, search, x_found):
-            """
-            Find the if statement to compute.
-            """
-            if x_found is None:
-                return None
-            while True:
-                x_found_after = doc.findNext(x_found.End, search)
-                if x_found_after is not None:
-                    find_if_to_compute(doc, search, x_found_after)
-                else:
-                    break
-
-            endif_search = doc.createSearchDescriptor()
-            endif_search.SearchString = IfStatement.end_regex
-            endif_search.SearchRegularExpression = True
-            endif_search.SearchCaseSensitive = False
+        # main of if_replace
+        # the if statements and the endif are found by one search going forward in the document
+        search = doc.createSearchDescriptor()
+        search.SearchString = f'(?:{IfStatement.start_regex})|(?:{IfStatement.end_regex})'
+        search.SearchRegularExpression = True
+        search.SearchCaseSensitive = False
+        tokens = []
+        x_found = doc.findFirst(search)
+        while x_found is not None:
+            string = x_found.getString()
+            tokens.append((re.fullmatch(IfStatement.end_regex, string, re.IGNORECASE) is not None, string, x_found))
+            x_found = doc.findNext(x_found.End, search)
 
-            x_found_endif = doc.findNext(x_found.End, endif_search)
+        # then computed from the last one: the text removed is always after the statements left to compute
+        for string, x_found, x_found_endif in IfStatement.match_statements(tokens):
             if x_found_endif is None:
-                cursor = x_found.getText().createTextCursorByRange(x_found)
-                c_string=dict_of(cursor.String)
+                c_string = {'String': string}
                 doc.close(True)
                 raise errors.TemplateError(
                     'no_endif_found',
                     f"The statement {c_string} has no endif",
                     dict_of(c_string)
                 )
-            compute_if(x_found, x_found_endif)
-
-
-        # main of if_replace
-        search = doc.createSearchDescriptor()
-        search.SearchString = IfStatement.start_regex
-        search.SearchRegularExpression = True
-        search.SearchCaseSensitive = False
-        x_found = doc.findFirst(search)
-        find_if_to_compute(doc, search, x_found)
+            compute_if(x_found, x_found_endif, string)
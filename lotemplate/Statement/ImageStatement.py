@@ -9,21 +9,6 @@ from com.sun.star.awt import Size
 class ImageStatement:
     image_regex = regex.compile(r'\$\w+')
 
-    def scan_image(doc: XComponent) -> dict[str, dict[str, str]]:
-        """
-        scan for images in the given doc
-
-        :param doc: the document to scan
-        :return: the scanned variables
-        """
-        imgs = {}
-        for img in doc.getGraphicObjects():
-            if ImageStatement.image_regex.fullmatch(img.LinkDisplayName): 
-                imgs[ImageStatement.image_regex.match(img.LinkDisplayName).group(0)[1:]] = {'type': 'image', 'value': ''}
-            elif ImageStatement.image_regex.fullmatch(img.Description):
-                imgs[ImageStatement.image_regex.match(img.Description).group(0)[1:]] = {'type': 'image', 'value': ''}
-        return imgs
-
     def image_fill(doc: XComponent, graphic_provider, variable: str, path: str, should_resize=True) -> None:
         """
         Fills all the image-related content
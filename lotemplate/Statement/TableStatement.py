@@ -1,7 +1,6 @@
+import re
 from com.sun.star.lang import XComponent
-from com.sun.star.uno import RuntimeException
 from typing import Union
-import lotemplate.errors as errors
 import regex
 
 
@@ -12,105 +11,105 @@ class TableStatement:
         r'|(?<var>&\w+)'
     )
 
-    def scan_table(doc: XComponent, get_list=False) -> Union[dict, list]:
-        """
-        scan for tables in the given doc
+    # the number of rows written at once in a table, so that the size of the uno messages doesn't depend on the size
+    # of the table
+    rows_chunk = 1000
 
-        :param get_list: indicates if the function should return a list
-        of variables or the formatted dictionary of variables
-        :param doc: the document to scan
-        :return: the scanned variables
+    def find_tables(doc: XComponent, variables: dict[str, dict[str, Union[str, list[str]]]], text_prefix: str,
+                    table_prefix: str) -> list[tuple]:
         """
+        Finds the tables holding the table variables, by searching each variable in the document
 
-        def scan_cell(cell) -> None:
-            """
-            scan for variables in the given cell
-
-            :param cell: the cell to scan
-            :return: None
-            """
-            for match in TableStatement.table_regex.finditer(cell):
-                if not match.captures('var'):
-                    continue
-                if row_i != nb_rows - 1:
-                    raise errors.TemplateError(
-                        'variable_not_in_last_row',
-                        f"The variable {match[0]!r} (table {t_name!r}) "
-                        f"isn't in the last row (got: row {row_i + 1!r}, "
-                        f"expected: row {nb_rows!r})",
-                        dict(table=t_name, actual_row=row_i + 1,
-                             expected_row=nb_rows, variable=match[0])
-                    )
-                tab_vars[match[0][1:]] = {'type': 'table', 'value': ['']}
-                list_tab_vars.append(match[0])
-
-        tab_vars = {}
-        list_tab_vars = []
-        for i in range(doc.getTextTables().getCount()):
-            try:
-                table_data = doc.getTextTables().getByIndex(i).getDataArray()
-                t_name = doc.getTextTables().getByIndex(i).getName()
-                nb_rows = len(table_data)
-                for row_i, row in enumerate(table_data):
-                    for column in row:
-                        scan_cell(column)
-            except errors.TemplateError as e:
-                raise e
-                continue
-            except RuntimeException:
+        :param doc: the document to fill
+        :param variables: the variables
+        :param text_prefix: the prefix for text variables
+        :param table_prefix: the prefix for table variables
+        :return: the table and the variables found in it, for each table
+        """
+        search = doc.createSearchDescriptor()
+        tables = []
+        for element, infos in sorted(variables.items(), key=lambda s: -len(s[0])):
+            if infos['type'] != 'table':
                 continue
-
-        return list_tab_vars if get_list else tab_vars
+            search.SearchString = (text_prefix if '(' in element else table_prefix) + element
+            founded = doc.findAll(search)
+            for variable in founded:
+                if not variable.TextTable:
+                    continue
+                table_vars = next((table_vars for table, table_vars in tables if table == variable.TextTable), None)
+                if table_vars is None:
+                    tables.append((variable.TextTable, [variable.String]))
+                elif variable.String not in table_vars:
+                    table_vars.append(variable.String)
+        return tables
 
     def tables_fill(doc: XComponent, variables: dict[str, dict[str, Union[str, list[str]]]], text_prefix: str,
-                    table_prefix: str) -> None:
+                    table_prefix: str, layout: dict[str, list[str]] = None) -> None:
         """
         Fills all the table-related content
 
+        The row holding the variables is compiled once into the strings and the variables of each cell, then
+        repeated for each value, the rows being written by chunks of rows_chunk rows.
+
         :param doc: the document to fill
+        :param variables: the variables
         :param text_prefix: the prefix for text variables
         :param table_prefix: the prefix for table variables
+        :param layout: the table variables of the last row of each table, by table name, as given by the scan. The
+        tables are searched in the document if it's not given, or if it doesn't match the document
         :return: None
         """
-        search = doc.createSearchDescriptor()
-        matches = []
-        for element, infos in sorted(variables.items(), key=lambda s: -len(s[0])):
-            if infos['type'] != 'table':
-                continue
-            search.SearchString = (text_prefix if '(' in element else table_prefix) + element
-            founded = doc.findAll(search)
-            matches += [founded.getByIndex(i) for i in range(founded.getCount()) if founded.getByIndex(i).TextTable]
-        tab_vars = [{
-            "table": variable.TextTable,
-            "var": variable.String
-        } for variable in matches]
 
-        tables = [
-            {'table': tab, 'vars':
-                {tab_var['var']: variables[tab_var['var'][1:]]['value']
-                 for tab_var in tab_vars if tab_var['table'] == tab}
-             } for tab in list(set(variable['table'] for variable in tab_vars))
-        ]
+        def last_row(table) -> tuple:
+            row_pos = table.getRows().getCount() - 1
+            nb_columns = table.getColumns().getCount()
+            return row_pos, table.getCellRangeByPosition(0, row_pos, nb_columns - 1, row_pos).getDataArray()[0]
+
+        tables = None
+        if layout is not None:
+            tables = []
+            text_tables = doc.getTextTables()
+            for name, table_vars in layout.items():
+                if not text_tables.hasByName(name):
+                    tables = None
+                    break
+                table = text_tables.getByName(name)
+                row_pos, row = last_row(table)
+                # the table may have been filled already, as when several instances of the template are merged
+                if not any(var in cell for cell in row if isinstance(cell, str) for var in table_vars):
+                    tables = None
+                    break
+                tables.append((table, table_vars, row_pos, row))
+        if tables is None:
+            tables = [
+                (table, table_vars, *last_row(table))
+                for table, table_vars in TableStatement.find_tables(doc, variables, text_prefix, table_prefix)
+            ]
+
+        for table, table_vars, var_row_pos, var_row in tables:
+            table_values = {variable: variables[variable[1:]]['value'] for variable in table_vars}
+            nb_rows = max([len(value) for value in table_values.values()] + [1])
+            if nb_rows > 1:
+                table.getRows().insertByIndex(var_row_pos + 1, nb_rows - 1)
 
-        for element in tables:
+            # the longest variables first, so that a variable isn't found at the start of a longer one
+            var_regex = re.compile('(' + '|'.join(
+                re.escape(variable) for variable in sorted(table_values, key=lambda s: -len(s))
+            ) + ')')
+            # the strings of each cell at the even indexes, the variables between them at the odd indexes
+            cells = [var_regex.split(cell) if isinstance(cell, str) else [cell] for cell in var_row]
 
-            table = element['table']
-            table_vars = element['vars']
-            var_row_pos = len(table.getRows()) - 1
-            nb_rows_to_add = max([len(variable) for variable in table_vars.values()])
-            table.getRows().insertByIndex(var_row_pos + 1, nb_rows_to_add - 1)
-            table_values = table.getDataArray()
-            var_row = table_values[var_row_pos]
-            static_rows = table_values[:var_row_pos]
+            def new_row(i: int) -> tuple:
+                return tuple(
+                    parts[0] if len(parts) == 1 else ''.join(
+                        part if not j % 2 else
+                        table_values[part][i] if i < len(table_values[part]) else ""
+                        for j, part in enumerate(parts)
+                    ) for parts in cells
+                )
 
-            for i in range(nb_rows_to_add):
-                new_row = var_row
-                for variable_name, variable_value in sorted(table_vars.items(), key=lambda s: -len(s[0])):
-                    new_row = tuple(
-                        elem.replace(
-                            variable_name, variable_value[i]
-                            if i < len(variable_value) else ""
-                        ) for elem in new_row
-                    )
-                static_rows += (new_row,)
-            table.setDataArray(static_rows)
+            for start in range(0, nb_rows, TableStatement.rows_chunk):
+                end = min(start + TableStatement.rows_chunk, nb_rows)
+                table.getCellRangeByPosition(
+                    0, var_row_pos + start, len(var_row) - 1, var_row_pos + end - 1
+                ).setDataArray(tuple(new_row(i) for i in range(start, end)))
@@ -1,9 +1,7 @@
 import re
 from com.sun.star.lang import XComponent
-from com.sun.star.beans import UnknownPropertyException
+from typing import Union
 import regex
-from lotemplate.Statement.ForStatement import ForStatement
-from lotemplate.Statement.TableStatement import TableStatement
 
 
 class TextStatement:
@@ -12,77 +10,67 @@ class TextStatement:
     def __init__(self, text_string):
         self.text_string = text_string
 
-    def scan_text(doc: XComponent) -> dict[str, dict[str, str]]:
+    def names_regex(names: list[str]) -> str:
         """
-        scan for text in the given doc
+        gives the regex finding the given variables, as when they are searched one after the other from the
+        longest one: the alternatives are tried from the longest name, so that a variable isn't found at the start
+        of a longer one
 
-        :param doc: the document to scan
-        :return: the scanned variables
+        :param names: the names of the variables, without the $
+        :return: the regex, for python and for the searches of soffice
         """
+        return '|'.join(re.escape('$' + name) for name in sorted(names, key=lambda s: -len(s)))
 
-        search = doc.createSearchDescriptor()
-        search.SearchString = TextStatement.text_regex_as_string
-        search.SearchRegularExpression = True
-        search.SearchCaseSensitive = False
-        founded = doc.findAll(search)
-
-        simple_var_list = []
-        for x_found in founded:
-            text = x_found.getText()
-            cursor = text.createTextCursorByRange(x_found)
-            simple_var_list.append(cursor.String)
-
-        plain_vars = {}
-        for var in simple_var_list:
-            key_name = var[1:]
-            # add to plain_vars if it doesn't matche ForStatement.foritem_regex
-            if not re.search(ForStatement.forindex_regex, key_name, re.IGNORECASE):
-                plain_vars[key_name] = {'type': 'text', 'value': ''}
-
-        text_fields_vars = {}
-        for page in doc.getDrawPages():
-            for shape in page:
-                try:
-                    matches = TextStatement.text_regex.finditer(shape.String)
-                except (AttributeError, UnknownPropertyException):
-                    continue
-                text_fields_vars = (text_fields_vars |
-                                    {var.group(0)[1:]: {'type': 'text', 'value': ''} for var in matches})
-
-        table_var_list = TableStatement.scan_table(doc, get_list=True)
-        for var in table_var_list:
-            if var.startswith("$"):
-                var = var[1:]
-            if var in plain_vars:
-                del plain_vars[var]
-
-        for var in ForStatement.scan_for(doc):
-            if var in plain_vars:
-                del plain_vars[var]
-
-        return plain_vars | text_fields_vars
+    def text_values(variables: dict[str, dict[str, Union[str, list[str]]]]) -> dict[str, Union[str, None]]:
+        """
+        gives the values of the text variables for the case-insensitive searches, by their lowercase name with the $.
+        When two variables only differ by their case, the first one is kept, as it's the one filled when they are
+        searched one after the other from the longest one
 
+        :param variables: the variables
+        :return: the value of each text variable, None for the variables of other types
+        """
+        values = {}
+        for var, details in sorted(variables.items(), key=lambda s: -len(s[0])):
+            values.setdefault('$' + var.lower(), details['value'] if details['type'] == 'text' else None)
+        return values
 
-    def text_fill(doc: XComponent, variable: str, value: str) -> None:
+    def texts_fill(doc: XComponent, variables: dict[str, dict[str, Union[str, list[str]]]]) -> None:
         """
-        Fills all the text-related content
+        Fills all the text-related content, all the text variables being found by one search of the document.
+        The html variables are searched with them, so that a text variable isn't found at the start of a longer
+        html variable, but they are left to html_fill.
 
         :param doc: the document to fill
-        :param variable: the variable to search
-        :param value: the value to replace with
+        :param variables: the variables to fill
         :return: None
         """
 
+        names = [var for var, details in variables.items() if details['type'] in ('text', 'html')]
+        if not any(variables[var]['type'] == 'text' for var in names):
+            return
+        values = TextStatement.text_values({var: variables[var] for var in names})
+
         search = doc.createSearchDescriptor()
-        search.SearchString = variable
+        search.SearchString = TextStatement.names_regex(names)
+        search.SearchRegularExpression = True
+        search.SearchCaseSensitive = False
         founded = doc.findAll(search)
 
         for x_found in founded:
             text = x_found.getText()
             cursor = text.createTextCursorByRange(x_found)
-            cursor.String = value
+            value = values.get(cursor.String.lower())
+            if value is not None:
+                cursor.String = value
 
+        # the text of the shapes is replaced with case sensitivity
+        shape_values = {'$' + var: variables[var]['value'] for var in names if variables[var]['type'] == 'text'}
+        shape_regex = re.compile(TextStatement.names_regex(names))
         for page in doc.getDrawPages():
             for shape in page:
                 if shape.getShapeType() == "com.sun.star.drawing.TextShape":
-                    shape.String = shape.String.replace(variable, value)
+                    string = shape.String
+                    filled = shape_regex.sub(lambda match: shape_values.get(match.group(0), match.group(0)), string)
+                    if filled != string:
+                        shape.String = filled
@@ -10,17 +10,21 @@ __all__ = (
 )
 
 import os
+import io
+import threading
+from collections import OrderedDict
 from typing import Union
 from sorcery import dict_of
 import unohelper
 import uno
 from com.sun.star.beans import PropertyValue
-from com.sun.star.io import IOException
+from com.sun.star.document.MacroExecMode import NEVER_EXECUTE
+from com.sun.star.io import IOException, XOutputStream
 from com.sun.star.lang import IllegalArgumentException, DisposedException
 from com.sun.star.uno import RuntimeException
 from . import errors
 #from . import Connexion
-from .utils import get_file_url,get_cached_json
+from .utils import get_file_url,get_cached_json,get_cached_layout,get_file_hash
 
 
 import uuid
@@ -36,12 +40,47 @@ def dict_to_property(values, uno_any=False):
 def rgb_to_long(rgb:tuple):
     return int(rgb[0])*65536+int(rgb[1])*256+int(rgb[2])
 
+class OutputStream(unohelper.Base, XOutputStream):
+    """
+    An output stream keeping in memory the bytes written by soffice
+    """
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writeBytes(self, data):
+        self.buffer.write(data.value)
+
+    def flush(self):
+        pass
+
+    def closeOutput(self):
+        pass
+
+    def getvalue(self) -> bytes:
+        return self.buffer.getvalue()
+
 class Template:
 
     TMPDIR='/tmp'
+    # the table variables of each table of a text document, by table name, given by the scan
+    tables_layout = None
+    # templates of these formats are loaded from memory through an input stream. The type detection of the other
+    # formats (txt, html, csv...) relies on the file extension, so they are still loaded from a temporary copy
+    STREAM_FORMATS = ('odt', 'ott', 'ods', 'ots', 'docx', 'xlsx', 'doc', 'xls')
+    # the maximum size, in bytes, of the template contents kept in memory
+    FILES_CACHE_SIZE = 64 * 1024 * 1024
+    files_cache = OrderedDict()
+    files_cache_size = 0
+    files_cache_lock = threading.Lock()
 
     formats =  {}
     tmp_file= ''
+    file_tmp_name = ''
+    _doc = None
+    closed = False
+    # the content of the document filled without soffice, if any
+    filled = None
 
     def __enter__(self):
         return self
@@ -65,9 +104,73 @@ class Template:
     def __getitem__(self, item):
         return self.variables[item] if self.variables else None
 
+    @staticmethod
+    def read_file(file_path: str) -> bytes:
+        """
+        Reads the content of a template. The contents of the most recently used templates are kept in memory,
+        up to FILES_CACHE_SIZE bytes, so hot templates are not read again from the disk.
+
+        :param file_path: the path of the template
+        :return: the content of the template
+        """
+        stat = os.stat(file_path)
+        key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+        with Template.files_cache_lock:
+            data = Template.files_cache.get(key)
+            if data is not None:
+                Template.files_cache.move_to_end(key)
+                return data
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        if len(data) > Template.FILES_CACHE_SIZE:
+            return data
+        with Template.files_cache_lock:
+            if key not in Template.files_cache:
+                Template.files_cache[key] = data
+                Template.files_cache_size += len(data)
+            while Template.files_cache_size > Template.FILES_CACHE_SIZE:
+                evicted_key, evicted = Template.files_cache.popitem(last=False)
+                Template.files_cache_size -= len(evicted)
+        return data
+
+    @staticmethod
+    def copy_file(file_path: str) -> str:
+        """
+        Copies the template in TMPDIR, if its format can't be loaded from memory
+
+        :param file_path: the path of the template
+        :return: the path of the copy, or an empty string if the template is loaded from memory
+        """
+        if file_path.split(".")[-1].lower() in Template.STREAM_FORMATS:
+            return ''
+        tmp_file = Template.TMPDIR + "/" + str(uuid.uuid4()) + '_' + file_path.split("/")[-1]
+        shutil.copy(file_path, tmp_file)
+        return tmp_file
+
+    @staticmethod
+    def load_arguments(cnx, file_path: str, tmp_file: str, data: bytes = None) -> tuple:
+        """
+        Gives the arguments loading a new copy of the template : the temporary copy if any, an input stream
+        over the content of the template otherwise. The document is hidden and its macros are never executed.
+
+        :param cnx: the connection object to the bridge
+        :param file_path: the path of the template
+        :param tmp_file: the temporary copy returned by copy_file
+        :param data: the content to load instead of the content of the template
+        :return: a tuple (url, properties) to give to loadComponentFromURL
+        """
+        properties = {'Hidden': True, 'MacroExecutionMode': NEVER_EXECUTE}
+        if tmp_file:
+            return get_file_url(tmp_file), dict_to_property(properties)
+        input_stream = cnx.ctx.ServiceManager.createInstanceWithContext("com.sun.star.io.SequenceInputStream",
+                                                                        cnx.ctx)
+        input_stream.initialize((uno.ByteSequence(Template.read_file(file_path) if data is None else data),))
+        return "private:stream", dict_to_property(dict(properties, InputStream=input_stream))
+
     def open_doc_from_url(self):
         try:
-            doc = self.cnx.desktop.loadComponentFromURL(self.file_url, "_blank", 0, ())
+            url, properties = self.load_arguments(self.cnx, self.file_path, self.tmp_file, self.filled)
+            doc = self.cnx.desktop.loadComponentFromURL(url, "_blank", 0, properties)
         except DisposedException as e:
             self.close()
             raise errors.UnoException(
@@ -78,6 +181,9 @@ class Template:
                 dict_of(self.cnx.host, self.cnx.port)
             ) from e
         except IllegalArgumentException:
+            if not self.tmp_file:
+                # the stream has been read, but no filter recognized its content
+                return self.validDocType(None)
             self.close()
             raise errors.FileNotFoundError(
                 'file_not_found',
@@ -98,6 +204,75 @@ class Template:
     def validDocType(self,doc):
            pass
 
+    @property
+    def doc(self):
+        """
+        the document, opened on first access
+        """
+        if self._doc is None and not self.closed:
+            self._doc = self.load_doc()
+        return self._doc
+
+    @doc.setter
+    def doc(self, doc):
+        self._doc = doc
+
+    def load_doc(self):
+        """
+        Opens the document : takes a pristine copy of the template from the document pool of the connexion if
+        any, loads the template otherwise. A document filled without soffice is loaded from its content.
+
+        :return: the opened document
+        """
+        # hot templates have pristine copies already loaded in the document pool of the connexion
+        documents = getattr(self.cnx, 'documents', None) if self.filled is None else None
+        copy = None
+        if documents:
+            file_hash = get_file_hash(self.file_path)
+            copy = documents.take(file_hash)
+        if copy:
+            doc, self.tmp_file = copy
+        else:
+            self.tmp_file = self.copy_file(self.file_path)
+        self.file_tmp_name = self.tmp_file.split("/")[-1]
+        self.file_url = get_file_url(self.tmp_file or self.file_path)
+        if not copy:
+            doc = self.open_doc_from_url()
+        if documents:
+            documents.refill(file_hash, self.file_path)
+        doc.getDocumentProperties().resetUserData(self.author)
+        return doc
+
+    @staticmethod
+    def read_cached_variables(json_cache_dir: str, file_path: str) -> Union[dict, None]:
+        """
+        Reads the variables of a template from the scan cache, without opening the template
+
+        :param json_cache_dir: the directory of the scan cache
+        :param file_path: the path of the template
+        :return: the cached variables, or None if the template has not been scanned yet
+        """
+        try:
+            with open(get_cached_json(json_cache_dir, file_path)) as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    @staticmethod
+    def read_cached_layout(json_cache_dir: str, file_path: str) -> Union[dict, None]:
+        """
+        Reads the layout of the tables of a template from the scan cache
+
+        :param json_cache_dir: the directory of the scan cache
+        :param file_path: the path of the template
+        :return: the cached layout under the key 'tables', or None if the template has not been scanned yet
+        """
+        try:
+            with open(get_cached_layout(json_cache_dir, file_path)) as f:
+                return json.load(f)
+        except Exception:
+            return None
+
     def __init__(self, file_path: str, cnx, should_scan: bool,
                  json_cache_dir=None, author=''):
         """
@@ -109,34 +284,30 @@ class Template:
         """
         if os.path.exists(file_path):
             self.cnx = cnx
+            self.author = author
             self.file_name = file_path.split("/")[-1]
             self.file_dir = "/".join(file_path.split("/")[:-1])
             self.file_path = file_path
-            self.file_tmp_name=str(uuid.uuid4())+'_'+self.file_name
-            self.tmp_file=Template.TMPDIR+"/"+self.file_tmp_name
-
-            shutil.copy(file_path, self.tmp_file)
-
-            self.file_url = get_file_url(self.tmp_file)
+            self.file_url = get_file_url(file_path)
             self.variables = None
+            # the document is opened on its first use : a scan answered by the cache doesn't open it
             self.doc = None
-            self.doc = self.open_doc_from_url()
-            self.doc.getDocumentProperties().resetUserData(author)
             #print("number of opendocument"+str(len(list(self.cnx.desktop.getComponents()))))
             #print([print(a.getURL()) for a in list(self.cnx.desktop.getComponents())])
             if json_cache_dir:
                 cachedjson=get_cached_json(json_cache_dir,file_path)
-                if os.path.exists(cachedjson) and should_scan :
-                    try:
-                        with open(cachedjson) as f:
-                            self.variables = json.load(f)
+                if should_scan:
+                    self.variables = self.read_cached_variables(json_cache_dir, file_path)
+                    layout = self.read_cached_layout(json_cache_dir, file_path)
+                    if self.variables is not None and layout is not None:
+                        self.tables_layout = layout['tables']
                         return
-                    except Exception:
-                        pass
             self.variables = self.scan(should_close=True)
             if json_cache_dir:
                 with open(cachedjson, 'w') as f:
                     json.dump(self.variables, f, ensure_ascii=False)
+                with open(get_cached_layout(json_cache_dir, file_path), 'w') as f:
+                    json.dump({'tables': self.tables_layout}, f, ensure_ascii=False)
         else:
             self.close()
             raise errors.FileNotFoundError(
@@ -195,6 +366,15 @@ class Template:
     def fill(self, variables: dict[str, dict[str, Union[str, list[str]]]]) -> None:
             pass
 
+    def fill_without_office(self, variables: dict[str, dict[str, Union[str, list[str]]]]) -> bool:
+        """
+        Fills the template without soffice, if its format and its content allow it
+
+        :param variables: the values to fill in the template
+        :return: True if the template has been filled, False if it must be filled by soffice
+        """
+        return False
+
     def close(self) -> None:
         """
         close the template
@@ -203,9 +383,10 @@ class Template:
         """
         if not self:
             return
+        self.closed = True
         try:
-            if self.doc:
-                 self.doc.close(True)
+            if self._doc:
+                 self._doc.close(True)
         except Exception:
             pass 
         try:
@@ -216,21 +397,20 @@ class Template:
 
 
 
-    def export(self, filename: str, dirname=None, no_uid=None, my_filter_data=None )  -> Union[str, None]:
+    def export_filter(self, file_type: str, my_filter_data=None) -> tuple:
         """
-        Exports the newly generated document, if any.
+        Gives the filter exporting the document to the given format
 
-        :param name: the path/name with file extension of the file to export.
-        file type is automatically deducted from it.
-        :return: the full path of the exported document, or None if there is no document to export
+        :param file_type: the extension of the format
+        :param my_filter_data: the watermark options, for the pdf formats
+        :return: the FilterName and FilterData properties to give to storeToURL
         """
-        file_type = filename.split(".")[-1]
-        if no_uid:
-            path = os.getcwd() + "/" + dirname +  '/' + filename
-        else:
-            path = os.getcwd() + "/" + dirname +  '/' + str(uuid.uuid4()) +filename
-        url = unohelper.systemPathToFileUrl(path)
-
+        try:
+            filter_name = self.formats[file_type]
+        except KeyError:
+            self.close()
+            raise errors.ExportError('invalid_format',
+                                     f"Invalid export format {file_type!r}.", dict_of(file_type)) from None
 
         filter_data = {
                 #'EncryptFile': True,
@@ -241,21 +421,61 @@ class Template:
                 'WatermarkRotateAngle' : 450,
                 'WatermarkFontName' : 'Helvetica',
         }
-        if  isinstance(my_filter_data,dict) and bool(my_filter_data) and self.formats[file_type].endswith("pdf_Export"):
+        if  isinstance(my_filter_data,dict) and bool(my_filter_data) and filter_name.endswith("pdf_Export"):
             filter_data.update(my_filter_data)
             filter_data['WatermarkColor']=rgb_to_long(tuple(filter_data['WatermarkColorRGB'].split(",")))
 
         prop_filter_data = dict_to_property(filter_data, True)
         # list of available convert filters
         # cf https://help.libreoffice.org/latest/he/text/shared/guide/convertfilters.html
+        return (PropertyValue("FilterName", 0, filter_name, 0),
+                PropertyValue("FilterData", 0, prop_filter_data, 0))
+
+    def format_names(self, filename: str, formats: list, my_filter_data=None) -> list[str]:
+        """
+        Gives the names of the document in several formats, after checking that every format can be exported,
+        so an invalid format is reported before any export
+
+        :param filename: the name of the document, with or without extension
+        :param formats: the extensions of the formats
+        :param my_filter_data: the watermark options, for the pdf formats
+        :return: the name of the document in each format
+        """
+        base_name = filename.rpartition('.')[0] or filename
+        for file_type in formats:
+            self.export_filter(file_type, my_filter_data)
+        return [base_name + '.' + file_type for file_type in formats]
+
+    def export(self, filename: str, dirname=None, no_uid=None, my_filter_data=None, formats: list = None
+               )  -> Union[str, list[str], None]:
+        """
+        Exports the newly generated document, if any.
+
+        :param name: the path/name with file extension of the file to export.
+        file type is automatically deducted from it.
+        :param formats: if given, the document is exported once in each of these formats, the extension of the name
+        being replaced by the format
+        :return: the full path of the exported document, or None if there is no document to export. The list of the
+        full paths of the exported documents if formats are given
+        """
+        if formats:
+            filenames = self.format_names(filename, formats, my_filter_data)
+            return [self.export(name, dirname, no_uid, my_filter_data) for name in filenames]
+        file_type = filename.split(".")[-1]
+        if no_uid:
+            path = os.getcwd() + "/" + dirname +  '/' + filename
+        else:
+            path = os.getcwd() + "/" + dirname +  '/' + str(uuid.uuid4()) +filename
+        url = unohelper.systemPathToFileUrl(path)
+
+        properties = self.export_filter(file_type, my_filter_data)
+        if self.filled is not None and file_type == 'odt':
+            # the document filled without soffice is already an odt file
+            with open(path, 'wb') as f:
+                f.write(self.filled)
+            return path
         try:
-            self.doc.storeToURL(url, (PropertyValue("FilterName", 0,self.formats[file_type], 0),
-                                      PropertyValue("FilterData", 0,prop_filter_data, 0)),
-                                      )
-        except KeyError:
-            self.close()
-            raise errors.ExportError('invalid_format',
-                                     f"Invalid export format {file_type!r}.", dict_of(file_type)) from None
+            self.doc.storeToURL(url, properties)
         except IOException as error:
             self.close()
 
@@ -267,4 +487,33 @@ class Template:
 
         return path
 
+    def export_stream(self, filename: str, my_filter_data=None, formats: list = None
+                      ) -> Union[bytes, dict[str, bytes]]:
+        """
+        Exports the newly generated document in memory, without writing any file.
+
+        :param filename: the name with file extension of the document. file type is automatically deducted from it.
+        :param my_filter_data: the watermark options, for the pdf formats
+        :param formats: if given, the document is exported once in each of these formats, the extension of the name
+        being replaced by the format
+        :return: the content of the exported document. A dict of the contents by document name if formats are given
+        """
+        if formats:
+            filenames = self.format_names(filename, formats, my_filter_data)
+            return {name: self.export_stream(name, my_filter_data) for name in filenames}
+        file_type = filename.split(".")[-1]
+        properties = self.export_filter(file_type, my_filter_data)
+        if self.filled is not None and file_type == 'odt':
+            return self.filled
+        output_stream = OutputStream()
+        try:
+            self.doc.storeToURL("private:stream", properties + (PropertyValue("OutputStream", 0, output_stream, 0),))
+        except IOException as error:
+            self.close()
+            raise errors.ExportError(
+                'unknown_error',
+                f"Unable to export document {filename!r} : error {error.value!r}",
+                dict_of(filename, error)
+            ) from error
 
+        return output_stream.getvalue()
@@ -0,0 +1,613 @@
+"""
+Copyright (C) 2023 Probesys
+
+
+The filler of the ODT templates holding only text variables, for, if and counter statements, rewriting their xml
+without soffice
+"""
+
+__all__ = (
+    'WriterFiller',
+)
+
+import difflib
+import io
+import itertools
+import os
+import re
+import zipfile
+from typing import Union
+from xml.parsers import expat
+from xml.sax.saxutils import escape
+
+from .WriterScanner import TEXT, DRAW, OFFICE, OBJECT_CHARACTER, _OdtReader
+from lotemplate.Statement.ForStatement import ForStatement
+from lotemplate.Statement.HtmlStatement import HtmlStatement
+from lotemplate.Statement.IfStatement import IfStatement
+from lotemplate.Statement.TextStatement import TextStatement
+from lotemplate.Statement.CounterStatement import CounterStatement, CounterManager
+
+ODT_MIMETYPE = 'application/vnd.oasis.opendocument.text'
+OTT_MIMETYPE = 'application/vnd.oasis.opendocument.text-template'
+
+# what may separate two paragraphs following each other in the same text
+PARAGRAPHS_GAP = re.compile(rb'(?:\s|<[\w.-]+:soft-page-break\s*/>)*')
+
+
+class _Unsupported(Exception):
+    """
+    Raised when the template holds something the xml filler doesn't do the way soffice does, like an if statement
+    ending in another table cell : the template is then filled by soffice
+    """
+
+
+class _Inline:
+    """
+    An element holding some text of a paragraph, like a span
+    """
+
+    __slots__ = ('start_tag', 'end_tag')
+
+    def __init__(self, start_tag: bytes, end_tag: bytes):
+        self.start_tag = start_tag
+        self.end_tag = end_tag
+
+
+class _Item:
+    """
+    A part of a paragraph : some text, an object standing for one character (a field, a note, a frame anchored as
+    a character), a mark standing for no character (a bookmark, a frame anchored to the paragraph), or the break
+    starting a paragraph
+    """
+
+    __slots__ = ('kind', 'text', 'inlines', 'start', 'end', 'children', 'unique', 'paragraph')
+
+    def __init__(self, kind: str, text: str, inlines: tuple, start: int = 0, unique: bool = False,
+                 paragraph=None):
+        self.kind = kind
+        self.text = text
+        self.inlines = inlines
+        self.start = start
+        self.end = start
+        # the paragraphs inside the object or the mark
+        self.children = []
+        # an object or a mark that can't be copied or removed, like a note or a frame
+        self.unique = unique
+        # the paragraph started by a break
+        self.paragraph = paragraph
+
+
+class _Paragraph:
+    """
+    A paragraph of a xml part, and the items of its content
+    """
+
+    __slots__ = ('start', 'end', 'start_tag', 'end_tag', 'region', 'items', 'inlines', 'ignore_space', 'previous',
+                 'block')
+
+    def __init__(self, start: int, start_tag: bytes, region: str, previous):
+        self.start = start
+        self.end = start
+        self.start_tag = start_tag
+        self.end_tag = b''
+        self.region = region
+        self.items = []
+        # the inline elements open while reading the paragraph
+        self.inlines = []
+        self.ignore_space = True
+        # the paragraph just before this one in the same text, if any
+        self.previous = previous
+        self.block = None
+
+    def add_text(self, data: str) -> None:
+        # the white spaces are collapsed the way the ODF import of soffice does
+        for i, part in enumerate(re.split(r'[ \t\r\n]+', data)):
+            if i and not self.ignore_space:
+                self.add_raw(' ')
+                self.ignore_space = True
+            if part:
+                self.add_raw(part)
+
+    def add_raw(self, data: str) -> None:
+        self.items.append(_Item('text', data, tuple(self.inlines)))
+        self.ignore_space = False
+
+    def add_item(self, kind: str, start: int, unique: bool) -> _Item:
+        item = _Item(kind, OBJECT_CHARACTER if kind == 'object' else '', tuple(self.inlines), start, unique)
+        self.items.append(item)
+        if kind == 'object':
+            self.ignore_space = False
+        return item
+
+    def children(self) -> list:
+        return [child for item in self.items for child in item.children]
+
+
+class _Block:
+    """
+    The text of paragraphs following each other, as seen by the cursors of soffice : the paragraphs are separated
+    by line feeds. Each character of the text is owned by the item it comes from, the text replacing some
+    characters being added to the text item of the first of them.
+    """
+
+    __slots__ = ('paragraphs', 'items', 'text', 'owners', 'changed')
+
+    def __init__(self, paragraphs: list[_Paragraph]):
+        self.paragraphs = paragraphs
+        self.items = []
+        for paragraph in paragraphs:
+            paragraph.block = self
+            if paragraph is not paragraphs[0]:
+                self.items.append(_Item('break', '\n', (), paragraph=paragraph))
+            self.items += paragraph.items
+        self.text = ''.join(item.text for item in self.items)
+        self.owners = [index for index, item in enumerate(self.items) for _ in item.text]
+        self.changed = False
+
+    def text_owner(self, owners: list, start: int, end: int) -> int:
+        """
+        :return: the text item receiving the text replacing the characters from start to end : the item of the
+        first of them, or of the closest text before or after them. -1 if there is no text item
+        """
+        for index in itertools.chain(range(start, end), range(start - 1, -1, -1), range(end, len(owners))):
+            if owners[index] >= 0 and self.items[owners[index]].kind == 'text':
+                return owners[index]
+        return -1
+
+    def carry_owners(self, old: str, old_owners: list, new: str) -> list:
+        """
+        :return: the owners of the characters of new, a modified copy of old : the characters left as they were
+        keep their item
+        """
+        owners = []
+        matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                owners += old_owners[i1:i2]
+            elif j2 > j1:
+                owners += [self.text_owner(old_owners, i1, i2)] * (j2 - j1)
+        return owners
+
+    def replace(self, start: int, end: int, value: str, owners: list = None) -> None:
+        if owners is None:
+            if re.search(r'[\x00-\x08\x0b-\x1f]', value):
+                # a carriage return starts a new paragraph in soffice
+                raise _Unsupported("control character")
+            owners = [self.text_owner(self.owners, start, end)] * len(value)
+        self.text = self.text[:start] + value + self.text[end:]
+        self.owners[start:end] = owners
+        self.changed = True
+
+    def finditer(self, regex: re.Pattern, start: int = 0):
+        """
+        the matches of a statement, which can't span several paragraphs
+        """
+        for match in regex.finditer(self.text, start):
+            if '\n' in match.group(0):
+                raise _Unsupported("statement spanning several lines")
+            yield match
+
+    def search(self, regex: re.Pattern, start: int = 0) -> Union[re.Match, None]:
+        return next(self.finditer(regex, start), None)
+
+
+class _Part:
+    """
+    A xml part of an ODT file, and its paragraphs
+    """
+
+    def __init__(self, data: bytes):
+        self.data = data
+        # the paragraphs, in the order of the document
+        self.paragraphs = []
+        # the paragraphs which are not inside another paragraph
+        self.children = []
+        self.blocks = []
+        self.prefix = 'text'
+
+    def make_blocks(self) -> None:
+        groups = {}
+        for paragraph in self.paragraphs:
+            group = groups.pop(id(paragraph.previous), None) if paragraph.previous else None
+            if group is None:
+                group = []
+                self.blocks.append(group)
+            group.append(paragraph)
+            groups[id(paragraph)] = group
+        self.blocks = [_Block(group) for group in self.blocks]
+
+    def render(self) -> bytes:
+        out = []
+        self.render_range(0, len(self.data), self.children, out)
+        return b''.join(out)
+
+    def render_range(self, start: int, end: int, children: list, out: list) -> None:
+        position = start
+        for child in children:
+            out.append(self.data[position:child.start])
+            if not child.block.changed:
+                self.render_range(child.start, child.end, child.children(), out)
+            elif child is child.block.paragraphs[0]:
+                self.render_block(child.block, out)
+            position = child.end
+        out.append(self.data[position:end])
+
+    def render_block(self, block: _Block, out: list) -> None:
+        items, text, owners = block.items, block.text, block.owners
+        present = set(owners)
+        for index, item in enumerate(items):
+            if item.kind == 'mark' and item.unique:
+                # a frame anchored in a removed text would be removed by soffice
+                following = next((i for i in itertools.chain(range(index + 1, len(items)), range(index - 1, -1, -1))
+                                  if items[i].text), None)
+                if following is not None and following not in present:
+                    raise _Unsupported("removed frame")
+        opened = []
+        started = set()
+
+        def switch(inlines):
+            common = 0
+            while common < min(len(opened), len(inlines)) and opened[common] is inlines[common]:
+                common += 1
+            while len(opened) > common:
+                out.append(opened.pop().end_tag)
+            for inline in inlines[common:]:
+                out.append(inline.start_tag)
+                opened.append(inline)
+
+        def start_paragraph(paragraph):
+            start_tag = paragraph.start_tag
+            if id(paragraph) in started:
+                # the identifiers of a copied paragraph must stay unique
+                start_tag = re.sub(rb'\s(?:xml|text):id="[^"]*"', b'', start_tag)
+            started.add(id(paragraph))
+            out.append(start_tag)
+            return paragraph
+
+        def render_item(item):
+            switch(item.inlines)
+            self.render_range(item.start, item.end, item.children, out)
+
+        marks = [index for index, item in enumerate(items) if item.kind == 'mark']
+        rendered = set()
+        paragraph = start_paragraph(block.paragraphs[0])
+        i = 0
+        while i < len(text):
+            owner = owners[i]
+            item = items[owner] if owner >= 0 else None
+            j = i + 1
+            if item is None or item.kind == 'text':
+                while j < len(text) and owners[j] == owner:
+                    j += 1
+            # the marks stay before the text following them in the template
+            while marks and 0 <= marks[0] < owner:
+                render_item(items[marks.pop(0)])
+            if item is None or item.kind == 'text':
+                switch(item.inlines if item else ())
+                out.append(self.encode(text[i:j]))
+            elif item.kind == 'break':
+                switch(())
+                out.append(paragraph.end_tag)
+                paragraph = start_paragraph(item.paragraph)
+            else:
+                if item.unique and owner in rendered:
+                    raise _Unsupported("copied object")
+                rendered.add(owner)
+                render_item(item)
+            i = j
+        for mark in marks:
+            render_item(items[mark])
+        switch(())
+        out.append(paragraph.end_tag)
+
+    def encode(self, text: str) -> bytes:
+        """
+        :return: the xml of a text, its white spaces being kept by the ODF import of soffice
+        """
+        parts = re.split(r'( +|\t|\n)', text)
+        xml = []
+        for i, part in enumerate(parts):
+            if part == '\t':
+                xml.append(f'<{self.prefix}:tab/>')
+            elif part == '\n':
+                xml.append(f'<{self.prefix}:line-break/>')
+            elif part.startswith(' '):
+                if part == ' ' and 0 < i < len(parts) - 1 and parts[i - 1] and parts[i + 1]:
+                    xml.append(' ')
+                else:
+                    xml.append(f'<{self.prefix}:s {self.prefix}:c="{len(part)}"/>')
+            else:
+                xml.append(escape(part))
+        return ''.join(xml).encode()
+
+
+class _PartReader:
+    """
+    Reads the paragraphs of a xml part, and where their elements start and end
+    """
+
+    inline_elements = _OdtReader.inline_elements
+    empty_elements = _OdtReader.empty_elements
+    skipped_elements = _OdtReader.skipped_elements
+    header_elements = _OdtReader.header_elements
+    shape_elements = _OdtReader.shape_elements
+
+    def __init__(self, part: _Part):
+        self.part = part
+        self.regions = []
+        self.paragraphs = []
+        self.collectors = [part.children]
+        self.last_paragraph = None
+        # for each open element: the function to call at its end, where its start tag ends, if it is empty, and
+        # if its characters are text of the paragraph
+        self.elements = []
+        self.parser = None
+
+    def parse(self) -> None:
+        self.parser = expat.ParserCreate(namespace_separator=' ')
+        self.parser.buffer_text = True
+        self.parser.StartElementHandler = self.start
+        self.parser.EndElementHandler = self.end
+        self.parser.CharacterDataHandler = self.characters
+        self.parser.StartNamespaceDeclHandler = self.namespace
+        self.parser.Parse(self.part.data, True)
+        self.part.make_blocks()
+
+    def namespace(self, prefix: str, uri: str) -> None:
+        if uri + ' ' == TEXT and prefix:
+            self.part.prefix = prefix
+
+    def start(self, name: str, attributes: dict) -> None:
+        index = self.parser.CurrentByteIndex
+        tag_end = self.part.data.index(b'>', index) + 1
+        empty = self.part.data[tag_end - 2:tag_end] == b'/>'
+        textual = bool(self.elements) and self.elements[-1][3]
+        depth = len(self.paragraphs)
+        action = self.open(name, attributes, index, tag_end, empty, textual)
+        self.elements.append((action, tag_end, empty,
+                              len(self.paragraphs) > depth or textual and name in self.inline_elements))
+
+    def end(self, name: str) -> None:
+        action, tag_end, empty, textual = self.elements.pop()
+        index = self.parser.CurrentByteIndex
+        if action:
+            action(tag_end if empty else index, tag_end if empty else self.part.data.index(b'>', index) + 1)
+
+    def characters(self, data: str) -> None:
+        if self.elements and self.elements[-1][3]:
+            self.paragraphs[-1].add_text(data)
+
+    def push_region(self, region: Union[str, None], collector: list = None):
+        self.regions.append(region)
+        if collector is not None:
+            self.collectors.append(collector)
+
+        def pop(content_end, end):
+            self.regions.pop()
+            if collector is not None:
+                self.collectors.pop()
+        return pop
+
+    def open(self, name: str, attributes: dict, index: int, tag_end: int, empty: bool, textual: bool):
+        """
+        :return: the function to call at the end of the element, with the indexes where its content ends and
+        where it ends
+        """
+        if textual:
+            paragraph = self.paragraphs[-1]
+            if name in self.inline_elements:
+                if empty:
+                    return None
+                start_tag = self.part.data[index:tag_end]
+                qualified_name = re.match(rb'<([^\s/>]+)', start_tag).group(1)
+                paragraph.inlines.append(_Inline(start_tag, b'</' + qualified_name + b'>'))
+                return lambda content_end, end: paragraph.inlines.pop()
+            if name == TEXT + 's':
+                paragraph.add_raw(' ' * int(attributes.get(TEXT + 'c', 1)))
+            elif name == TEXT + 'tab':
+                paragraph.add_raw('\t')
+            elif name == TEXT + 'line-break':
+                paragraph.add_raw('\n')
+                paragraph.ignore_space = True
+            elif name == TEXT + 'note' or name == OFFICE + 'annotation':
+                return self.open_item(paragraph.add_item('object', index, True))
+            elif name.startswith(DRAW):
+                kind = 'object' if attributes.get(TEXT + 'anchor-type') == 'as-char' else 'mark'
+                return self.open_item(paragraph.add_item(kind, index, True))
+            elif name.startswith(TEXT) and name not in self.empty_elements and name not in self.skipped_elements:
+                # a field, standing for one character
+                return self.open_item(paragraph.add_item('object', index, False))
+            else:
+                return self.open_item(paragraph.add_item('mark', index, False))
+            return None
+
+        if name in self.skipped_elements or name.startswith(TEXT) and name.endswith('-source'):
+            return self.push_region(None)
+        if name in (TEXT + 'p', TEXT + 'h'):
+            return self.start_paragraph(index, tag_end, empty)
+        if name == OFFICE + 'text':
+            return self.push_region('body')
+        if name in self.header_elements or name in self.shape_elements:
+            return self.push_region('other')
+        if name in (TEXT + 'note-body', DRAW + 'text-box', OFFICE + 'annotation'):
+            return self.push_region('other')
+        return None
+
+    def open_item(self, item: _Item):
+        pop = self.push_region('other', item.children)
+
+        def end_item(content_end, end):
+            pop(content_end, end)
+            item.end = end
+        return end_item
+
+    def start_paragraph(self, index: int, tag_end: int, empty: bool):
+        region = self.regions[-1] if self.regions else None
+        if region is None:
+            return None
+        data = self.part.data
+        previous = self.last_paragraph
+        if not (previous and previous.region == region and PARAGRAPHS_GAP.fullmatch(data, previous.end, index)):
+            previous = None
+        start_tag = data[index:tag_end]
+        end_tag = b'</' + re.match(rb'<([^\s/>]+)', start_tag).group(1) + b'>'
+        if empty:
+            start_tag = start_tag[:-2] + b'>'
+        paragraph = _Paragraph(index, start_tag, region, previous)
+        self.collectors[-1].append(paragraph)
+        self.part.paragraphs.append(paragraph)
+        self.paragraphs.append(paragraph)
+
+        def end_paragraph(content_end, end):
+            paragraph.end = end
+            paragraph.end_tag = end_tag if empty else data[content_end:end]
+            self.paragraphs.pop()
+            self.last_paragraph = paragraph
+        return end_paragraph
+
+
+class WriterFiller:
+    """
+    Fills the ODT templates without soffice, rewriting the paragraphs of their content.xml and styles.xml. Only
+    the templates holding text variables, for, if and counter statements can be filled this way, the for and if
+    statements starting and ending in the same text, with no table or list between them. The text copied by a for
+    statement, or replacing a variable, keeps the formatting of the paragraph and of the text it comes from, even
+    if a statement is split across several spans.
+    """
+
+    @staticmethod
+    def supports(file_path: str, template_variables: dict, variables: dict) -> bool:
+        """
+        tells if a template may be filled without soffice with the given values. The fill may still find out
+        that the template needs soffice
+
+        :param file_path: the path of the template
+        :param template_variables: the variables of the template, as scanned
+        :param variables: the values to fill in the template
+        :return: True if the template is an ODT file, and all the variables are text variables or for statements
+        """
+        return (
+            os.path.splitext(file_path)[1].lower() in ('.odt', '.ott')
+            and template_variables is not None
+            and all(details['type'] in ('text', 'array') for details in template_variables.values())
+            and all(details.get('type') in ('text', 'array') for details in variables.values())
+        )
+
+    @staticmethod
+    def fill_for(block: _Block, variables: dict) -> None:
+        start_regex = re.compile(ForStatement.start_regex, re.IGNORECASE)
+        end_regex = re.compile(ForStatement.end_regex, re.IGNORECASE)
+        position = 0
+        while match := block.search(start_regex, position):
+            for_statement = ForStatement(match.group(0))
+            match_end = block.search(end_regex, match.end())
+            if match_end is None:
+                raise _Unsupported("for statement ending in another text")
+            template = block.text[match.end():match_end.start()]
+            if start_regex.search(template):
+                raise _Unsupported("nested for statement")
+            template_owners = block.owners[match.end():match_end.start()]
+            content, owners = [], []
+            foritem_vars = variables[for_statement.variable_name]['value']
+            parts = ForStatement.compile_template(template) if foritem_vars else []
+            for counter, foritem_var in enumerate(foritem_vars):
+                item = ForStatement.render_item(parts, variables, foritem_var, str(counter))
+                if re.search(r'[\x00-\x08\x0b-\x1f]', item):
+                    raise _Unsupported("control character")
+                content.append(item)
+                owners += block.carry_owners(template, template_owners, item)
+            content = ''.join(content)
+            block.replace(match.start(), match_end.end(), content, owners)
+            position = match.start() + len(content)
+
+    @staticmethod
+    def fill_if(block: _Block, variables: dict) -> None:
+        start_regex = re.compile(IfStatement.start_regex, re.IGNORECASE)
+        end_regex = re.compile(IfStatement.end_regex, re.IGNORECASE)
+        # like soffice, the last if statement is computed first
+        for match in reversed(list(block.finditer(start_regex))):
+            match_end = block.search(end_regex, match.end())
+            if match_end is None:
+                raise _Unsupported("if statement ending in another text")
+            if_statement = IfStatement(match.group(0))
+            if if_statement.get_if_result(variables[if_statement.variable_name]['value']):
+                block.replace(match_end.start(), match_end.end(), '')
+                block.replace(match.start(), match.end(), '')
+            else:
+                block.replace(match.start(), match_end.end(), '')
+        if block.search(end_regex):
+            raise _Unsupported("endif statement of an if statement of another text")
+
+    @staticmethod
+    def fill_texts(block: _Block, regex: re.Pattern, values: dict[str, str]) -> None:
+        for match in reversed(list(regex.finditer(block.text))):
+            value = values.get(match.group(0).lower())
+            if value is not None:
+                block.replace(match.start(), match.end(), value)
+
+    @staticmethod
+    def fill_counters(block: _Block, counter_list: dict) -> None:
+        matches = list(block.finditer(re.compile(CounterStatement.counter_regex, re.IGNORECASE)))
+        values = [CounterManager.counter_value(counter_list, CounterStatement(match.group(0))) for match in matches]
+        for match, value in reversed(list(zip(matches, values))):
+            block.replace(match.start(), match.end(), value)
+
+    @staticmethod
+    def fill_parts(parts: list[_Part], variables: dict) -> None:
+        """
+        fills the texts of the parts in the order soffice does : the for statements, the if statements, the text
+        variables, then the counters. The statements are searched in the body only, the text variables everywhere
+        """
+        blocks = [block for part in parts for block in part.blocks]
+        body = [block for block in blocks if block.paragraphs[0].region == 'body']
+        if any(re.search(HtmlStatement.start_regex, block.text, re.IGNORECASE) for block in body):
+            raise _Unsupported("html statement")
+        for block in body:
+            WriterFiller.fill_for(block, variables)
+        for block in body:
+            WriterFiller.fill_if(block, variables)
+        names = [var for var, details in variables.items() if details['type'] == 'text']
+        if names:
+            regex = re.compile(TextStatement.names_regex(names), re.IGNORECASE)
+            values = TextStatement.text_values({var: variables[var] for var in names})
+            for block in blocks:
+                WriterFiller.fill_texts(block, regex, values)
+        counter_list = {}
+        for block in body:
+            WriterFiller.fill_counters(block, counter_list)
+
+    @staticmethod
+    def fill(data: bytes, variables: dict[str, dict[str, Union[str, list[str]]]]) -> Union[bytes, None]:
+        """
+        fills an ODT template with the given values
+
+        :param data: the content of the template
+        :param variables: the values to fill in the template, checked against the variables of the template
+        :return: the content of the filled document, as an ODT file, or None if the template must be filled by
+        soffice
+        """
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            parts = {}
+            for name in ('content.xml', 'styles.xml'):
+                if name in archive.namelist():
+                    parts[name] = _Part(archive.read(name))
+                    _PartReader(parts[name]).parse()
+            try:
+                WriterFiller.fill_parts(list(parts.values()), variables)
+                contents = {name: part.render() for name, part in parts.items()}
+            except _Unsupported as e:
+                print(f"##### the template can't be filled from its xml ({e}), filling it with soffice #####")
+                return None
+
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as filled:
+                for info in archive.infolist():
+                    content = contents[info.filename] if info.filename in contents else archive.read(info)
+                    # the filled document is a text document, even if the template is a text template
+                    if info.filename == 'mimetype':
+                        content = content.replace(OTT_MIMETYPE.encode(), ODT_MIMETYPE.encode())
+                    elif info.filename == 'META-INF/manifest.xml':
+                        content = content.replace(b'"' + OTT_MIMETYPE.encode() + b'"',
+                                                  b'"' + ODT_MIMETYPE.encode() + b'"')
+                    filled.writestr(info, content)
+        return buffer.getvalue()
@@ -0,0 +1,82 @@
+"""
+Copyright (C) 2023 Probesys
+
+
+The end of a text document, seen as a document by the statements filling it
+"""
+
+__all__ = (
+    'WriterRange',
+)
+
+from com.sun.star.lang import IllegalArgumentException
+
+
+class WriterRange:
+    """
+    The end of a text document, from a position of its body, given to the statements in place of the document :
+    the searches start at this position, and the shapes anchored before it are left out. The text frames searched
+    are the given ones, the headers and the footers are never searched.
+    Used to fill the instance of the template inserted last at the end of a merged document, without searching the
+    instances already filled.
+    """
+
+    def __init__(self, doc, start, frames=()):
+        """
+        :param doc: the document
+        :param start: the position of the body where the range starts
+        :param frames: the text frames of the range
+        """
+        self.doc = doc
+        self.start = start
+        self.frames = frames
+        self.body = doc.getText()
+
+    def __getattr__(self, name):
+        # the descriptors, the tables and the images are given by the document
+        return getattr(self.doc, name)
+
+    def __repr__(self):
+        return f"<WriterRange object :'doc'={self.doc!r}>"
+
+    def in_range(self, text_range) -> bool:
+        """
+        :param text_range: a text range of the document
+        :return: True if the text range is in the body, after the start of the range
+        """
+        try:
+            return self.body.compareRegionStarts(self.start, text_range) == 1
+        except IllegalArgumentException:
+            return False
+
+    def findFirst(self, search):
+        return self.doc.findNext(self.start, search)
+
+    def findNext(self, start, search):
+        return self.doc.findNext(start, search)
+
+    def findAll(self, search) -> list:
+        """
+        :param search: the search descriptor
+        :return: the text ranges found in the body from the start of the range, then in the text frames
+        """
+        founded = []
+        x_found = self.doc.findNext(self.start, search)
+        while x_found:
+            founded.append(x_found)
+            x_found = self.doc.findNext(x_found.End, search)
+        for frame in self.frames:
+            text = frame.getText()
+            x_found = self.doc.findNext(text.getStart(), search)
+            while x_found:
+                try:
+                    text.compareRegionStarts(text.getStart(), x_found)
+                except IllegalArgumentException:
+                    # the search went on out of the frame
+                    break
+                founded.append(x_found)
+                x_found = self.doc.findNext(x_found.End, search)
+        return founded
+
+    def getDrawPages(self) -> list[list]:
+        return [[shape for shape in page if self.in_range(shape.getAnchor())] for page in self.doc.getDrawPages()]
@@ -0,0 +1,926 @@
+"""
+Copyright (C) 2023 Probesys
+
+
+The scanner of the text templates, reading the ODT and DOCX files without soffice, or the other documents once
+loaded in soffice
+"""
+
+__all__ = (
+    'WriterContent',
+    'WriterScanner',
+)
+
+import os
+import posixpath
+import re
+import zipfile
+from typing import Union
+from xml.etree import ElementTree
+from xml.parsers import expat
+
+from sorcery import dict_of
+from com.sun.star.beans import UnknownPropertyException
+from com.sun.star.uno import RuntimeException
+
+from . import errors
+from lotemplate.Statement.ForStatement import ForStatement
+from lotemplate.Statement.HtmlStatement import HtmlStatement
+from lotemplate.Statement.IfStatement import IfStatement
+from lotemplate.Statement.TextStatement import TextStatement
+from lotemplate.Statement.TableStatement import TableStatement
+from lotemplate.Statement.ImageStatement import ImageStatement
+
+# the namespaces of the xml parts, as named by expat
+TEXT = 'urn:oasis:names:tc:opendocument:xmlns:text:1.0 '
+TABLE = 'urn:oasis:names:tc:opendocument:xmlns:table:1.0 '
+DRAW = 'urn:oasis:names:tc:opendocument:xmlns:drawing:1.0 '
+OFFICE = 'urn:oasis:names:tc:opendocument:xmlns:office:1.0 '
+STYLE = 'urn:oasis:names:tc:opendocument:xmlns:style:1.0 '
+SVG = 'urn:oasis:names:tc:opendocument:xmlns:svg-compatible:1.0 '
+W = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main '
+WP = 'http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing '
+A = 'http://schemas.openxmlformats.org/drawingml/2006/main '
+WPS = 'http://schemas.openxmlformats.org/drawingml/2006/wordprocessingShape '
+MC = 'http://schemas.openxmlformats.org/markup-compatibility/2006 '
+R = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships '
+V = 'urn:schemas-microsoft-com:vml '
+
+# the character standing for a field, a note or an object anchored as a character, as in the paragraphs of soffice
+OBJECT_CHARACTER = '\ufffc'
+
+
+class WriterContent:
+    """
+    The text of a text document, as seen by the searches of soffice: the regexes match inside one paragraph only.
+    The searches started with findFirst only go through the body of the document, findAll goes through everything.
+    """
+
+    def __repr__(self):
+        return (
+            f"<WriterContent object :{len(self.body)} body paragraphs, {len(self.other)} other paragraphs, "
+            f"{len(self.tables)} tables, {len(self.shapes)} shapes, {len(self.images)} images>"
+        )
+
+    def __init__(self):
+        # the paragraphs of the body, the cells of its tables included, in the order of the document
+        self.body = []
+        # the paragraphs out of the body: headers, footers, notes and frames
+        self.other = []
+        # (name, rows of cell strings) of each table, rows being None if the cells of the table can't be read as
+        # a data array, like a table with merged columns
+        self.tables = []
+        # the text of each frame and drawing shape of the draw page
+        self.shapes = []
+        # (name, description) of each image
+        self.images = []
+
+
+class _Paragraph:
+    """
+    A paragraph being read, the white spaces being collapsed the way the ODF import of soffice does
+    """
+
+    __slots__ = ('pieces', 'ignore_space')
+
+    def __init__(self):
+        self.pieces = []
+        self.ignore_space = True
+
+    def add_text(self, data: str) -> None:
+        for i, part in enumerate(re.split(r'[ \t\r\n]+', data)):
+            if i and not self.ignore_space:
+                self.pieces.append(' ')
+                self.ignore_space = True
+            if part:
+                self.pieces.append(part)
+                self.ignore_space = False
+
+    def add_raw(self, data: str) -> None:
+        self.pieces.append(data)
+        self.ignore_space = False
+
+    def text(self) -> str:
+        return ''.join(self.pieces)
+
+
+class _Reader:
+    """
+    The state shared by the readers of the xml parts: the region of the document being read, and the open
+    paragraphs and text containers (table cells, frames, shapes, notes) the paragraphs are added to
+    """
+
+    def __init__(self, content: WriterContent):
+        self.content = content
+        self.regions = []
+        self.containers = []
+        self.paragraphs = []
+        self.actions = []
+        self.skip = 0
+
+    def parse(self, file) -> None:
+        parser = expat.ParserCreate(namespace_separator=' ')
+        parser.buffer_text = True
+        parser.StartElementHandler = self.start
+        parser.EndElementHandler = self.end
+        parser.CharacterDataHandler = self.characters
+        parser.ParseFile(file)
+
+    def start(self, name: str, attributes: dict) -> None:
+        if self.skip:
+            self.skip += 1
+            return
+        action = self.open(name, attributes)
+        if action is False:
+            self.skip = 1
+        else:
+            self.actions.append(action)
+
+    def end(self, name: str) -> None:
+        if self.skip:
+            self.skip -= 1
+            return
+        action = self.actions.pop()
+        if action:
+            action()
+
+    def characters(self, data: str) -> None:
+        pass
+
+    def open(self, name: str, attributes: dict):
+        """
+        :return: the function to call at the end of the element, or False to ignore the element and its content
+        """
+        return None
+
+    def push_region(self, region: Union[str, None], container: list = None):
+        """
+        enters a region of the document, and optionally a new text container
+
+        :return: the function leaving them
+        """
+        self.regions.append(region)
+        if container is not None:
+            self.containers.append(container)
+
+        def pop():
+            self.regions.pop()
+            if container is not None:
+                self.containers.pop()
+        return pop
+
+    def start_paragraph(self):
+        self.paragraphs.append(_Paragraph())
+        return self.end_paragraph
+
+    def end_paragraph(self) -> None:
+        text = self.paragraphs.pop().text()
+        region = self.regions[-1] if self.regions else None
+        if region == 'body':
+            self.content.body.append(text)
+        elif region == 'other':
+            self.content.other.append(text)
+        if self.containers:
+            self.containers[-1].append(text)
+
+
+class _OdtReader(_Reader):
+    """
+    Reads the content.xml and styles.xml parts of an ODT file
+    """
+
+    inline_elements = {TEXT + name for name in ('span', 'a', 'meta', 'ruby', 'ruby-base')}
+    empty_elements = {TEXT + name for name in (
+        'bookmark', 'bookmark-start', 'bookmark-end', 'reference-mark', 'reference-mark-start',
+        'reference-mark-end', 'soft-page-break', 'change', 'change-start', 'change-end', 'toc-mark-start',
+        'toc-mark-end', 'alphabetical-index-mark-start', 'alphabetical-index-mark-end', 'user-index-mark-start',
+        'user-index-mark-end', 'number',
+    )} | {OFFICE + 'annotation-end'}
+    skipped_elements = {TEXT + name for name in (
+        'tracked-changes', 'sequence-decls', 'variable-decls', 'user-field-decls', 'dde-connection-decls',
+        'note-citation', 'ruby-text',
+    )} | {OFFICE + 'forms', OFFICE + 'event-listeners', SVG + 'title', DRAW + 'enhanced-geometry'}
+    header_elements = {STYLE + name for name in (
+        'header', 'footer', 'header-left', 'footer-left', 'header-first', 'footer-first'
+    )}
+    shape_elements = {DRAW + name for name in (
+        'custom-shape', 'rect', 'ellipse', 'circle', 'polygon', 'polyline', 'path', 'line', 'connector',
+        'caption', 'measure', 'regular-polygon',
+    )}
+
+    def __init__(self, content: WriterContent):
+        super().__init__(content)
+        # tells for each open element if its characters are text of the paragraph
+        self.textual = []
+        self.tables = []
+        self.frames = []
+        self.description = None
+        self.groups = 0
+
+    def start(self, name: str, attributes: dict) -> None:
+        if self.skip:
+            self.skip += 1
+            return
+        textual = bool(self.textual) and self.textual[-1]
+        super().start(name, attributes)
+        if not self.skip:
+            self.textual.append(name in (TEXT + 'p', TEXT + 'h')
+                                or textual and name in self.inline_elements)
+
+    def end(self, name: str) -> None:
+        if not self.skip:
+            self.textual.pop()
+        super().end(name)
+
+    def characters(self, data: str) -> None:
+        if self.skip:
+            return
+        if self.description is not None:
+            self.description.append(data)
+        elif self.textual and self.textual[-1]:
+            self.paragraphs[-1].add_text(data)
+
+    def open(self, name: str, attributes: dict):
+        in_paragraph = bool(self.textual) and self.textual[-1]
+        if in_paragraph:
+            paragraph = self.paragraphs[-1]
+            if name in self.inline_elements or name in self.empty_elements:
+                return None
+            if name == TEXT + 's':
+                paragraph.add_raw(' ' * int(attributes.get(TEXT + 'c', 1)))
+                return None
+            if name == TEXT + 'tab':
+                paragraph.add_raw('\t')
+                return None
+            if name == TEXT + 'line-break':
+                paragraph.add_raw('\n')
+                paragraph.ignore_space = True
+                return None
+            if name == TEXT + 'note':
+                paragraph.add_raw(OBJECT_CHARACTER)
+                return None
+            if name.startswith(DRAW):
+                if attributes.get(TEXT + 'anchor-type') == 'as-char':
+                    paragraph.add_raw(OBJECT_CHARACTER)
+            elif name.startswith(TEXT) or name == OFFICE + 'annotation':
+                # a field, only its placeholder is searchable
+                paragraph.add_raw(OBJECT_CHARACTER)
+                return False
+            elif name not in self.skipped_elements:
+                return False
+
+        if name in self.skipped_elements or name.startswith(TEXT) and name.endswith('-source'):
+            return False
+        if name == OFFICE + 'annotation':
+            return False
+        if name in (TEXT + 'p', TEXT + 'h'):
+            return self.start_paragraph() if self.regions else None
+        if name == OFFICE + 'text':
+            return self.push_region('body')
+        if name in self.header_elements:
+            return self.push_region('other')
+        if name == TEXT + 'note-body':
+            return self.push_region('other', [])
+        if name == TABLE + 'table':
+            return self.open_table(attributes)
+        if name == TABLE + 'table-row':
+            return self.open_row(attributes)
+        if name in (TABLE + 'table-cell', TABLE + 'covered-table-cell'):
+            return self.open_cell(attributes)
+        if name == DRAW + 'frame':
+            return self.open_frame(attributes)
+        if self.frames and name in (DRAW + 'image', DRAW + 'object', DRAW + 'object-ole'):
+            if self.frames[-1]['kind'] is None:
+                self.frames[-1]['kind'] = 'image' if name == DRAW + 'image' else 'object'
+            return False
+        if self.frames and name == DRAW + 'text-box':
+            frame = self.frames[-1]
+            frame['kind'] = frame['kind'] or 'text'
+            pop = self.push_region('other', frame['text'])
+            return pop
+        if self.frames and name == SVG + 'desc':
+            self.description = self.frames[-1]['description']
+
+            def end_description():
+                self.description = None
+            return end_description
+        if name in self.shape_elements:
+            return self.open_shape()
+        if name == DRAW + 'g':
+            self.groups += 1
+
+            def end_group():
+                self.groups -= 1
+            return end_group
+        return None
+
+    def open_table(self, attributes: dict):
+        # soffice creates the tables, and numbers them, in the order they start
+        index = len(self.content.tables)
+        self.content.tables.append(None)
+        table = {'name': attributes.get(TABLE + 'name', ''), 'rows': [], 'regular': True}
+        self.tables.append(table)
+
+        def end_table():
+            self.tables.pop()
+            self.content.tables[index] = (table['name'], table['rows'] if table['regular'] else None)
+        return end_table
+
+    def open_row(self, attributes: dict):
+        if not self.tables:
+            return None
+        row = []
+        table = self.tables[-1]
+        table['rows'].append(row)
+
+        def end_row():
+            for _ in range(int(attributes.get(TABLE + 'number-rows-repeated', 1)) - 1):
+                table['rows'].append(list(row))
+        return end_row
+
+    def open_cell(self, attributes: dict):
+        if not self.tables or not self.tables[-1]['rows']:
+            return None
+        table = self.tables[-1]
+        row = table['rows'][-1]
+        if int(attributes.get(TABLE + 'number-columns-spanned', 1)) > 1:
+            table['regular'] = False
+        paragraphs = []
+        self.containers.append(paragraphs)
+
+        def end_cell():
+            self.containers.pop()
+            row.extend(['\n'.join(paragraphs)] * int(attributes.get(TABLE + 'number-columns-repeated', 1)))
+        return end_cell
+
+    def open_frame(self, attributes: dict):
+        frame = {'name': attributes.get(DRAW + 'name', ''), 'kind': None, 'description': [], 'text': []}
+        self.frames.append(frame)
+
+        def end_frame():
+            self.frames.pop()
+            # the grouped pictures and frames are drawing shapes of the group, out of the draw page
+            if self.groups:
+                return
+            if frame['kind'] == 'image':
+                self.content.images.append((frame['name'], ''.join(frame['description'])))
+            elif frame['kind'] == 'text':
+                self.content.shapes.append('\n'.join(frame['text']))
+        return end_frame
+
+    def open_shape(self):
+        paragraphs = []
+        pop = self.push_region('shape', paragraphs)
+        in_group = self.groups
+
+        def end_shape():
+            pop()
+            if not in_group:
+                self.content.shapes.append('\n'.join(paragraphs))
+        return end_shape
+
+
+
+class _DocxReader(_Reader):
+    """
+    Reads the main part of a DOCX file, and its headers, footers and notes
+    """
+
+    skipped_elements = {W + name for name in (
+        'tabs', 'rPr', 'sdtPr', 'sdtEndPr', 'tblPr', 'tblGrid', 'object', 'rubyPr', 'rt', 'commentReference',
+    )} | {MC + 'Fallback'}
+    # the fields soffice imports as plain text, or as paragraphs
+    text_fields = ('HYPERLINK', 'TOC', 'INDEX', 'BIBLIOGRAPHY')
+
+    def __init__(self, content: WriterContent):
+        super().__init__(content)
+        self.references = []
+        self.fields = []
+        self.instruction = False
+        self.collect = False
+        self.tables = []
+        self.drawings = []
+        self.alternates = []
+        self.groups = 0
+        self.table_count = 0
+        self.found = False
+
+    def visible(self) -> bool:
+        return all(field['result'] and field['keep'] for field in self.fields)
+
+    def characters(self, data: str) -> None:
+        if self.skip:
+            return
+        if self.instruction and self.fields:
+            self.fields[-1]['instruction'].append(data)
+        elif self.collect and self.paragraphs and self.visible():
+            self.paragraphs[-1].add_raw(data)
+
+    def add(self, text: str) -> None:
+        if self.paragraphs and self.visible():
+            self.paragraphs[-1].add_raw(text)
+
+    def open(self, name: str, attributes: dict):
+        if name in self.skipped_elements:
+            return False
+        if name == MC + 'AlternateContent':
+            self.alternates.append(False)
+
+            def end_alternate():
+                self.alternates.pop()
+            return end_alternate
+        if name == MC + 'Choice':
+            # soffice reads the first choice, as the drawingml one comes first
+            if self.alternates and self.alternates[-1]:
+                return False
+            if self.alternates:
+                self.alternates[-1] = True
+            return None
+        if name == W + 'document':
+            self.found = True
+            return None
+        if name == W + 'body':
+            return self.push_region('body')
+        if name in (W + 'hdr', W + 'ftr'):
+            return self.push_region('other')
+        if name in (W + 'footnote', W + 'endnote'):
+            if attributes.get(W + 'type') in ('separator', 'continuationSeparator', 'continuationNotice'):
+                return False
+            return self.push_region('other', [])
+        if name in (W + 'headerReference', W + 'footerReference'):
+            self.references.append(attributes.get(R + 'id'))
+            return None
+        if name == W + 'p':
+            return self.start_paragraph() if self.regions else None
+        if name in (W + 't', W + 'delText'):
+            self.collect = True
+
+            def end_text():
+                self.collect = False
+            return end_text
+        if name == W + 'instrText':
+            self.instruction = True
+
+            def end_instruction():
+                self.instruction = False
+            return end_instruction
+        if name in (W + 'tab', W + 'ptab'):
+            self.add('\t')
+        elif name == W + 'br':
+            if attributes.get(W + 'type') in ('page', 'column') and self.paragraphs:
+                # soffice splits the paragraph at a page break
+                self.end_paragraph()
+                self.paragraphs.append(_Paragraph())
+            else:
+                self.add('\n')
+        elif name == W + 'cr':
+            self.add('\n')
+        elif name == W + 'noBreakHyphen':
+            self.add('\u2011')
+        elif name == W + 'softHyphen':
+            self.add('\u00ad')
+        elif name in (W + 'sym', W + 'footnoteReference', W + 'endnoteReference'):
+            self.add(OBJECT_CHARACTER)
+        elif name == W + 'fldChar':
+            self.field_character(attributes.get(W + 'fldCharType'))
+        elif name == W + 'fldSimple':
+            if attributes.get(W + 'instr', '').split()[:1] and (
+                    attributes[W + 'instr'].split()[0].upper() in self.text_fields):
+                return None
+            self.add(OBJECT_CHARACTER)
+            return False
+        elif name == W + 'tbl':
+            return self.open_table()
+        elif name == W + 'tr':
+            if self.tables:
+                self.tables[-1]['rows'].append([])
+        elif name == W + 'tc':
+            return self.open_cell()
+        elif name in (W + 'gridSpan', W + 'gridBefore', W + 'gridAfter'):
+            if self.tables and int(attributes.get(W + 'val', 1)) > (name == W + 'gridSpan'):
+                self.tables[-1]['regular'] = False
+        elif name in (W + 'drawing', W + 'pict'):
+            return self.open_drawing()
+        elif name == WP + 'inline':
+            self.add(OBJECT_CHARACTER)
+        elif name == WP + 'docPr' and self.drawings:
+            self.drawings[-1].update(name=attributes.get('name', ''), description=attributes.get('descr', ''))
+        elif name == A + 'graphicData' and self.drawings:
+            kind = attributes.get('uri', '').split('/')[-1]
+            if kind == 'wordprocessingGroup':
+                self.groups += 1
+
+                def end_group():
+                    self.groups -= 1
+                return end_group
+            if kind not in ('picture', 'wordprocessingShape'):
+                return False
+            self.drawings[-1]['kind'] = self.drawings[-1]['kind'] or kind
+        elif name in (WPS + 'txbx', V + 'textbox') and self.drawings:
+            drawing = self.drawings[-1]
+            if not self.groups:
+                drawing['kind'] = drawing['kind'] or 'wordprocessingShape'
+            return self.push_region('other', drawing['text'])
+        return None
+
+    def field_character(self, field_type: str) -> None:
+        if field_type == 'begin':
+            self.fields.append({'instruction': [], 'result': False, 'keep': False})
+        elif field_type == 'separate' and self.fields:
+            field = self.fields[-1]
+            instruction = ''.join(field['instruction']).split()
+            field['result'] = True
+            field['keep'] = bool(instruction) and instruction[0].upper() in self.text_fields
+        elif field_type == 'end' and self.fields:
+            field = self.fields.pop()
+            if not field['keep']:
+                self.add(OBJECT_CHARACTER)
+
+    def open_table(self):
+        table = {'rows': [], 'regular': True}
+        self.tables.append(table)
+
+        def end_table():
+            self.tables.pop()
+            # soffice creates a table once it has been read, so an inner table comes before its outer table
+            self.table_count += 1
+            rows = table['rows']
+            if len({len(row) for row in rows}) > 1:
+                table['regular'] = False
+            self.content.tables.append((f"Table{self.table_count}", rows if table['regular'] else None))
+        return end_table
+
+    def open_cell(self):
+        if not self.tables or not self.tables[-1]['rows']:
+            return None
+        row = self.tables[-1]['rows'][-1]
+        paragraphs = []
+        self.containers.append(paragraphs)
+
+        def end_cell():
+            self.containers.pop()
+            row.append('\n'.join(paragraphs))
+        return end_cell
+
+    def open_drawing(self):
+        drawing = {'name': '', 'description': '', 'kind': None, 'text': []}
+        self.drawings.append(drawing)
+        in_group = self.groups
+
+        def end_drawing():
+            self.drawings.pop()
+            if in_group:
+                return
+            if drawing['kind'] == 'picture':
+                self.content.images.append((drawing['name'], drawing['description']))
+            elif drawing['kind'] == 'wordprocessingShape':
+                self.content.shapes.append('\n'.join(drawing['text']))
+        return end_drawing
+
+
+class WriterScanner:
+    """
+    Scans the ODT and DOCX templates from their xml, giving the same variables and raising the same errors as
+    the scan of the document loaded in soffice
+    """
+
+    odt_mimetypes = ('application/vnd.oasis.opendocument.text', 'application/vnd.oasis.opendocument.text-template')
+    docx_content_types = (
+        'application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml',
+        'application/vnd.openxmlformats-officedocument.wordprocessingml.template.main+xml',
+        'application/vnd.ms-word.document.macroEnabled.main+xml',
+        'application/vnd.ms-word.template.macroEnabledTemplate.main+xml',
+    )
+
+    @staticmethod
+    def main_part(archive: zipfile.ZipFile) -> Union[str, None]:
+        """
+        :param archive: the zip archive of the document
+        :return: the part holding the body: content.xml for an ODT file, the main document part for a DOCX file,
+        or None if the file is not a text document
+        """
+        names = archive.namelist()
+        if 'mimetype' in names:
+            return 'content.xml' if archive.read('mimetype').decode().strip() in WriterScanner.odt_mimetypes else None
+        if '[Content_Types].xml' in names:
+            return next((
+                override.get('PartName', '').lstrip('/')
+                for override in ElementTree.fromstring(archive.read('[Content_Types].xml'))
+                if override.tag.endswith('Override') and override.get('ContentType') in WriterScanner.docx_content_types
+            ), None)
+        return None
+
+    @staticmethod
+    def supports(file_path: str) -> bool:
+        """
+        :param file_path: the path of the template
+        :return: whether the template can be scanned without soffice
+        """
+        if os.path.splitext(file_path)[1].lower() not in ('.odt', '.ott', '.docx', '.docm', '.dotx', '.dotm') \
+                or not zipfile.is_zipfile(file_path):
+            return False
+        try:
+            with zipfile.ZipFile(file_path) as archive:
+                return WriterScanner.main_part(archive) is not None
+        except (zipfile.BadZipFile, ElementTree.ParseError, KeyError):
+            return False
+
+    @staticmethod
+    def relations(archive: zipfile.ZipFile, part: str) -> dict[str, tuple[str, str]]:
+        """
+        :param archive: the zip archive of an office open xml document
+        :param part: the path of a part
+        :return: the type and the path of the parts related to the given part, by relation id
+        """
+        directory, name = posixpath.split(part)
+        rels_path = posixpath.join(directory, '_rels', name + '.rels')
+        if rels_path not in archive.namelist():
+            return {}
+        relations = {}
+        for relation in ElementTree.fromstring(archive.read(rels_path)):
+            target = relation.get('Target', '')
+            if relation.get('TargetMode') != 'External':
+                relations[relation.get('Id')] = (
+                    relation.get('Type', '').split('/')[-1],
+                    target.lstrip('/') if target.startswith('/') else
+                    posixpath.normpath(posixpath.join(directory, target))
+                )
+        return relations
+
+    @staticmethod
+    def read_odt(archive: zipfile.ZipFile) -> WriterContent:
+        content = WriterContent()
+        reader = _OdtReader(content)
+        # the headers and footers are read first, as by soffice
+        if 'styles.xml' in archive.namelist():
+            with archive.open('styles.xml') as f:
+                reader.parse(f)
+        with archive.open('content.xml') as f:
+            reader.parse(f)
+        return content
+
+    @staticmethod
+    def read_docx(archive: zipfile.ZipFile, main_part: str) -> WriterContent:
+        relations = WriterScanner.relations(archive, main_part)
+        content = WriterContent()
+        reader = _DocxReader(content)
+        with archive.open(main_part) as f:
+            reader.parse(f)
+        if not reader.found:
+            raise ValueError("unsupported wordprocessingml namespace")
+        parts = [relations[reference][1] for reference in dict.fromkeys(reader.references) if reference in relations]
+        parts += [target for kind, target in relations.values() if kind in ('footnotes', 'endnotes')]
+        for part in parts:
+            if part in archive.namelist():
+                with archive.open(part) as f:
+                    reader.parse(f)
+        return content
+
+    @staticmethod
+    def read(file_path: str) -> WriterContent:
+        """
+        :param file_path: the path of an ODT or DOCX template
+        :return: the text content of the template
+        """
+        with zipfile.ZipFile(file_path) as archive:
+            main_part = WriterScanner.main_part(archive)
+            if main_part is None:
+                raise ValueError("not a text document")
+            if main_part == 'content.xml':
+                return WriterScanner.read_odt(archive)
+            return WriterScanner.read_docx(archive, main_part)
+
+    @staticmethod
+    def read_text(text, paragraphs: list[str]) -> None:
+        """
+        reads the paragraphs of a text of a document loaded in soffice, the cells of its tables included
+
+        :param text: the text to read: the body, a header, a footer, a note, a frame or a table cell
+        :param paragraphs: the list the paragraphs are added to
+        """
+        for element in text.createEnumeration():
+            if element.supportsService('com.sun.star.text.TextTable'):
+                for cell_name in element.getCellNames():
+                    WriterScanner.read_text(element.getCellByName(cell_name), paragraphs)
+            else:
+                paragraphs.append(element.getString())
+
+    @staticmethod
+    def read_doc(doc) -> WriterContent:
+        """
+        reads the text content of a document loaded in soffice in one pass, so that it's scanned without searching
+        the document again for each kind of statement. The fields are read with their displayed text.
+
+        :param doc: the text document
+        :return: the text content of the document
+        """
+        content = WriterContent()
+        WriterScanner.read_text(doc.getText(), content.body)
+
+        page_styles = doc.getStyleFamilies().getByName('PageStyles')
+        for style_name in page_styles.getElementNames():
+            style = page_styles.getByName(style_name)
+            for part in ('Header', 'Footer'):
+                if not style.getPropertyValue(part + 'IsOn'):
+                    continue
+                for suffix in ('', 'Left', 'First'):
+                    try:
+                        text = style.getPropertyValue(part + 'Text' + suffix)
+                    except UnknownPropertyException:
+                        continue
+                    if text is not None:
+                        WriterScanner.read_text(text, content.other)
+        for notes in (doc.getFootnotes(), doc.getEndnotes()):
+            for note in notes:
+                WriterScanner.read_text(note, content.other)
+
+        for table in doc.getTextTables():
+            try:
+                rows = [[cell if isinstance(cell, str) else '' for cell in row] for row in table.getDataArray()]
+            except RuntimeException:
+                rows = None
+            content.tables.append((table.getName(), rows))
+        for shape in doc.getDrawPage():
+            if shape.supportsService('com.sun.star.text.TextFrame'):
+                paragraphs = []
+                WriterScanner.read_text(shape.getText(), paragraphs)
+                content.other += paragraphs
+                content.shapes.append('\n'.join(paragraphs))
+                continue
+            try:
+                content.shapes.append(shape.String)
+            except (AttributeError, UnknownPropertyException):
+                continue
+        for image in doc.getGraphicObjects():
+            content.images.append((image.LinkDisplayName, image.Description))
+        return content
+
+    @staticmethod
+    def find_all(regex_string: str, paragraphs: list[str]) -> list[tuple[int, int, int, str]]:
+        """
+        :param regex_string: the regex searched without case sensitivity, as by the searches of soffice
+        :param paragraphs: the paragraphs to search in
+        :return: the position (paragraph, start, end) and the string of every match, in the order of the document
+        """
+        regex = re.compile(regex_string, re.IGNORECASE)
+        return [
+            (paragraph_i, match.start(), match.end(), match.group(0))
+            for paragraph_i, paragraph in enumerate(paragraphs) for match in regex.finditer(paragraph)
+        ]
+
+    @staticmethod
+    def has_next(matches: list[tuple[int, int, int, str]], paragraph_i: int, end: int) -> bool:
+        """
+        :return: whether one of the matches is found by a findNext from the given end of a match
+        """
+        return bool(matches) and matches[-1][:2] >= (paragraph_i, end)
+
+    @staticmethod
+    def scan_text(content: WriterContent) -> dict[str, dict[str, str]]:
+        plain_vars = {}
+        for *_, var in WriterScanner.find_all(TextStatement.text_regex_as_string, content.other + content.body):
+            key_name = var[1:]
+            if not re.search(ForStatement.forindex_regex, key_name, re.IGNORECASE):
+                plain_vars[key_name] = {'type': 'text', 'value': ''}
+
+        text_fields_vars = {}
+        for shape in content.shapes:
+            text_fields_vars = (text_fields_vars | {
+                var.group(0)[1:]: {'type': 'text', 'value': ''} for var in TextStatement.text_regex.finditer(shape)
+            })
+
+        for var in WriterScanner.scan_table(content, get_list=True):
+            if var.startswith("$"):
+                var = var[1:]
+            if var in plain_vars:
+                del plain_vars[var]
+
+        for var in WriterScanner.scan_for(content):
+            if var in plain_vars:
+                del plain_vars[var]
+
+        return plain_vars | text_fields_vars
+
+    @staticmethod
+    def scan_table(content: WriterContent, get_list=False) -> Union[dict, list]:
+        tab_vars = {}
+        list_tab_vars = []
+        for t_name, table_data in content.tables:
+            if table_data is None:
+                continue
+            nb_rows = len(table_data)
+            for row_i, row in enumerate(table_data):
+                for cell in row:
+                    for match in TableStatement.table_regex.finditer(cell):
+                        if not match.captures('var'):
+                            continue
+                        if row_i != nb_rows - 1:
+                            raise errors.TemplateError(
+                                'variable_not_in_last_row',
+                                f"The variable {match[0]!r} (table {t_name!r}) "
+                                f"isn't in the last row (got: row {row_i + 1!r}, "
+                                f"expected: row {nb_rows!r})",
+                                dict(table=t_name, actual_row=row_i + 1,
+                                     expected_row=nb_rows, variable=match[0])
+                            )
+                        tab_vars[match[0][1:]] = {'type': 'table', 'value': ['']}
+                        list_tab_vars.append(match[0])
+        return list_tab_vars if get_list else tab_vars
+
+    @staticmethod
+    def tables_layout(content: WriterContent) -> Union[dict[str, list[str]], None]:
+        """
+        gives the table variables of each table, to fill the tables without searching them in the document
+
+        :param content: the text content of the document
+        :return: the table variables of the last row of each table holding some, by table name, or None if two
+        tables have the same name
+        """
+        names = [t_name for t_name, _ in content.tables]
+        if len(set(names)) != len(names):
+            return None
+        layout = {}
+        for t_name, table_data in content.tables:
+            if not table_data:
+                continue
+            table_vars = [
+                match[0] for cell in table_data[-1] for match in TableStatement.table_regex.finditer(cell)
+                if match.captures('var')
+            ]
+            if table_vars:
+                layout[t_name] = list(dict.fromkeys(table_vars))
+        return layout
+
+    @staticmethod
+    def scan_image(content: WriterContent) -> dict[str, dict[str, str]]:
+        imgs = {}
+        for name, description in content.images:
+            if ImageStatement.image_regex.fullmatch(name):
+                imgs[name[1:]] = {'type': 'image', 'value': ''}
+            elif ImageStatement.image_regex.fullmatch(description):
+                imgs[description[1:]] = {'type': 'image', 'value': ''}
+        return imgs
+
+    @staticmethod
+    def scan_for(content: WriterContent) -> dict[str, dict[str, list]]:
+        endfors = WriterScanner.find_all(ForStatement.end_regex, content.body)
+        for_vars = {}
+        for paragraph_i, start, end, string in WriterScanner.find_all(ForStatement.start_regex_light, content.body):
+            for_statement = ForStatement(string)
+            if not WriterScanner.has_next(endfors, paragraph_i, end):
+                raise errors.TemplateError(
+                    'no_endfor_found',
+                    f"The statement {for_statement.for_string} has no endfor",
+                    dict_of(for_statement.for_string)
+                )
+            for_vars[for_statement.variable_name] = {'type': 'array', 'value': []}
+        return for_vars
+
+    @staticmethod
+    def scan_html(content: WriterContent) -> None:
+        endhtmls = WriterScanner.find_all(HtmlStatement.end_regex, content.body)
+        for paragraph_i, start, end, string in WriterScanner.find_all(HtmlStatement.start_regex, content.body):
+            if not WriterScanner.has_next(endhtmls, paragraph_i, end):
+                raise errors.TemplateError(
+                    'no_endhtml_found',
+                    "The statement [html] has no endhtml",
+                    {'String': string}
+                )
+
+    @staticmethod
+    def scan(content: WriterContent) -> dict[str: dict[str, Union[str, list[str]]]]:
+        """
+        scans the variables of a text document, in the order of WriterTemplate.scan
+
+        :param content: the text content of the document
+        :return: the variables found in the document
+        """
+        texts = WriterScanner.scan_text(content)
+        IfStatement.scan_if(content.body)
+        tables = WriterScanner.scan_table(content)
+        images = WriterScanner.scan_image(content)
+        fors = WriterScanner.scan_for(content)
+        WriterScanner.scan_html(content)
+
+        variables_list = list(texts.keys()) + list(tables.keys()) + list(images.keys()) + list(fors.keys())
+        duplicates = [variable for variable in variables_list if variables_list.count(variable) > 1]
+
+        if duplicates:
+            first_type = "text" if duplicates[0] in texts.keys() else "image"
+            second_type = "table" if duplicates[0] in tables.keys() else "image"
+            raise errors.TemplateError(
+                'duplicated_variable',
+                f"The variable {duplicates[0]!r} is mentioned two times, but "
+                f"for two different types: {first_type!r}, and {second_type!r}",
+                dict_of(first_type, second_type, variable=duplicates[0])
+            )
+
+        return texts | tables | images | fors
+
+    @staticmethod
+    def scan_file(file_path: str) -> dict[str: dict[str, Union[str, list[str]]]]:
+        """
+        :param file_path: the path of an ODT or DOCX template
+        :return: the variables found in the template
+        """
+        return WriterScanner.scan(WriterScanner.read(file_path))
@@ -10,7 +10,6 @@ __all__ = (
 )
 
 from typing import Union
-from sorcery import dict_of
 import os
 import uno
 
@@ -22,6 +21,9 @@ from . import errors
 
 
 from .Template import Template
+from .WriterScanner import WriterScanner
+from .WriterFiller import WriterFiller
+from .WriterRange import WriterRange
 
 from lotemplate.Statement.ForStatement import ForStatement
 from lotemplate.Statement.HtmlStatement import HtmlStatement
@@ -104,38 +106,54 @@ class WriterTemplate(Template):
 
     def scan(self, **kwargs) -> dict[str: dict[str, Union[str, list[str]]]]:
         """
-        scans the variables contained in the template. Supports text, tables and images
+        scans the variables contained in the template. Supports text, tables and images.
+        The ODT and DOCX files are scanned from their xml, without loading them in soffice, unless with_office is
+        given. The other documents are loaded in soffice and read in one pass.
 
         :return: list containing all the variables founded in the template
         """
 
         #should_close = kwargs.get("should_close", False)
 
-        texts = TextStatement.scan_text(self.doc)
-        # we use another document for if statement scanning because it modifies the file
-        IfStatement.scan_if(template = self)
-        tables = TableStatement.scan_table(self.doc)
-        images = ImageStatement.scan_image(self.doc)
-        fors = ForStatement.scan_for(self.doc)
-        HtmlStatement.scan_html(self.doc)
-        CounterManager.scan_counter(self.doc)
-
-        variables_list = list(texts.keys()) + list(tables.keys()) + list(images.keys()) + list(fors.keys())
-        duplicates = [variable for variable in variables_list if variables_list.count(variable) > 1]
-
-        if duplicates:
-            first_type = "text" if duplicates[0] in texts.keys() else "image"
-            second_type = "table" if duplicates[0] in tables.keys() else "image"
+        if not kwargs.get("with_office", False) and WriterScanner.supports(self.file_path):
+            try:
+                content = WriterScanner.read(self.file_path)
+                variables = WriterScanner.scan(content)
+                self.tables_layout = WriterScanner.tables_layout(content)
+                return variables
+            except errors.TemplateError:
+                raise
+            except Exception as e:
+                if not self.cnx:
+                    raise
+                print(f"##### xml scan of {self.file_path} failed ({e!r}), scanning it with soffice #####")
+
+        # the document is read once, its statements and variables are found in the text read
+        try:
+            content = WriterScanner.read_doc(self.doc)
+            variables = WriterScanner.scan(content)
+            self.tables_layout = WriterScanner.tables_layout(content)
+            return variables
+        except errors.TemplateError:
             self.close()
-            raise errors.TemplateError(
-                'duplicated_variable',
-                f"The variable {duplicates[0]!r} is mentioned two times, but "
-                f"for two different types: {first_type!r}, and {second_type!r}",
-                dict_of(first_type, second_type, variable=duplicates[0])
-            )
+            raise
 
-        return texts | tables | images | fors
 
+    def fill_without_office(self, variables: dict[str, dict[str, Union[str, list[str]]]]) -> bool:
+        """
+        Fills the template with the given values by rewriting its xml, without soffice, if the template only holds
+        text variables, for, if and counter statements. The document is loaded in soffice only if it's exported
+        to another format than odt.
+
+        :param variables: the values to fill in the template
+        :return: True if the template has been filled, False if it must be filled by soffice
+        """
+        if self._doc is not None or self.filled is not None:
+            return False
+        if not WriterFiller.supports(self.file_path, self.variables, variables):
+            return False
+        self.filled = WriterFiller.fill(self.read_file(self.file_path), variables)
+        return self.filled is not None
 
     def fill(self, variables: dict[str, dict[str, Union[str, list[str]]]]) -> None:
         """
@@ -145,27 +163,39 @@ class WriterTemplate(Template):
         :return: None
         """
 
+        if self.fill_without_office(variables):
+            return
+        self.fill_doc(self.doc, variables)
+
+    def fill_doc(self, doc, variables: dict[str, dict[str, Union[str, list[str]]]]) -> None:
+        """
+        Fills the statements of the document, or of the range of the document, with the given values
+
+        :param doc: the document, or a WriterRange of the document
+        :param variables: the values to fill in the template
+        :return: None
+        """
 
         ###
         ### main calls
         ###
-        ForStatement.for_replace(self.doc, variables)
+        ForStatement.for_replace(doc, variables)
 
-        IfStatement.if_replace(self.doc, variables)
+        IfStatement.if_replace(doc, variables)
+
+        TextStatement.texts_fill(doc, variables)
 
         for var, details in sorted(variables.items(), key=lambda s: -len(s[0])):
-            if details['type'] == 'text':
-                TextStatement.text_fill(self.doc, "$" + var, details['value'])
-            elif details['type'] == 'image':
-                ImageStatement.image_fill(self.doc, self.cnx.graphic_provider, "$" + var, details['value'])
+            if details['type'] == 'image':
+                ImageStatement.image_fill(doc, self.cnx.graphic_provider, "$" + var, details['value'])
             elif details['type'] == 'html':
-                HtmlStatement.html_fill(template=self, doc=self.doc, variable="$" + var, value=details['value'])
+                HtmlStatement.html_fill(template=self, doc=doc, variable="$" + var, value=details['value'])
 
-        HtmlStatement.html_replace(template=self, doc=self.doc)
+        HtmlStatement.html_replace(template=self, doc=doc)
 
-        TableStatement.tables_fill(self.doc, variables, '$', '&')
+        TableStatement.tables_fill(doc, variables, '$', '&', self.tables_layout)
 
-        CounterManager.counter_replace(self.doc)
+        CounterManager.counter_replace(doc)
 
 
     def page_break(self) -> None:
@@ -184,3 +214,57 @@ class WriterTemplate(Template):
         cursor.BreakType = PAGE_AFTER
         self.doc.Text.insertControlCharacter(cursor, PARAGRAPH_BREAK, False)
 
+    def merge(self, variables_list: list[dict[str, dict[str, Union[str, list[str]]]]]) -> None:
+        """
+        Fills the template once for each given values, one after the other in the same document, each instance
+        starting on a new page. The template is loaded once and read once : its content is inserted again at the end
+        of the document for each new instance, and only this instance is searched by its fill.
+        Headers and footers belong to the page styles, so they are filled with the values of the first instance.
+
+        :param variables_list: the values of each instance
+        :return: None
+        """
+
+        doc = self.doc
+        filter_name = next(arg.Value for arg in doc.getArgs() if arg.Name == 'FilterName')
+        data = self.read_file(self.file_path)
+        # the tables, images and frames of an instance keep the names of the template until the next one is inserted
+        collections = {
+            'tables': doc.getTextTables,
+            'images': doc.getGraphicObjects,
+            'frames': doc.getTextFrames,
+        }
+        names = {collection: elements().getElementNames() for collection, elements in collections.items()}
+        for index, variables in enumerate(variables_list):
+            if not index:
+                self.fill_doc(doc, variables)
+            else:
+                self.page_break()
+                # the end of the last paragraph of the previous instance
+                start = doc.Text.createTextCursor()
+                start.gotoEnd(False)
+                start.gotoPreviousParagraph(False)
+                start.gotoEndOfParagraph(False)
+                cursor = doc.Text.createTextCursor()
+                cursor.gotoEnd(False)
+                input_stream = self.cnx.ctx.ServiceManager.createInstanceWithContext(
+                    "com.sun.star.io.SequenceInputStream", self.cnx.ctx)
+                input_stream.initialize((uno.ByteSequence(data),))
+                cursor.insertDocumentFromURL("private:stream", (
+                    PropertyValue("FilterName", 0, filter_name, 0),
+                    PropertyValue("InputStream", 0, input_stream, 0)
+                ))
+                frames = doc.getTextFrames()
+                frames = [frames.getByName(name) for name in names['frames'] if frames.hasByName(name)]
+                self.fill_doc(WriterRange(doc, start, frames), variables)
+            # the elements of the filled instance are renamed, so the next instance is inserted with the names of
+            # the template and its images aren't mistaken for the ones of the filled instance
+            for collection, elements in collections.items():
+                elements = elements()
+                for name in names[collection]:
+                    if not elements.hasByName(name):
+                        continue
+                    element = elements.getByName(name)
+                    if collection == 'images' and ImageStatement.image_regex.fullmatch(element.Description):
+                        element.Description = ''
+                    element.setName(f"{name}_{index}")
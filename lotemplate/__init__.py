@@ -14,6 +14,9 @@ __title__ = 'LOTemplate Filler'
 __version__ = '1.0'
 __all__ = (
     'Connexion',
+    'ConnexionPool',
+    'OfficeProcess',
+    'OfficeSupervisor',
     'Template',
     'CalcTemplate',
     'WriterTemplate',
@@ -22,14 +25,29 @@ __all__ = (
     'get_file_url',
     'TemplateFromExt',
     'start_multi_office',
+    'wait_offices_ready',
     'randomConnexion',
     'clean_old_open_document',
     'statistic_open_document',
+    'OfficeBroker',
+    'DocumentPool',
+    'HashIndex',
+    'WriterScanner',
+    'CalcScanner',
+    'WriterFiller',
+    'WriterRange',
 )
 
-from .connexion import Connexion
+from .connexion import Connexion,ConnexionPool,OfficeProcess,OfficeSupervisor
 from .utils import convert_to_datas_template,is_network_based,get_file_url
 from .Template import Template
 from .WriterTemplate import WriterTemplate
 from .CalcTemplate import CalcTemplate
-from .lofunction import TemplateFromExt,start_multi_office,randomConnexion,clean_old_open_document,statistic_open_document
+from .lofunction import TemplateFromExt,start_multi_office,wait_offices_ready,randomConnexion,clean_old_open_document,statistic_open_document
+from .broker import OfficeBroker
+from .documentpool import DocumentPool
+from .hashindex import HashIndex
+from .WriterScanner import WriterScanner
+from .CalcScanner import CalcScanner
+from .WriterFiller import WriterFiller
+from .WriterRange import WriterRange
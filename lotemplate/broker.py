@@ -0,0 +1,348 @@
+"""
+Copyright (C) 2023 Probesys
+
+
+The broker sharing the soffice processes between the workers of the API
+"""
+
+__all__ = (
+    'OfficeBroker',
+)
+
+import os
+import fcntl
+import random
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Union
+from time import sleep, monotonic
+from sorcery import dict_of
+from . import errors
+
+
+class OfficeBroker:
+    """
+    Hands out leases on the soffice processes to all the workers of a server.
+
+    The state is shared through lock files in a directory: every soffice process has a number of slots, and a
+    lease is an exclusive flock on one slot file. Locks are released by the kernel when a worker dies, so a
+    crashed worker never keeps a soffice process busy. Slots are tried in order on every process before the
+    next slot is tried, so a lease goes to the least loaded process.
+    When every slot is taken, the caller waits in a bounded queue, each waiter being a locked file in the
+    waiting directory.
+    """
+
+    def __repr__(self):
+        return (
+            f"<OfficeBroker object :'offices'={self.offices!r}, 'state_dir'={self.state_dir!r}, "
+            f"'slots'={self.slots!r}, 'max_queue'={self.max_queue!r}, 'timeout'={self.timeout!r}>"
+        )
+
+    def __init__(self, offices, state_dir: str = None, slots: int = 1, max_queue: int = 0,
+                 timeout: float = 60, poll_interval: float = 0.05):
+        """
+        Must be created before the workers are forked, so they all share the same state directory
+
+        :param offices: the list of (host, port, lo dir) returned by start_multi_office
+        :param state_dir: the directory holding the lock files. A new temporary directory if not given
+        :param slots: the number of leases a soffice process can have at the same time
+        :param max_queue: the maximum number of callers waiting for a lease. 0 means no limit
+        :param timeout: the time in seconds a caller waits for a lease before giving up
+        :param poll_interval: the time in seconds between two attempts of a waiting caller
+        """
+        if slots <= 0:
+            raise TypeError("%s is an invalid positive int value" % slots)
+        self.offices = offices
+        self.state_dir = state_dir or tempfile.mkdtemp(prefix='lotemplate_broker_')
+        self.slots = slots
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.waiting_dir = self.state_dir + '/waiting'
+        os.makedirs(self.waiting_dir, exist_ok=True)
+
+    def slot_file(self, office, slot: int) -> str:
+        host, port, lodir = office
+        return f"{self.state_dir}/{host}_{port}.{slot}.lock"
+
+    def state_file(self, office, state: str) -> str:
+        host, port, lodir = office
+        return f"{self.state_dir}/{host}_{port}.{state}"
+
+    def is_available(self, office) -> bool:
+        """
+        Tells if leases can be given on the soffice process
+
+        :param office: the (host, port, lo dir) of the soffice process
+        :return: true if the process accepts new leases
+        """
+        return not os.path.exists(self.state_file(office, 'down'))
+
+    def set_available(self, office, available: bool) -> None:
+        """
+        Stops or resumes giving leases on the soffice process, for example while it is restarted
+
+        :param office: the (host, port, lo dir) of the soffice process
+        :param available: if the process accepts new leases
+        :return: None
+        """
+        if available:
+            try:
+                os.remove(self.state_file(office, 'down'))
+            except FileNotFoundError:
+                pass
+        else:
+            open(self.state_file(office, 'down'), 'w').close()
+
+    def report_failure(self, office) -> None:
+        """
+        Reports that a worker couldn't use the soffice process, so the supervisor checks it
+
+        :param office: the (host, port, lo dir) of the soffice process
+        :return: None
+        """
+        open(self.state_file(office, 'failed'), 'w').close()
+
+    def pop_failure(self, office) -> bool:
+        """
+        :param office: the (host, port, lo dir) of the soffice process
+        :return: true if a failure was reported since the last call
+        """
+        try:
+            os.remove(self.state_file(office, 'failed'))
+        except FileNotFoundError:
+            return False
+        return True
+
+    @staticmethod
+    def _try_lock(path: str) -> Union[int, None]:
+        """
+        Tries to lock the file without waiting. A new file descriptor is opened for every attempt : flock
+        locks belong to the open file, so a shared descriptor would let two threads hold the same lock.
+
+        :param path: the file to lock
+        :return: the locked file descriptor, or None if the file is already locked
+        """
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    @staticmethod
+    def _unlock(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    def try_lease(self):
+        """
+        Tries to take a lease without waiting
+
+        :return: a tuple (office, locked file descriptor), or None if every slot is taken
+        """
+        # start at a random process so the workers don't all compete for the first one
+        start = random.randrange(len(self.offices))
+        offices = self.offices[start:] + self.offices[:start]
+        for slot in range(self.slots):
+            for office in offices:
+                if not self.is_available(office):
+                    continue
+                fd = self._try_lock(self.slot_file(office, slot))
+                if fd is not None:
+                    return office, fd
+        return None
+
+    def queue_depth(self) -> int:
+        """
+        Counts the callers waiting for a lease, on all the workers.
+        Files of dead waiters are not locked anymore, they are removed on the way
+
+        :return: the number of waiting callers
+        """
+        depth = 0
+        for name in os.listdir(self.waiting_dir):
+            path = self.waiting_dir + '/' + name
+            try:
+                fd = self._try_lock(path)
+            except FileNotFoundError:
+                continue
+            if fd is None:
+                depth += 1
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._unlock(fd)
+        return depth
+
+    def leases(self, office) -> int:
+        """
+        Counts the leases currently given on a soffice process
+
+        :param office: the (host, port, lo dir) of the soffice process
+        :return: the number of taken slots
+        """
+        count = 0
+        for slot in range(self.slots):
+            fd = self._try_lock(self.slot_file(office, slot))
+            if fd is None:
+                count += 1
+            else:
+                self._unlock(fd)
+        return count
+
+    def office_stats(self, office) -> dict:
+        """
+        :param office: the (host, port, lo dir) of the soffice process
+        :return: the load and the state of the soffice process
+        """
+        host, port, lodir = office
+        return {
+            'host': host,
+            'port': port,
+            'leases': self.leases(office),
+            'available': self.is_available(office),
+            'documents': self.documents(office),
+            'ready_in': getattr(office, 'ready_in', None),
+        }
+
+    def stats(self) -> dict:
+        """
+        :return: the load of every soffice process and the depth of the waiting queue
+        """
+        return {
+            'queue': self.queue_depth(),
+            'max_queue': self.max_queue,
+            'slots': self.slots,
+            'offices': [self.office_stats(office) for office in self.offices],
+        }
+
+    def _wait(self):
+        """
+        Waits in the queue until a slot is free
+
+        :return: a tuple (office, locked file descriptor)
+        """
+        if self.max_queue and self.queue_depth() >= self.max_queue:
+            max_queue = self.max_queue
+            raise errors.OfficeBusyError(
+                'office_queue_full',
+                f"All the soffice processes are busy and {max_queue} requests are already waiting. "
+                f"Please retry later.",
+                dict_of(max_queue)
+            )
+        waiting_file = f"{self.waiting_dir}/{os.getpid()}-{threading.get_ident()}-{uuid.uuid4()}"
+        waiting_fd = self._try_lock(waiting_file)
+        try:
+            deadline = monotonic() + self.timeout
+            while monotonic() < deadline:
+                sleep(self.poll_interval)
+                lease = self.try_lease()
+                if lease:
+                    return lease
+        finally:
+            try:
+                os.remove(waiting_file)
+            except FileNotFoundError:
+                pass
+            self._unlock(waiting_fd)
+        timeout = self.timeout
+        raise errors.OfficeBusyError(
+            'office_timeout',
+            f"No soffice process has been available for {timeout} seconds. Please retry later.",
+            dict_of(timeout)
+        )
+
+    @contextmanager
+    def lease(self):
+        """
+        Leases a soffice process for the duration of a with block
+
+        :return: the (host, port, lo dir) of the leased soffice process
+        """
+        office, fd = self.try_lease() or self._wait()
+        try:
+            yield office
+        finally:
+            self.count_document(office)
+            self._unlock(fd)
+
+    def count_document(self, office) -> None:
+        """
+        Counts one more document handled by the soffice process. The counter is an integer written in a file
+        under an exclusive lock, so it is shared by all the workers and its file keeps a fixed size.
+
+        :param office: the (host, port, lo dir) of the soffice process
+        :return: None
+        """
+        fd = os.open(self.state_file(office, 'count'), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            # the number of digits never decreases, the file doesn't need to be truncated
+            os.pwrite(fd, str(self.read_count(fd) + 1).encode(), 0)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def read_count(fd: int) -> int:
+        """
+        :param fd: the locked counter file
+        :return: the value of the counter
+        """
+        try:
+            return int(os.pread(fd, 20, 0) or 0)
+        except ValueError:
+            return 0
+
+    def documents(self, office) -> int:
+        """
+        :param office: the (host, port, lo dir) of the soffice process
+        :return: the number of documents handled by the soffice process since its last restart
+        """
+        try:
+            fd = os.open(self.state_file(office, 'count'), os.O_RDONLY)
+        except FileNotFoundError:
+            return 0
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            return self.read_count(fd)
+        finally:
+            os.close(fd)
+
+    def reset_documents(self, office) -> None:
+        """
+        :param office: the (host, port, lo dir) of the soffice process
+        :return: None
+        """
+        fd = os.open(self.state_file(office, 'count'), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            os.ftruncate(fd, 0)
+        finally:
+            os.close(fd)
+
+    @contextmanager
+    def drain(self, office):
+        """
+        Stops giving leases on the soffice process, and waits until the leases in progress are given back.
+        Until the end of the with block, nobody can lease the process.
+
+        :param office: the (host, port, lo dir) of the soffice process
+        :return: None
+        """
+        self.set_available(office, False)
+        fds = []
+        try:
+            for slot in range(self.slots):
+                fd = os.open(self.slot_file(office, slot), os.O_RDWR | os.O_CREAT, 0o600)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                fds.append(fd)
+            yield
+        finally:
+            for fd in fds:
+                self._unlock(fd)
@@ -7,39 +7,356 @@ The classes used for document connexion and manipulation
 
 __all__ = (
     'Connexion',
+    'ConnexionPool',
+    'OfficeProcess',
+    'OfficeSupervisor',
     'start_office',
 )
 
 import os
 from sorcery import dict_of
 import shlex
+import signal
+import socket
 import subprocess
+import random
+import threading
+from contextlib import contextmanager
+from typing import Union
 import uno
 from com.sun.star.connection import NoConnectException
+from com.sun.star.lang import DisposedException
 from com.sun.star.uno import RuntimeException
-from time import sleep
+from time import sleep, time, monotonic
 from . import errors
 #from .utils import *
 from .WriterTemplate import WriterTemplate
 from .CalcTemplate import CalcTemplate
+from .documentpool import DocumentPool
 
-def start_office(host:str="localhost",port:str="2000"):
+class OfficeProcess:
+    """
+    The handle of one soffice process started by this module.
+
+    It can be unpacked like the (host, port, lo dir) tuple used everywhere else.
+    """
+
+    def __repr__(self):
+        return (
+            f"<OfficeProcess object :'host'={self.host!r}, 'port'={self.port!r}, 'lodir'={self.lodir!r}, "
+            f"'pid'={self.pid!r}, 'restarts'={self.restarts!r}>"
+        )
+
+    def __str__(self):
+        return f"soffice host {self.host}, port {self.port}"
+
+    def __iter__(self):
+        return iter((self.host, self.port, self.lodir))
+
+    def __init__(self, host: str = "localhost", port: str = "2000"):
+        """
+        :param host:  define host in the UNO connect-string --accept
+        :param port:   define port in the UNO connect-string --accept
+        """
+        self.host = host
+        self.port = str(port)
+        self.lodir = 'file:///tmp/LibO_Process'+self.port
+        self.process = None
+        self.started_at = None
+        self.ready_in = None
+        self.restarts = 0
+
+    @property
+    def pid(self) -> Union[int, None]:
+        return self.process.pid if self.process else None
+
+    def start(self) -> 'OfficeProcess':
+        """
+        start the soffice process, in its own session so the whole process group can be stopped
+
+        :return: the handle itself
+        """
+        # environnement had to be different for each environnement
+        self.process = subprocess.Popen(
+                 shlex.split('soffice \
+                 -env:UserInstallation="'+self.lodir+'" \
+                "--accept=socket,host="'+self.host+',port='+self.port+';urp;" \
+                --headless --nologo --terminate_after_init \
+                --norestore " '), shell=False, stdin = subprocess.PIPE,
+                         stdout = subprocess.DEVNULL, start_new_session=True)
+        self.started_at = time()
+        return self
+
+    def is_running(self) -> bool:
+        """
+        :return: true if the started process has not exited
+        """
+        return self.process is not None and self.process.poll() is None
+
+    def probe(self, timeout: float = 1) -> bool:
+        """
+        Checks that the soffice process accepts connexions. soffice only opens its acceptor once the office
+        is initialised, so an accepted connexion means a UNO connexion can be established.
+
+        :param timeout: the time in seconds to wait for the connexion
+        :return: true if the connexion has been accepted
+        """
+        try:
+            socket.create_connection((self.host, int(self.port)), timeout=timeout).close()
+        except OSError:
+            return False
+        return True
+
+    def wait_ready(self, timeout: float = 60, interval: float = 0.1) -> float:
+        """
+        Waits until the soffice process accepts connexions
+
+        :param timeout: the maximum time in seconds to wait
+        :param interval: the time in seconds between two probes
+        :return: the time in seconds the process took to be ready
+        """
+        start = monotonic()
+        while not self.probe():
+            if monotonic() - start > timeout:
+                host, port = self.host, self.port
+                raise errors.UnoException(
+                    'connection_error',
+                    f"The soffice process on '{host}:{port}' is still not ready after {timeout} seconds.",
+                    dict_of(host, port)
+                )
+            sleep(interval)
+        return monotonic() - start
+
+    def stop(self, timeout: float = 10) -> None:
+        """
+        Stops the soffice process and its children, killing them if they don't terminate in time
+
+        :param timeout: the time in seconds to wait for the termination
+        :return: None
+        """
+        if self.process is None:
+            return
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                os.killpg(self.process.pid, sig)
+            except ProcessLookupError:
+                break
+            try:
+                self.process.wait(timeout)
+                break
+            except subprocess.TimeoutExpired:
+                continue
+        # a killed office leaves its profile locked
+        try:
+            os.remove(self.lodir[7:] + '/.lock')
+        except FileNotFoundError:
+            pass
+
+    def rss(self) -> int:
+        """
+        Reads in /proc the resident memory of the soffice process and of its children
+
+        :return: the resident memory in bytes
+        """
+        if self.process is None:
+            return 0
+        total = 0
+        for pid in os.listdir('/proc'):
+            if not pid.isdigit():
+                continue
+            try:
+                with open(f'/proc/{pid}/stat') as f:
+                    stat = f.read()
+                # the command name may contain spaces : the fields are read after its closing parenthesis
+                if int(stat[stat.rindex(')') + 2:].split()[2]) != self.process.pid:
+                    continue
+                with open(f'/proc/{pid}/statm') as f:
+                    total += int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+            except (OSError, ValueError, IndexError):
+                continue
+        return total
+
+    def uptime(self) -> float:
+        """
+        :return: the time in seconds since the soffice process was started
+        """
+        return time() - self.started_at if self.started_at else 0
+
+    def restart(self, timeout: float = 60) -> float:
+        """
+        Stops the soffice process, starts a new one on the same port and waits until it is ready
+
+        :param timeout: the maximum time in seconds to wait for the new process
+        :return: the time in seconds the new process took to be ready
+        """
+        self.stop()
+        self.start()
+        self.restarts += 1
+        self.ready_in = self.wait_ready(timeout)
+        return self.ready_in
+
+
+def start_office(host:str="localhost",port:str="2000") -> OfficeProcess:
     """
     start one process LibreOffice
 
     :param host:  define host in the UNO connect-string --accept
     :param port:   define port in the UNO connect-string --accept
-    environnement had to be different for each environnement
+    :return: the handle of the process, that can be unpacked as (host, port, lo dir)
+    """
+    return OfficeProcess(host, port).start()
+
+
+class OfficeSupervisor:
+    """
+    Owns the soffice processes and keeps them running.
+
+    A monitoring thread checks every process : a process that exited, or that was reported by a worker after
+    a bridge error, is probed, and restarted in the background if it doesn't answer anymore. While it is down,
+    the broker doesn't give leases on it. Must run in the process that started the soffice processes.
+
+    The processes can also be recycled after a number of documents, a resident memory or an uptime : the
+    process is drained (no new lease, the documents in progress are finished) and replaced by a fresh one.
+    Only one process is recycled at a time, and never the last available one, so the throughput never drops
+    to zero.
     """
-    subprocess.Popen(
-             shlex.split('soffice \
-             -env:UserInstallation="file:///tmp/LibO_Process'+port+'" \
-            -env:UserInstallation="file:///tmp/LibO_Process'+port+'" \
-            "--accept=socket,host="'+host+',port='+port+';urp;" \
-            --headless --nologo --terminate_after_init \
-            --norestore " '), shell=False, stdin = subprocess.PIPE,
-                     stdout = subprocess.PIPE,)
-    return host, port,'file:///tmp/LibO_Process'+str(port)
+
+    def __repr__(self):
+        return f"<OfficeSupervisor object :'offices'={self.offices!r}, 'broker'={self.broker!r}>"
+
+    def __init__(self, offices: list[OfficeProcess], broker=None, interval: float = 1, start_timeout: float = 60,
+                 max_documents: int = 0, max_rss: int = 0, max_uptime: float = 0):
+        """
+        :param offices: the processes returned by start_multi_office
+        :param broker: the broker giving the leases on the processes, if any
+        :param interval: the time in seconds between two checks
+        :param start_timeout: the maximum time in seconds to wait for a restarted process
+        :param max_documents: recycle a process after this number of documents. 0 means never
+        :param max_rss: recycle a process when its resident memory reaches this number of bytes. 0 means never
+        :param max_uptime: recycle a process after this time in seconds. 0 means never
+        """
+        self.offices = offices
+        self.broker = broker
+        self.interval = interval
+        self.start_timeout = start_timeout
+        self.max_documents = max_documents
+        self.max_rss = max_rss
+        self.max_uptime = max_uptime
+        self.restarting = set()
+        self.failed = set()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def start(self) -> 'OfficeSupervisor':
+        """
+        start the monitoring thread
+
+        :return: the supervisor itself
+        """
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name='office-supervisor', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        stop the monitoring thread
+
+        :return: None
+        """
+        self.stopped.set()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            for office in self.offices:
+                self.check(office)
+
+    def check(self, office: OfficeProcess) -> None:
+        """
+        Restarts the process in the background if it died or if it was reported and doesn't answer anymore.
+        The port is probed too, as the soffice launcher may hand the office over to another process.
+        Else, recycles the process if it reached one of its limits.
+
+        :param office: the process to check
+        :return: None
+        """
+        with self.lock:
+            if office in self.restarting:
+                return
+            failed = office in self.failed
+        reported = self.broker.pop_failure(office) if self.broker else False
+        if failed or ((reported or not office.is_running()) and not office.probe()):
+            self.background(self.restart, office)
+        elif self.should_recycle(office):
+            self.background(self.recycle, office)
+
+    def should_recycle(self, office: OfficeProcess) -> bool:
+        """
+        :param office: the process to check
+        :return: true if the process reached one of its limits, and can be recycled without stopping the service
+        """
+        if not self.broker:
+            return False
+        if not (
+                (self.max_documents and self.broker.documents(office) >= self.max_documents)
+                or (self.max_uptime and office.uptime() >= self.max_uptime)
+                or (self.max_rss and office.rss() >= self.max_rss)
+        ):
+            return False
+        with self.lock:
+            if self.restarting:
+                return False
+        return any(self.broker.is_available(other) for other in self.offices if other is not office)
+
+    def background(self, target, office: OfficeProcess) -> None:
+        with self.lock:
+            self.restarting.add(office)
+            self.failed.discard(office)
+        threading.Thread(target=target, args=(office,), daemon=True).start()
+
+    def restart(self, office: OfficeProcess) -> None:
+        """
+        Restarts the process and gives it back to the broker once it is ready
+
+        :param office: the process to restart
+        :return: None
+        """
+        try:
+            if self.broker:
+                self.broker.set_available(office, False)
+            self.replace(office, 'RESTART')
+        finally:
+            with self.lock:
+                self.restarting.discard(office)
+
+    def recycle(self, office: OfficeProcess) -> None:
+        """
+        Waits for the documents in progress on the process, and replaces it by a fresh one
+
+        :param office: the process to recycle
+        :return: None
+        """
+        try:
+            with self.broker.drain(office):
+                self.replace(office, 'RECYCLE')
+        finally:
+            with self.lock:
+                self.restarting.discard(office)
+
+    def replace(self, office: OfficeProcess, reason: str) -> None:
+        try:
+            duration = office.restart(self.start_timeout)
+        except errors.UnoException as e:
+            # still down, the next check will try again
+            print(f"##### {reason} {office} failed : {e} #####")
+            with self.lock:
+                self.failed.add(office)
+            return
+        print(f"##### {reason} {office} : ready in {duration:.2f}s #####")
+        if self.broker:
+            self.broker.reset_documents(office)
+            self.broker.set_available(office, True)
 
 
 class Connexion:
@@ -54,40 +371,42 @@ class Connexion:
     def __str__(self):
         return f"Connexion host {self.host}, port {self.port}"
 
-    def __init__(self, host: str, port: str):
+    def __init__(self, host: str, port: str, timeout: float = 30):
         """
         An object representing the connexion between the script and the LibreOffice/OpenOffice processus
 
         :param host: the address of the host to connect to
         :param port: the host port to connect to
+        :param timeout: the maximum time in seconds to wait for the soffice process to answer
         """
 
         self.host = host
         self.port = port
         self.local_ctx = uno.getComponentContext()
-        for attempt in range(3):
+        resolver = self.local_ctx.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", self.local_ctx
+        )
+        # the soffice process may still be starting: probe it until it answers instead of waiting blindly
+        deadline = monotonic() + timeout
+        while True:
             try:
-                self.ctx = self.local_ctx.ServiceManager.createInstanceWithContext(
-                    "com.sun.star.bridge.UnoUrlResolver", self.local_ctx
-                ).resolve(f"uno:socket,host={host},port={port};urp;StarOffice.ComponentContext")
+                self.ctx = resolver.resolve(f"uno:socket,host={host},port={port};urp;StarOffice.ComponentContext")
             except (NoConnectException, RuntimeException) as e:
-                if attempt==0:
-                    sleep(4)
-                elif  attempt<2:
-                    start_office(host,port)
-                    sleep(5)
-                else:
-                    raise errors.UnoException(
-                        'connection_error',
-                        f"Couldn't find/connect to the soffice process on \'{host}:{port}\'. "
-                        f"Make sure the soffice process is correctly running with correct host and port informations. "
-                        f"Read the README file, section 'Executing the script' for more informations about how to "
-                        f"run the script.", dict_of(host, port)
-                    ) from e
-            else:
-                break
+                if monotonic() < deadline:
+                    sleep(0.1)
+                    continue
+                raise errors.UnoException(
+                    'connection_error',
+                    f"Couldn't find/connect to the soffice process on \'{host}:{port}\'. "
+                    f"Make sure the soffice process is correctly running with correct host and port informations. "
+                    f"Read the README file, section 'Executing the script' for more informations about how to "
+                    f"run the script.", dict_of(host, port)
+                ) from e
+            break
         self.desktop = self.ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", self.ctx)
         self.graphic_provider = self.ctx.ServiceManager.createInstance('com.sun.star.graphic.GraphicProvider')
+        # the pool of pre-opened templates, see ConnexionPool
+        self.documents = None
 
     def restart(self) -> None:
         """
@@ -98,6 +417,113 @@ class Connexion:
         print( "##### RESTART One Office#####")
         self.__init__(self.host, self.port)
 
+    def is_alive(self) -> bool:
+        """
+        Checks, with a single round trip, that the bridge to the soffice process is still usable
+
+        :return: true if the soffice process answered, else false
+        """
+        try:
+            self.desktop.getComponents().hasElements()
+        except (DisposedException, RuntimeException):
+            return False
+        return True
+
+
+class ConnexionPool:
+    """
+    A per-process pool of long-lived connexions to the soffice processes.
+
+    Building a Connexion resolves the UNO url and creates the desktop and the graphic provider, which means
+    several round trips through the bridge. The pool keeps the connexions once they are built, so a worker pays
+    this cost once per soffice process instead of once per document.
+    """
+
+    def __repr__(self):
+        return f"<ConnexionPool object :'offices'={self.offices!r}>"
+
+    def __init__(self, offices, document_pool: dict = None):
+        """
+        :param offices: the list of (host, port, lo dir) returned by start_multi_office
+        :param document_pool: if given, the arguments of the DocumentPool given to each connexion, keeping
+        pre-opened copies of the hot templates
+        """
+        self.offices = offices
+        self.document_pool = document_pool
+        self._reset()
+
+    def _reset(self) -> None:
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.idle = {}
+
+    def _check_pid(self) -> None:
+        # the bridge threads are not copied by a fork: a forked worker must build its own connexions
+        if self.pid != os.getpid():
+            self._reset()
+
+    def get(self, host: str, port: str) -> Connexion:
+        """
+        Takes an idle connexion to the given soffice process, or builds a new one.
+        Idle connexions are health-checked before being handed out, dead ones are dropped.
+
+        :param host: the host of the soffice process
+        :param port: the port of the soffice process
+        :return: a connexion that is not used by anyone else
+        """
+        self._check_pid()
+        while True:
+            with self.lock:
+                idle = self.idle.get((host, port))
+                cnx = idle.pop() if idle else None
+            if cnx is None:
+                cnx = Connexion(host, port)
+                if self.document_pool:
+                    cnx.documents = DocumentPool(cnx, **self.document_pool)
+                return cnx
+            if cnx.is_alive():
+                return cnx
+
+    def put(self, cnx: Connexion) -> None:
+        """
+        Gives back a connexion taken with get()
+
+        :param cnx: the connexion to give back
+        :return: None
+        """
+        self._check_pid()
+        with self.lock:
+            self.idle.setdefault((cnx.host, cnx.port), []).append(cnx)
+
+    def discard(self, host: str, port: str) -> None:
+        """
+        Drops all the idle connexions to the given soffice process, for example after a restart
+
+        :param host: the host of the soffice process
+        :param port: the port of the soffice process
+        :return: None
+        """
+        self._check_pid()
+        with self.lock:
+            self.idle.pop((host, port), None)
+
+    @contextmanager
+    def lease(self, host: str = None, port: str = None):
+        """
+        Leases a connexion for the duration of a with block, and gives it back at the end
+
+        :param host: the host of the soffice process. If not given, a soffice process is picked at random
+        :param port: the port of the soffice process
+        :return: the leased connexion
+        """
+        if host is None:
+            host, port, lodir = random.choice(self.offices)
+        cnx = self.get(host, port)
+        try:
+            yield cnx
+        finally:
+            self.put(cnx)
+
 def TemplateFromExt(file_path: str, cnx: Connexion, should_scan: bool):
 
         filename, file_extension = os.path.splitext(file_path)
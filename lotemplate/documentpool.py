@@ -0,0 +1,170 @@
+"""
+Copyright (C) 2023 Probesys
+
+
+The pool of pre-opened template documents
+"""
+
+__all__ = (
+    'DocumentPool',
+)
+
+import os
+import threading
+from collections import Counter, OrderedDict
+from typing import Union
+from .Template import Template
+
+
+class DocumentPool:
+    """
+    Keeps pristine, already loaded copies of the most used templates on a soffice process.
+
+    A template becomes hot once it has been opened min_uses times. A fill then takes a ready copy instead of
+    loading the file, and the pool loads a new copy in the background. At most max_templates templates are
+    kept, the least recently used one being closed first.
+    """
+
+    def __repr__(self):
+        return (
+            f"<DocumentPool object :'cnx'={self.cnx!r}, 'max_templates'={self.max_templates!r}, "
+            f"'copies'={self.copies!r}, 'templates'={list(self.ready)!r}>"
+        )
+
+    def __init__(self, cnx, max_templates: int = 8, copies: int = 1, min_uses: int = 2):
+        """
+        :param cnx: the connexion to the soffice process holding the documents
+        :param max_templates: the maximum number of templates with ready copies
+        :param copies: the number of ready copies kept for each template
+        :param min_uses: the number of uses after which a template gets ready copies
+        """
+        self.cnx = cnx
+        self.max_templates = max_templates
+        self.copies = copies
+        self.min_uses = min_uses
+        self.ready = OrderedDict()
+        self.uses = Counter()
+        self.loading = set()
+        self.lock = threading.Lock()
+
+    def load(self, file_path: str) -> tuple:
+        """
+        Loads a new copy of the template, the same way Template does
+
+        :param file_path: the path of the template
+        :return: a tuple (document, temporary file of the document, empty if loaded from memory)
+        """
+        tmp_file = Template.copy_file(file_path)
+        try:
+            url, properties = Template.load_arguments(self.cnx, file_path, tmp_file)
+            doc = self.cnx.desktop.loadComponentFromURL(url, "_blank", 0, properties)
+            # the creation date tells clean_old_open_document when the copy has been loaded
+            doc.getDocumentProperties().resetUserData('')
+            return doc, tmp_file
+        except Exception:
+            self.discard((None, tmp_file))
+            raise
+
+    @staticmethod
+    def discard(copy: tuple) -> None:
+        """
+        Closes a copy and deletes its temporary files
+
+        :param copy: the tuple (document, temporary file of the document)
+        :return: None
+        """
+        doc, tmp_file = copy
+        try:
+            if doc:
+                doc.close(True)
+        except Exception:
+            pass
+        if not tmp_file:
+            return
+        for path in (tmp_file, os.path.dirname(tmp_file) + "/.~lock." + os.path.basename(tmp_file) + "#"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def take(self, key: str) -> Union[tuple, None]:
+        """
+        Takes a ready copy of the template, if any
+
+        :param key: the content hash of the template
+        :return: a tuple (document, temporary file of the document), or None if no copy is ready
+        """
+        with self.lock:
+            self.uses[key] += 1
+            if key not in self.ready:
+                return None
+            self.ready.move_to_end(key)
+            copies = self.ready[key]
+        while True:
+            with self.lock:
+                if not copies:
+                    return None
+                copy = copies.pop()
+            try:
+                # the document may have been closed in the meantime, by /clean_lo for example
+                copy[0].getURL()
+            except Exception:
+                self.discard(copy)
+                continue
+            return copy
+
+    def refill(self, key: str, file_path: str) -> None:
+        """
+        Loads, in the background, the missing copies of the template if it is hot
+
+        :param key: the content hash of the template
+        :param file_path: the path of the template
+        :return: None
+        """
+        with self.lock:
+            if self.uses[key] < self.min_uses or key in self.loading:
+                return
+            self.loading.add(key)
+            self.ready.setdefault(key, [])
+            self.ready.move_to_end(key)
+            evicted = []
+            while len(self.ready) > self.max_templates:
+                evicted_key, copies = self.ready.popitem(last=False)
+                evicted += copies
+        for copy in evicted:
+            self.discard(copy)
+        threading.Thread(target=self.fill, args=(key, file_path), daemon=True).start()
+
+    def fill(self, key: str, file_path: str) -> None:
+        try:
+            while True:
+                with self.lock:
+                    if key not in self.ready or len(self.ready[key]) >= self.copies:
+                        return
+                copy = self.load(file_path)
+                with self.lock:
+                    copies = self.ready.get(key)
+                    if copies is not None:
+                        copies.append(copy)
+                        continue
+                # evicted while loading
+                self.discard(copy)
+                return
+        except Exception:
+            # the template will be loaded the usual way
+            return
+        finally:
+            with self.lock:
+                self.loading.discard(key)
+
+    def close(self) -> None:
+        """
+        Closes all the ready copies
+
+        :return: None
+        """
+        with self.lock:
+            copies = [copy for key_copies in self.ready.values() for copy in key_copies]
+            self.ready.clear()
+        for copy in copies:
+            self.discard(copy)
@@ -15,6 +15,7 @@ __all__ = (
     'ExportError',
     'FileNotFoundError',
     'UnoException',
+    'OfficeBusyError',
 )
 
 from typing import Union
@@ -49,3 +50,7 @@ class FileNotFoundError(LotemplateError):
 
 class UnoException(LotemplateError):
     pass
+
+
+class OfficeBusyError(UnoException):
+    pass
@@ -0,0 +1,148 @@
+"""
+Copyright (C) 2023 Probesys
+
+
+The index of the content hashes of the templates
+"""
+
+__all__ = (
+    'HashIndex',
+)
+
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Union
+
+
+class HashIndex:
+    """
+    Remembers the content hash of the files by their stat signature : path, size, modification time and inode.
+    A file is hashed again only when its signature changes.
+
+    The index is kept in memory, and also in a sqlite database if a path is given, so it survives restarts and is
+    shared by all the processes using the same database.
+    """
+
+    def __repr__(self):
+        return f"<HashIndex object :'db_path'={self.db_path!r}>"
+
+    def __init__(self, db_path: str = None):
+        """
+        :param db_path: the path of the sqlite database, or None to keep the index in memory only
+        """
+        self.db_path = db_path
+        self.memory = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        if db_path:
+            with self.connect() as db:
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS files "
+                    "(path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, hash TEXT)"
+                )
+
+    def connect(self) -> Union[sqlite3.Connection, None]:
+        """
+        :return: the database connection of the current thread, a new one after a fork
+        """
+        if not self.db_path:
+            return None
+        if getattr(self.local, 'pid', None) != os.getpid():
+            self.local.pid = os.getpid()
+            self.local.db = sqlite3.connect(self.db_path, timeout=10)
+            self.local.db.execute("PRAGMA journal_mode=WAL")
+        return self.local.db
+
+    @staticmethod
+    def signature(stat: os.stat_result) -> tuple:
+        return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+    @staticmethod
+    def hash_file(path: str) -> str:
+        """
+        :param path: the path of the file
+        :return: the md5 hexdigest of the content of the file
+        """
+        md5 = hashlib.md5()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                md5.update(chunk)
+        return md5.hexdigest()
+
+    def get(self, path: str) -> str:
+        """
+        :param path: the path of the file
+        :return: the hash of the content of the file, computed only if the file changed since the last call
+        """
+        path = os.path.abspath(path)
+        signature = self.signature(os.stat(path))
+        with self.lock:
+            known = self.memory.get(path)
+        if known and known[0] == signature:
+            return known[1]
+        db = self.connect()
+        if db:
+            row = db.execute("SELECT size, mtime_ns, inode, hash FROM files WHERE path = ?", (path,)).fetchone()
+            if row and tuple(row[:3]) == signature:
+                with self.lock:
+                    self.memory[path] = (signature, row[3])
+                return row[3]
+        return self.update(path)
+
+    def update(self, path: str) -> str:
+        """
+        Hashes the file again, after it has been written
+
+        :param path: the path of the file
+        :return: the hash of the content of the file
+        """
+        path = os.path.abspath(path)
+        signature = self.signature(os.stat(path))
+        file_hash = self.hash_file(path)
+        with self.lock:
+            self.memory[path] = (signature, file_hash)
+        db = self.connect()
+        if db:
+            with db:
+                db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)", (path, *signature, file_hash))
+        return file_hash
+
+    def forget(self, path: str) -> None:
+        """
+        Removes a deleted file, or all the files of a deleted directory, from the index
+
+        :param path: the path of the file or of the directory
+        :return: None
+        """
+        path = os.path.abspath(path)
+        with self.lock:
+            for known in [known for known in self.memory if known == path or known.startswith(path + '/')]:
+                del self.memory[known]
+        db = self.connect()
+        if db:
+            with db:
+                db.execute("DELETE FROM files WHERE path = ? OR substr(path, 1, ?) = ?",
+                           (path, len(path) + 1, path + '/'))
+
+    def rename(self, old_path: str, new_path: str) -> None:
+        """
+        Moves the entries of a renamed file or directory, which keeps its content and its stat signature
+
+        :param old_path: the old path of the file or of the directory
+        :param new_path: the new path
+        :return: None
+        """
+        old_path = os.path.abspath(old_path)
+        new_path = os.path.abspath(new_path)
+        with self.lock:
+            for known in [known for known in self.memory if known == old_path or known.startswith(old_path + '/')]:
+                self.memory[new_path + known[len(old_path):]] = self.memory.pop(known)
+        db = self.connect()
+        if db:
+            with db:
+                db.execute("DELETE FROM files WHERE path = ? OR substr(path, 1, ?) = ?",
+                           (new_path, len(new_path) + 1, new_path + '/'))
+                db.execute("UPDATE files SET path = ? || substr(path, ?) WHERE path = ? OR substr(path, 1, ?) = ?",
+                           (new_path, len(old_path) + 1, old_path, len(old_path) + 1, old_path + '/'))
@@ -8,6 +8,7 @@ The classes used for document connexion and manipulation
 __all__ = (
     'TemplateFromExt',
     'start_multi_office',
+    'wait_offices_ready',
     'randomConnexion',
 )
 
@@ -15,7 +16,9 @@ import os
 from .WriterTemplate import WriterTemplate
 from .CalcTemplate import CalcTemplate 
 from .connexion import Connexion,start_office 
+from . import errors
 import random
+import threading
 from datetime import datetime
 
 def TemplateFromExt(file_path: str, cnx, should_scan: bool,json_cache_dir=None):
@@ -33,13 +36,15 @@ def randomConnexion(lstOffice):
        host,port,lodir = random.choice(lstOffice)
        return Connexion(host,port)
 
-def start_multi_office(host:str="localhost",start_port:int=2000,nb_env:int=1):
+def start_multi_office(host:str="localhost",start_port:int=2000,nb_env:int=1,wait_ready:bool=True,timeout:float=60):
     """
-    start a nb_env of process LibreOffice
+    start a nb_env of process LibreOffice, all at once
 
     :param host:  define host in the UNO connect-string --accept
     :param port:   define port in the UNO connect-string --accept
     :param nb_env: number of process to launch
+    :param wait_ready: wait until every process accepts connexions before returning
+    :param timeout: the maximum time in seconds to wait for each process
     :return: list of (host,port,lo dir)
     """
     if nb_env <= 0:
@@ -49,8 +54,78 @@ def start_multi_office(host:str="localhost",start_port:int=2000,nb_env:int=1):
     for i in range(nb_env):
         soffices.append(start_office(host,str(port)))
         port=port+1
+    if wait_ready:
+        wait_offices_ready(soffices, timeout)
     return soffices
 
+def wait_offices_ready(offices, timeout:float=60, on_ready=None, wait_all:bool=True) -> dict:
+    """
+    wait, in parallel, for the soffice processes to accept connexions, and report how long each one took
+
+    :param offices: the processes returned by start_multi_office
+    :param timeout: the maximum time in seconds to wait for each process
+    :param on_ready: a function called with each process as soon as it is ready
+    :param wait_all: wait for all the processes, or return as soon as the first one is ready and let the
+    others come up in the background
+    :return: the time in seconds each ready process took, by port
+    """
+    timings={}
+    remaining=len(offices)
+    lock=threading.Lock()
+    first_ready=threading.Event()
+
+    def wait_one(office):
+        nonlocal remaining
+        try:
+            duration=office.wait_ready(timeout)
+        except errors.UnoException:
+            # a process stuck at startup is stopped, so it is seen as crashed and restarted by the supervisor
+            print(f"##### {office} not ready after {timeout}s #####")
+            office.stop()
+            duration=None
+        else:
+            print(f"##### {office} ready in {duration:.2f}s #####")
+            office.ready_in=duration
+            if on_ready:
+                on_ready(office)
+        with lock:
+            remaining-=1
+            if duration is not None:
+                timings[office.port]=duration
+            if duration is not None or not remaining:
+                first_ready.set()
+
+    threads=[threading.Thread(target=wait_one, args=(office,), daemon=True) for office in offices]
+    for thread in threads:
+        thread.start()
+    if wait_all:
+        for thread in threads:
+            thread.join()
+    else:
+        first_ready.wait()
+    with lock:
+        return dict(timings)
+
+def get_document_age(doc) -> float:
+    """
+    Gives the time since a document has been opened: the modification time of its temporary copy, or, for a
+    document loaded from memory, its creation date, reset when the template is opened.
+    :doc: the opened document
+    :return: the age of the document in seconds
+    :raises FileNotFoundError: if the temporary copy of the document doesn't exist anymore
+    """
+    url = doc.getURL()
+    if url:
+        opened = datetime.fromtimestamp(os.path.getmtime(url[7:]))
+    else:
+        date = doc.getDocumentProperties().CreationDate
+        try:
+            opened = datetime(date.Year, date.Month, date.Day, date.Hours, date.Minutes, date.Seconds)
+        except ValueError:
+            # no creation date, the document has not been opened by lotemplate
+            return 0
+    return (datetime.now() - opened).total_seconds()
+
 def clean_old_open_document(lstOffice, max_time):
     """
     clean open document open for too long and where a sure are not use anymore
@@ -69,12 +144,12 @@ def clean_old_open_document(lstOffice, max_time):
             url=doc.getURL()
             file=url[7:]
             try:
-                delta=(datetime.now() -
-                       datetime.fromtimestamp(os.path.getmtime(file))).seconds
+                delta=get_document_age(doc)
                 if delta > int(max_time):
                     counter += 1
                     doc.close(True)
-                    os.remove(file)
+                    if file:
+                        os.remove(file)
             except FileNotFoundError:
                 counter += 1
                 doc.close(True) 
@@ -89,10 +164,10 @@ def statistic_open_document(lstOffice, max_time,):
         for doc  in list(cnx.desktop.getComponents()):
             #print(doc)
             url=doc.getURL()
-            file=url[7:]
+            # documents loaded from memory have no file, they are named after their title
+            file=url[7:] or doc.getDocumentProperties().Title
             try:
-                delta=(datetime.now() -
-                       datetime.fromtimestamp(os.path.getmtime(file))).seconds
+                delta=get_document_age(doc)
                 if delta > int(max_time):
                     baddoc["tooold"].append(file)
             except FileNotFoundError:
@@ -100,4 +175,3 @@ def statistic_open_document(lstOffice, max_time,):
             cnxdict["baddoc"]=baddoc
         mylist.append(cnxdict)
     return mylist
-
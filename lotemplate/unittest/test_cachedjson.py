@@ -6,6 +6,9 @@ import unittest
 import lotemplate as ot
 import filecmp
 import os
+import shutil
+import tempfile
+from unittest import mock
 
 cnx = ot.start_multi_office()
 
@@ -20,3 +23,56 @@ class Test_calc(unittest.TestCase):
         self.assertTrue(filecmp.cmp(cachejson,"lotemplate/unittest/files/content/e89fbedb61af3994184da3e5340bd9e9-calc_variables.ods.expected.json", shallow=False))
 
 
+class Test_layout_cache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_cached_layout(self):
+        path = "lotemplate/unittest/files/content/table.odt"
+        with ot.TemplateFromExt(path, None, True, json_cache_dir=self.dir) as temp:
+            self.assertEqual(temp.tables_layout, {'tab': ['&var1', '&var2']})
+        self.assertTrue(os.path.isfile(ot.utils.get_cached_layout(self.dir, path)))
+        # the layout is read from the cache with the variables, the template isn't scanned again
+        with mock.patch.object(ot.WriterTemplate, 'scan') as scan, \
+                ot.TemplateFromExt(path, None, True, json_cache_dir=self.dir) as temp:
+            self.assertEqual(temp.tables_layout, {'tab': ['&var1', '&var2']})
+        scan.assert_not_called()
+
+
+class Test_hash_index(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        os.mkdir(self.dir + '/templates')
+        self.template = self.dir + '/templates/calc_variables.ods'
+        shutil.copy("lotemplate/unittest/files/templates/calc_variables.ods", self.template)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_hash(self):
+        index = ot.HashIndex(self.dir + '/hashes.sqlite')
+        self.assertEqual(index.get(self.template), 'e89fbedb61af3994184da3e5340bd9e9')
+        # a new index finds the hash in the database
+        self.assertEqual(ot.HashIndex(self.dir + '/hashes.sqlite').get(self.template), 'e89fbedb61af3994184da3e5340bd9e9')
+
+    def test_changed_file(self):
+        index = ot.HashIndex(self.dir + '/hashes.sqlite')
+        index.get(self.template)
+        with open(self.template, 'ab') as f:
+            f.write(b'changed')
+        self.assertNotEqual(index.get(self.template), 'e89fbedb61af3994184da3e5340bd9e9')
+
+    def test_rename_and_forget(self):
+        index = ot.HashIndex(self.dir + '/hashes.sqlite')
+        index.get(self.template)
+        os.rename(self.dir + '/templates', self.dir + '/renamed')
+        index.rename(self.dir + '/templates', self.dir + '/renamed')
+        self.assertIn(os.path.abspath(self.dir + '/renamed/calc_variables.ods'), index.memory)
+        index.forget(self.dir + '/renamed')
+        self.assertEqual(index.memory, {})
+        self.assertEqual(index.connect().execute("SELECT COUNT(*) FROM files").fetchone()[0], 0)
@@ -5,7 +5,7 @@ Copyright (C) 2023 Probesys
 import unittest
 import lotemplate as ot
 
-from test_function import compare_files 
+from test_function import compare_files, file_to_dict
 
 
 cnx=ot.start_multi_office()
@@ -69,3 +69,22 @@ class Text(unittest.TestCase):
 
     def test_debug(self):
         self.assertTrue(compare_files('debug',cnx=cnx))
+
+    def test_merge(self):
+        variables = file_to_dict('lotemplate/unittest/files/content/text_vars.json')
+        upper_variables = {key: {'type': 'text', 'value': value['value'].upper()} for key, value in variables.items()}
+        # a value holding a statement of the template isn't filled by the fill of the next instance
+        statement_variables = dict(variables, jean={'type': 'text', 'value': '$jean'})
+        title_variables = {key: {'type': 'text', 'value': value['value'].title()} for key, value in variables.items()}
+        temp = ot.TemplateFromExt('lotemplate/unittest/files/content/text_vars.odt', ot.randomConnexion(cnx), True)
+        temp.merge([variables, upper_variables, statement_variables, title_variables])
+        text = temp.doc.getText().getString()
+        temp.close()
+        self.assertEqual(text.count('azerthaeth zethetrh'), 1)
+        self.assertEqual(text.count('AZERTHAETH ZETHETRH'), 1)
+        self.assertEqual(text.count('azerthaeth $jean'), 1)
+        self.assertEqual(text.count('Azerthaeth Zethetrh'), 1)
+        self.assertNotIn('Zethetrh', text[:text.index('Azerthaeth')])
+        self.assertLess(text.index('azerthaeth zethetrh'), text.index('AZERTHAETH'))
+        self.assertLess(text.index('AZERTHAETH'), text.index('azerthaeth $jean'))
+        self.assertLess(text.index('azerthaeth $jean'), text.index('Azerthaeth'))
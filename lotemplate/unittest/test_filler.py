@@ -0,0 +1,95 @@
+"""
+Copyright (C) 2023 Probesys
+"""
+
+import glob
+import io
+import os
+import re
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+import lotemplate as ot
+
+from test_function import file_to_dict
+
+
+cnx=ot.start_multi_office()
+
+def filled_template(paragraphs: str, variables: dict) -> tuple[list[str], bytes]:
+    """
+    fills a copy of text_vars.odt holding the given paragraphs without soffice
+
+    :return: the paragraphs of the filled document, and its content.xml
+    """
+    with zipfile.ZipFile('lotemplate/unittest/files/content/text_vars.odt') as archive:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as template:
+            for info in archive.infolist():
+                content = archive.read(info)
+                if info.filename == 'content.xml':
+                    content = re.sub(rb'<text:p .*</text:p>', paragraphs.encode(), content)
+                template.writestr(info, content)
+    filled = ot.WriterFiller.fill(buffer.getvalue(), variables)
+    with tempfile.NamedTemporaryFile(suffix='.odt') as f:
+        f.write(filled)
+        f.flush()
+        body = ot.WriterScanner.read(f.name).body
+    with zipfile.ZipFile(io.BytesIO(filled)) as archive:
+        return body, archive.read('content.xml')
+
+
+class WriterFiller(unittest.TestCase):
+
+    def test_same_fill(self):
+        for path in sorted(glob.glob("lotemplate/unittest/files/content/*.odt")):
+            if not os.path.isfile(path[:-4] + '.json') or not os.path.isfile(path[:-4] + '.expected.txt'):
+                continue
+            with self.subTest(path=path):
+                with mock.patch.object(ot.WriterFiller, 'supports', return_value=False), \
+                        ot.TemplateFromExt(path, ot.randomConnexion(cnx), True) as temp:
+                    variables = file_to_dict(path[:-4] + '.json')
+                    temp.fill(variables)
+                    expected = temp.export_stream('filled.txt')
+                with ot.TemplateFromExt(path, ot.randomConnexion(cnx), True) as temp:
+                    temp.fill(variables)
+                    self.assertEqual(temp.export_stream('filled.txt'), expected)
+
+    def test_split_variable(self):
+        body, content = filled_template(
+            '<text:p text:style-name="P1">$je<text:span text:style-name="T5">an</text:span> end</text:p>',
+            {'jean': {'type': 'text', 'value': 'a  b'}}
+        )
+        self.assertEqual(body, ['a  b end'])
+
+    def test_split_for(self):
+        body, content = filled_template(
+            '<text:p text:style-name="P1">[for $items]<text:span text:style-name="T5">[foritem </text:span>'
+            'name], [endfor]</text:p><text:p text:style-name="P1">[if $jean == x]<text:span text:style-name="T6">'
+            'displayed</text:span>[endif]</text:p>',
+            {
+                'items': {'type': 'array', 'value': [{'name': 'first'}, {'name': 'second'}]},
+                'jean': {'type': 'text', 'value': 'x'},
+            }
+        )
+        self.assertEqual(body, ['first, second, ', 'displayed'])
+        # each copy keeps the formatting of the text it comes from
+        self.assertEqual(content.count(b'<text:span text:style-name="T5">'), 2)
+        self.assertEqual(content.count(b'<text:span text:style-name="T6">'), 1)
+
+    def test_odt_export_without_office(self):
+        path = 'lotemplate/unittest/files/content/text_vars.odt'
+        variables = file_to_dict('lotemplate/unittest/files/content/text_vars.json')
+        with ot.TemplateFromExt(path, None, True) as temp:
+            self.assertTrue(temp.fill_without_office(variables))
+            self.assertEqual(temp.export_stream('filled.odt'), temp.filled)
+
+    def test_unsupported(self):
+        variables = file_to_dict('lotemplate/unittest/files/content/html.json')
+        with ot.TemplateFromExt('lotemplate/unittest/files/content/html.odt', None, True) as temp:
+            self.assertFalse(temp.fill_without_office(variables))
+
+
+if __name__ == '__main__':
+    unittest.main()
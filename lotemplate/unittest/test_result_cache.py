@@ -0,0 +1,86 @@
+"""
+Copyright (C) 2023 Probesys
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from time import time
+
+from API.cache import ResultCache
+
+
+class Test_result_cache(unittest.TestCase):
+
+    template = "lotemplate/unittest/files/templates/text_vars.odt"
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.image = self.dir + '/image.png'
+        with open(self.image, 'wb') as f:
+            f.write(b'first image')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def request(self, **kwargs) -> dict:
+        return dict({
+            'name': 'document.pdf',
+            'variables': {
+                'jean': {'type': 'text', 'value': 'jean'},
+                'photo': {'type': 'image', 'value': self.image},
+            },
+        }, **kwargs)
+
+    def test_same_key(self):
+        cache = ResultCache(self.dir + '/cache')
+        self.assertEqual(cache.key(self.template, self.request()), cache.key(self.template, self.request()))
+        # the order of the variables doesn't matter
+        reversed_request = self.request()
+        reversed_request['variables'] = dict(reversed(list(reversed_request['variables'].items())))
+        self.assertEqual(cache.key(self.template, self.request()), cache.key(self.template, reversed_request))
+
+    def test_different_key(self):
+        cache = ResultCache(self.dir + '/cache')
+        key = cache.key(self.template, self.request())
+        self.assertNotEqual(key, cache.key(self.template, self.request(watermark={'Watermark': 'draft'})))
+        self.assertNotEqual(key, cache.key(self.template, self.request(formats=['pdf', 'odt'])))
+        with open(self.image, 'wb') as f:
+            f.write(b'second image, of an other size')
+        self.assertNotEqual(key, cache.key(self.template, self.request()))
+
+    def test_unreadable_image(self):
+        cache = ResultCache(self.dir + '/cache')
+        os.remove(self.image)
+        self.assertIsNone(cache.key(self.template, self.request()))
+
+    def test_ttl(self):
+        cache = ResultCache(self.dir + '/cache', ttl=60)
+        cache.put('key', b'document')
+        self.assertEqual(cache.get('key'), b'document')
+        os.utime(self.dir + '/cache/key', (time() - 120, time() - 120))
+        self.assertIsNone(cache.get('key'))
+        self.assertFalse(os.path.exists(self.dir + '/cache/key'))
+
+    def test_lru(self):
+        cache = ResultCache(self.dir + '/cache', max_size=10)
+        cache.put('first', b'1234')
+        cache.put('second', b'1234')
+        os.utime(self.dir + '/cache/first', (time() - 100, time()))
+        os.utime(self.dir + '/cache/second', (time() - 50, time()))
+        # the access refreshes the first document, so the second one is the least recently used
+        cache.get('first')
+        cache.put('third', b'1234')
+        self.assertEqual(cache.get('first'), b'1234')
+        self.assertIsNone(cache.get('second'))
+        self.assertEqual(cache.get('third'), b'1234')
+
+    def test_too_big(self):
+        cache = ResultCache(self.dir + '/cache', max_size=10)
+        cache.put('key', b'12345678901')
+        self.assertIsNone(cache.get('key'))
+
+
+if __name__ == '__main__':
+    unittest.main()
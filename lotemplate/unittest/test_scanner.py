@@ -0,0 +1,190 @@
+"""
+Copyright (C) 2023 Probesys
+"""
+
+import glob
+import unittest
+from unittest import mock
+import lotemplate as ot
+from lotemplate.Statement.IfStatement import IfStatement
+
+
+
+cnx=ot.start_multi_office()
+
+def scan_with_office(scanner, path: str):
+    # the template is scanned at its initialisation
+    try:
+        with mock.patch.object(scanner, 'supports', return_value=False), \
+                ot.TemplateFromExt(path, ot.randomConnexion(cnx), False) as doc:
+            return doc.variables
+    except ot.errors.TemplateError as e:
+        return e.code, e.infos
+
+
+def scan_without_office(scanner, path: str):
+    try:
+        return scanner.scan_file(path)
+    except ot.errors.TemplateError as e:
+        return e.code, e.infos
+
+
+def template_paths(scanner) -> list[str]:
+    return [
+        path for path in sorted(
+            glob.glob("lotemplate/unittest/files/templates/*") + glob.glob("lotemplate/unittest/files/content/*")
+        ) if scanner.supports(path)
+    ]
+
+
+class WriterScanner(unittest.TestCase):
+
+    def test_expected_scan(self):
+        for path, expected in (
+                ("lotemplate/unittest/files/templates/text_vars.odt", {
+                    "gjerg": {"type": "text", "value": ""},
+                    "jean": {"type": "text", "value": ""},
+                    "aerhh": {"type": "text", "value": ""},
+                    "rh": {"type": "text", "value": ""},
+                    "aet": {"type": "text", "value": ""},
+                    "h": {"type": "text", "value": ""}
+                }),
+                ("lotemplate/unittest/files/templates/text_var_in_header.odt", {"my_var": {"type": "text", "value": ""}}),
+                ("lotemplate/unittest/files/templates/static_tab.odt", {
+                    "var1": {"type": "text", "value": ""},
+                    "var2": {"type": "text", "value": ""}
+                }),
+                ("lotemplate/unittest/files/templates/function_variable_tab.odt", {
+                    "test2": {"type": "text", "value": ""},
+                    "test(&jean)": {"type": "table", "value": [""]},
+                    "test": {"type": "table", "value": [""]}
+                }),
+                ("lotemplate/unittest/files/templates/two_tabs_varied.odt", {
+                    "var1": {"type": "table", "value": [""]},
+                    "1": {"type": "table", "value": [""]},
+                    "2": {"type": "table", "value": [""]},
+                    "3": {"type": "table", "value": [""]},
+                    "4": {"type": "table", "value": [""]},
+                    "5": {"type": "table", "value": [""]}
+                }),
+                ("lotemplate/unittest/files/templates/format.ott", {
+                    "Nom": {"type": "text", "value": ""},
+                    "prenon": {"type": "text", "value": ""},
+                    "signature": {"type": "text", "value": ""},
+                    "cell1": {"type": "table", "value": [""]},
+                    "cell2": {"type": "table", "value": [""]},
+                    "photo": {"type": "image", "value": ""}
+                }),
+                ("lotemplate/unittest/files/templates/format.docx", {
+                    "Nom": {"type": "text", "value": ""},
+                    "prenon": {"type": "text", "value": ""},
+                    "cell1": {"type": "text", "value": ""},
+                    "cell2": {"type": "text", "value": ""},
+                    "signature": {"type": "text", "value": ""},
+                    "photo": {"type": "image", "value": ""}
+                }),
+                ("lotemplate/unittest/files/content/image_docx.docx", {
+                    "Test": {"type": "text", "value": ""},
+                    "var1": {"type": "image", "value": ""},
+                    "var2": {"type": "image", "value": ""}
+                }),
+                ("lotemplate/unittest/files/content/for_inside_if.odt", {
+                    "tata": {"type": "text", "value": ""},
+                    "tutu": {"type": "array", "value": []}
+                }),
+                ("lotemplate/unittest/files/content/html.odt", {
+                    "html_content": {"type": "text", "value": ""},
+                    "tutu": {"type": "array", "value": []}
+                }),
+                ("lotemplate/unittest/files/content/counter.odt", {"solutions": {"type": "array", "value": []}}),
+                ("lotemplate/unittest/files/templates/duplicated_variables.odt", (
+                    "duplicated_variable", {"first_type": "text", "second_type": "image", "variable": "prenon"}
+                )),
+                ("lotemplate/unittest/files/templates/for_missing_endfor.odt", (
+                    "no_endfor_found", {"for_string": "[for $tata]"}
+                )),
+                ("lotemplate/unittest/files/templates/for_syntax_error.odt", (
+                    "syntax_error_in_for_statement", {"for_string": "[for $tutu toto]"}
+                )),
+                ("lotemplate/unittest/files/templates/html_without_endhtml.odt", (
+                    "no_endhtml_found", {"String": "[html]"}
+                )),
+                ("lotemplate/unittest/files/templates/if_syntax_error.odt", (
+                    "syntax_error_in_if_statement", {"c_string": {"String": "[if crapouille == gloubi]"}}
+                )),
+                ("lotemplate/unittest/files/templates/if_too_many_endif.odt", ("too_many_endif_found", {})),
+                ("lotemplate/unittest/files/templates/invalid_if_statement.odt", (
+                    "no_endif_found", {"String": "[if $tutu == oui]"}
+                )),
+                ("lotemplate/unittest/files/templates/invalid_var_tab.odt", (
+                    "variable_not_in_last_row",
+                    {"table": "tab", "actual_row": 1, "expected_row": 2, "variable": "&var2"}
+                )),
+        ):
+            with self.subTest(path=path):
+                self.assertEqual(scan_without_office(ot.WriterScanner, path), expected)
+
+    def test_same_scan(self):
+        for path in template_paths(ot.WriterScanner):
+            with self.subTest(path=path):
+                self.assertEqual(scan_with_office(ot.WriterScanner, path), scan_without_office(ot.WriterScanner, path))
+
+    def test_if_nesting(self):
+        IfStatement.scan_if(['[if $a == 1] [if $b IS_EMPTY]', 'text [endif]', '[endif] [if $c != 2][endif]'])
+        for paragraphs, code in (
+                (['[if $a == 1]', '[endif] [endif]'], 'too_many_endif_found'),
+                (['[endif] [if $a == 1]'], 'no_endif_found'),
+                (['[if $a == [endif]]'], 'no_endif_found'),
+                (['[if $a == 1] [if a] [endif]', '[endif]'], 'syntax_error_in_if_statement'),
+        ):
+            with self.subTest(paragraphs=paragraphs):
+                with self.assertRaises(ot.errors.TemplateError) as context:
+                    IfStatement.scan_if(paragraphs)
+                self.assertEqual(context.exception.code, code)
+
+    def test_tables_layout(self):
+        content = ot.WriterScanner.read("lotemplate/unittest/files/content/table.odt")
+        self.assertEqual(ot.WriterScanner.tables_layout(content), {'tab': ['&var1', '&var2']})
+
+    def test_unsupported(self):
+        self.assertFalse(ot.WriterScanner.supports("lotemplate/unittest/files/templates/format.rtf"))
+        self.assertFalse(ot.WriterScanner.supports("lotemplate/unittest/files/templates/calc_variables.ods"))
+
+
+class CalcScanner(unittest.TestCase):
+
+    def test_expected_scan(self):
+        for path, expected in (
+                ("lotemplate/unittest/files/templates/calc_variables.ods", {
+                    "TOTO": {"type": "text", "value": ""},
+                    "second": {"type": "text", "value": ""},
+                    "titi": {"type": "text", "value": ""},
+                    "toto": {"type": "text", "value": ""},
+                    "myvar": {"type": "text", "value": ""},
+                    "foobar": {"type": "text", "value": ""}
+                }),
+                ("lotemplate/unittest/files/content/image_xlsx.xlsx", {
+                    "toto": {"type": "text", "value": ""},
+                    "image1": {"type": "image", "value": ""}
+                }),
+                ("lotemplate/unittest/files/content/calc_formula.ods", {"C1": {"type": "text", "value": ""}}),
+        ):
+            with self.subTest(path=path):
+                self.assertEqual(list(scan_without_office(ot.CalcScanner, path).items()), list(expected.items()))
+
+    def test_same_scan(self):
+        for path in template_paths(ot.CalcScanner):
+            with self.subTest(path=path):
+                # the order of the variables is kept in the cached json
+                self.assertEqual(
+                    list(scan_with_office(ot.CalcScanner, path).items()),
+                    list(scan_without_office(ot.CalcScanner, path).items())
+                )
+
+    def test_unsupported(self):
+        self.assertFalse(ot.CalcScanner.supports("lotemplate/unittest/files/content/calc_formula1.xls"))
+        self.assertFalse(ot.CalcScanner.supports("lotemplate/unittest/files/templates/format.docx"))
+
+
+if __name__ == '__main__':
+    unittest.main()
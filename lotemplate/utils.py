@@ -9,7 +9,11 @@ __all__ = (
     'convert_to_datas_template',
     'is_network_based',
     'get_file_url',
-    'get_cached_json'
+    'get_cached_json',
+    'get_cached_layout',
+    'get_file_hash',
+    'get_hash_index',
+    'set_hash_index',
 )
 
 import functools
@@ -21,15 +25,47 @@ from typing import Union
 from sorcery import dict_of
 from copy import deepcopy
 
-import hashlib
 from . import errors
+from .hashindex import HashIndex
 
 
+hash_index = HashIndex()
+
+def get_hash_index() -> HashIndex:
+    """
+    returns the index of the content hashes used by get_file_hash
+    """
+    return hash_index
+
+def set_hash_index(index: HashIndex) -> None:
+    """
+    replaces the index of the content hashes used by get_file_hash, for example by a persistent one
+
+    :param index: the new index
+    """
+    global hash_index
+    hash_index = index
+
+def get_file_hash(filepath:str) -> str:
+    """
+    returns the hash of the content of the file. The file is read only if it changed since the last call
+
+    :param filepath: the path of the file
+    :return: the md5 hexdigest of the file
+    """
+    return hash_index.get(filepath)
 
 def get_cached_json(json_cache_dir:str, filepath:str):
     filename = filepath.split("/")[-1]  
-    with open(filepath,'rb') as office:
-        return json_cache_dir+"/"+(hashlib.md5(office.read()).hexdigest())+'-'+filename+".json"
+    return json_cache_dir+"/"+get_file_hash(filepath)+'-'+filename+".json"
+
+def get_cached_layout(json_cache_dir:str, filepath:str):
+    """
+    :param json_cache_dir: the directory of the scan cache
+    :param filepath: the path of the template
+    :return: the path of the layout of the tables of the template, cached aside its variables
+    """
+    return get_cached_json(json_cache_dir, filepath)[:-len(".json")] + ".layout.json"
 
 def convert_to_datas_template(json) -> dict[dict[str: Union[str, list]]]:
     """